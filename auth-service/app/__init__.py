@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flasgger import Swagger
 from flask_cors import CORS
@@ -13,6 +13,17 @@ def create_app():
     db.init_app(app)
     Swagger(app)
 
+    # bcrypt в отдельном пуле процессов, чтобы волна входов не занимала потоки Flask
+    from app.utils.hashing import init_password_hasher, HashingBusy
+    init_password_hasher(app)
+
+    @app.errorhandler(HashingBusy)
+    def handle_hashing_busy(err):
+        resp = jsonify({"error": "Server is busy, please retry"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(err.retry_after)
+        return resp
+
     # ✅ Подключаем только роуты аутентификации и админки
     from app.routes.auth_routes import auth_bp
     app.register_blueprint(auth_bp)
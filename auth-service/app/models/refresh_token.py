@@ -0,0 +1,17 @@
+from app import db
+from datetime import datetime
+
+
+class RefreshToken(db.Model):
+    """Refresh-токен (хранится только SHA-256). Токены одной цепочки ротации
+    делят family_id: повторное предъявление уже обменянного токена отзывает всю цепочку."""
+    __tablename__ = "refresh_tokens"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    family_id = db.Column(db.String(36), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    used_at = db.Column(db.DateTime, nullable=True)      # обменян на новый (ротация)
+    revoked_at = db.Column(db.DateTime, nullable=True)   # отозван (выход или повторное использование)
@@ -208,9 +208,14 @@ def admin_delete_user(current_user_id, u_id):
   db.session.commit()
   return jsonify({'message': 'User deleted'})
 from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import or_, literal_column
 from app import db
 from app.models.user import User
-from app.utils.auth import hash_password, verify_password, generate_access_token, token_required
+from app.utils.auth import (hash_password, verify_password, generate_access_token, token_required,
+                            public_jwks, admin_emails, user_is_admin, upgrade_password_hash,
+                            issue_refresh_token, rotate_refresh_token, revoke_refresh_token, RefreshError)
+from app.utils.hashing import get_password_hasher
+from app.utils.bulk_import import import_users, ImportRejected
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -267,8 +272,7 @@ def register():
     )
 
     # назначаем админа если email в списке ADMIN_EMAILS
-    admin_emails = {e.strip().lower() for e in current_app.config.get('ADMIN_EMAILS','').split(',') if e.strip()}
-    if (email or '').lower() in admin_emails:
+    if (email or '').lower() in admin_emails():
       new_user.is_admin = True
 
     db.session.add(new_user)
@@ -316,8 +320,85 @@ def login():
     if not user or not verify_password(password, user.password_hash):
         return jsonify({"error": "Invalid credentials"}), 401
 
-    token = generate_access_token(user.id)
-    return jsonify({"access_token": token})
+    # стоимость bcrypt изменилась — незаметно обновляем хеш, пока пароль известен
+    if upgrade_password_hash(user, password):
+        db.session.commit()
+
+    token = generate_access_token(user.id, is_admin=user_is_admin(user))
+    refresh_token = issue_refresh_token(user.id)
+    db.session.commit()
+    return jsonify({"access_token": token, "refresh_token": refresh_token})
+
+
+@auth_bp.route("/refresh", methods=["POST"])
+def refresh():
+    """
+    Новый access-токен по refresh-токену (без проверки пароля)
+    ---
+    tags:
+      - Auth
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          required:
+            - refresh_token
+          properties:
+            refresh_token:
+              type: string
+    responses:
+      200:
+        description: Новая пара токенов (старый refresh-токен больше не действует)
+      401:
+        description: Токен неизвестен, истёк, отозван или уже использован
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id, refresh_token = rotate_refresh_token(data.get("refresh_token"))
+    except RefreshError as e:
+        return jsonify({"error": str(e)}), 401
+
+    user = User.query.get(user_id)
+    if not user:
+        db.session.rollback()
+        return jsonify({"error": "Invalid refresh token"}), 401
+    db.session.commit()
+    token = generate_access_token(user.id, is_admin=user_is_admin(user))
+    return jsonify({"access_token": token, "refresh_token": refresh_token})
+
+
+@auth_bp.route("/logout", methods=["POST"])
+def logout():
+    """
+    Выход: отзыв refresh-токена (и всей его цепочки ротации)
+    ---
+    tags:
+      - Auth
+    responses:
+      200:
+        description: Токен отозван
+    """
+    data = request.get_json(silent=True) or {}
+    if revoke_refresh_token(data.get("refresh_token")):
+        db.session.commit()
+    return jsonify({"message": "Logged out"})
+
+
+@auth_bp.route("/.well-known/jwks.json", methods=["GET"])
+def jwks():
+    """
+    Открытые ключи подписи токенов (JWKS) для локальной проверки в других сервисах
+    ---
+    tags:
+      - Auth
+    responses:
+      200:
+        description: Набор ключей (пустой при HS256)
+    """
+    resp = jsonify(public_jwks())
+    resp.headers["Cache-Control"] = "public, max-age=300"
+    return resp
 
 
 @auth_bp.route("/me", methods=["GET"])
@@ -346,7 +427,7 @@ def get_profile(user_id):
         "first_name": user.first_name,
         "last_name": user.last_name,
   "created_at": user.created_at.isoformat(),
-  "is_admin": bool(user.is_admin)
+  "is_admin": user_is_admin(user)
     })
 
 
@@ -469,33 +550,144 @@ def check_is_admin(request_user_id, user_id):
     if not user:
       return jsonify({"is_admin": False, "error": "User not found"}), 404
 
-    # если в БД есть флаг is_admin — используем его
-    if hasattr(user, 'is_admin') and user.is_admin:
-      return jsonify({"is_admin": True})
+    # флаг is_admin в БД или список админов из ADMIN_EMAILS
+    return jsonify({"is_admin": user_is_admin(user)})
+
+
+@auth_bp.route('/admin/metrics', methods=['GET'])
+@token_required
+def admin_metrics(current_user_id):
+  current = User.query.get(current_user_id)
+  if not current or not getattr(current, 'is_admin', False):
+    return jsonify({'error': 'Admin only'}), 403
+  hasher = get_password_hasher()
+  return jsonify({'password_hashing': hasher.metrics() if hasher else None})
+
+
+USER_FIELDS = ('id', 'email', 'first_name', 'last_name', 'created_at', 'is_admin')
 
-    # иначе читаем список админов из переменной окружения ADMIN_EMAILS
-    admin_emails = {e.strip().lower() for e in current_app.config.get("ADMIN_EMAILS", "").split(",") if e.strip()}
-    is_admin = (user.email or "").lower() in admin_emails
 
-    return jsonify({"is_admin": is_admin})
+def _user_row(row, fields):
+  out = {}
+  for f in fields:
+    value = getattr(row, f)
+    if f == 'created_at':
+      value = value.isoformat() if value else None
+    elif f == 'is_admin':
+      value = bool(value)
+    out[f] = value
+  return out
 
 
 @auth_bp.route('/admin/users', methods=['GET'])
 @token_required
 def admin_list_users(current_user_id):
+  """
+  Список пользователей: постранично по id (курсор), с поиском и выбором полей
+  ---
+  tags:
+    - Admin
+  security:
+    - BearerAuth: []
+  parameters:
+    - in: query
+      name: limit
+      type: integer
+      description: размер страницы (по умолчанию 50, не больше 500)
+    - in: query
+      name: cursor
+      type: integer
+      description: next_cursor из предыдущей страницы
+    - in: query
+      name: q
+      type: string
+      description: подстрока email или имени (индексы pg_trgm)
+    - in: query
+      name: fields
+      type: string
+      description: поля через запятую (id, email, first_name, last_name, created_at, is_admin)
+  responses:
+    200:
+      description: "{data: [...], next_cursor: id или null}"
+  """
   # только админы
   current = User.query.get(current_user_id)
   if not current or not getattr(current, 'is_admin', False):
     return jsonify({'error': 'Admin only'}), 403
-  users = User.query.order_by(User.id.asc()).all()
-  return jsonify([{
-    'id': u.id,
-    'email': u.email,
-    'first_name': u.first_name,
-    'last_name': u.last_name,
-    'created_at': u.created_at.isoformat(),
-    'is_admin': bool(getattr(u, 'is_admin', False))
-  } for u in users])
+
+  try:
+    limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+  except ValueError:
+    return jsonify({'error': 'limit and cursor must be integers'}), 400
+  fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or list(USER_FIELDS)
+  unknown = [f for f in fields if f not in USER_FIELDS]
+  if unknown:
+    return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+  if 'id' not in fields:
+    fields.insert(0, 'id')
+
+  q = User.query.with_entities(*[getattr(User, f) for f in fields])
+  search = (request.args.get('q') or '').strip()
+  if search:
+    pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    # выражения совпадают с индексами idx_users_email_trgm / idx_users_name_trgm
+    full_name = User.first_name.op('||')(literal_column("' '")).op('||')(User.last_name)
+    q = q.filter(or_(User.email.ilike(pattern, escape='\\'), full_name.ilike(pattern, escape='\\')))
+  if cursor is not None:
+    q = q.filter(User.id > cursor)
+  rows = q.order_by(User.id.asc()).limit(limit + 1).all()
+
+  next_cursor = rows[limit - 1].id if len(rows) > limit else None
+  return jsonify({'data': [_user_row(r, fields) for r in rows[:limit]], 'next_cursor': next_cursor})
+
+
+@auth_bp.route('/admin/users/import', methods=['POST'])
+@token_required
+def admin_import_users(current_user_id):
+  """
+  Массовый импорт пользователей из CSV или NDJSON
+  ---
+  tags:
+    - Admin
+  security:
+    - BearerAuth: []
+  consumes:
+    - text/csv
+    - application/x-ndjson
+  parameters:
+    - in: query
+      name: format
+      type: string
+      enum: [csv, ndjson]
+      description: по умолчанию определяется по Content-Type
+  responses:
+    200:
+      description: Отчёт об импорте (total, created, failed, errors с номерами строк)
+    400:
+      description: Неверный формат файла
+  """
+  current = User.query.get(current_user_id)
+  if not current or not getattr(current, 'is_admin', False):
+    return jsonify({'error': 'Admin only'}), 403
+  fmt = (request.args.get('format') or '').lower()
+  if not fmt:
+    fmt = 'csv' if 'csv' in (request.content_type or '') else 'ndjson'
+  if fmt not in ('csv', 'ndjson'):
+    return jsonify({'error': 'format must be csv or ndjson'}), 400
+  cfg = current_app.config
+  try:
+    report = import_users(request.stream, fmt,
+                          max_rows=int(cfg.get('IMPORT_MAX_ROWS', 20000)),
+                          batch_size=int(cfg.get('IMPORT_BATCH', 1000)),
+                          workers=int(cfg.get('IMPORT_WORKERS', 0)))
+  except ImportRejected as e:
+    db.session.rollback()
+    return jsonify({'error': str(e)}), 400
+  except UnicodeDecodeError:
+    db.session.rollback()
+    return jsonify({'error': 'File must be UTF-8'}), 400
+  return jsonify(report)
 
 
 @auth_bp.route('/admin/users/<int:u_id>', methods=['GET'])
@@ -1,35 +1,107 @@
+import hashlib
+import json
+import secrets
+import uuid
+
 import bcrypt
 import jwt
 from flask import current_app, request, jsonify
-from functools import wraps
+from functools import wraps, lru_cache
 from datetime import datetime, timedelta
 
+from app import db
+from app.models.refresh_token import RefreshToken
+from app.utils.hashing import get_password_hasher, HashingBusy
+
 
 def hash_password(password):
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    """bcrypt-хеш в пуле процессов (app.utils.hashing); может бросить HashingBusy."""
+    hasher = get_password_hasher()
+    if hasher is None:
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    return hasher.hash(password)
 
 
 def verify_password(password, hashed):
-    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    hasher = get_password_hasher()
+    if hasher is None:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    return hasher.check(password, hashed)
+
+
+def upgrade_password_hash(user, password):
+    """После успешного входа перехешировать пароль, если его стоимость bcrypt ниже текущей.
+    Возвращает True, если хеш обновлён (коммит — за вызывающим)."""
+    hasher = get_password_hasher()
+    if hasher is None or not hasher.needs_rehash(user.password_hash):
+        return False
+    try:
+        user.password_hash = hasher.hash(password)
+    except HashingBusy:
+        return False  # пул занят — обновим при следующем входе
+    hasher.note_rehash()
+    return True
+
+
+def _signing_key():
+    """Ключ подписи: SECRET_KEY для HS256 или закрытый ключ (PEM) для RS256/ES256."""
+    if current_app.config.get("JWT_ALGORITHM", "HS256").startswith("HS"):
+        return current_app.config.get("SECRET_KEY")
+    return current_app.config.get("JWT_PRIVATE_KEY")
+
+
+def _verifying_key():
+    if current_app.config.get("JWT_ALGORITHM", "HS256").startswith("HS"):
+        return current_app.config.get("SECRET_KEY")
+    return current_app.config.get("JWT_PUBLIC_KEY")
 
 
-def generate_access_token(user_id):
+@lru_cache(maxsize=8)
+def _parse_admin_emails(raw):
+    return frozenset(e.strip().lower() for e in (raw or "").split(",") if e.strip())
+
+
+def admin_emails():
+    """Множество ADMIN_EMAILS (разбирается один раз на значение конфига)."""
+    return _parse_admin_emails(current_app.config.get("ADMIN_EMAILS", ""))
+
+
+def user_is_admin(user):
+    """Флаг is_admin в БД или email из ADMIN_EMAILS."""
+    return bool(getattr(user, "is_admin", False)) or (user.email or "").lower() in admin_emails()
+
+
+def generate_access_token(user_id, is_admin=False):
+    # роль в токене: core-service доверяет проверенному claim и не спрашивает /auth/is-admin
     payload = {
         "sub": str(user_id),  # Делаем строкой
+        "role": "admin" if is_admin else "user",
         "exp": datetime.utcnow() + timedelta(minutes=30)
     }
-    secret = current_app.config.get("SECRET_KEY")
-    print(f"[DEBUG] Generating token with SECRET_KEY={secret}")
-    token = jwt.encode(payload, secret, algorithm="HS256")
+    algorithm = current_app.config.get("JWT_ALGORITHM", "HS256")
+    # kid — по нему core-service выбирает открытый ключ из /auth/.well-known/jwks.json
+    headers = {"kid": current_app.config.get("JWT_KEY_ID")} if not algorithm.startswith("HS") else None
+    token = jwt.encode(payload, _signing_key(), algorithm=algorithm, headers=headers)
     if isinstance(token, bytes):
         token = token.decode("utf-8")
     return token
 
 
 def decode_token(token):
-    secret = current_app.config.get("SECRET_KEY")
-    print(f"[DEBUG] Decoding token with SECRET_KEY={secret}")
-    return jwt.decode(token, secret, algorithms=["HS256"])
+    algorithm = current_app.config.get("JWT_ALGORITHM", "HS256")
+    return jwt.decode(token, _verifying_key(), algorithms=[algorithm])
+
+
+def public_jwks():
+    """Открытые ключи для проверки токенов в других сервисах (пусто для HS256)."""
+    algorithm = current_app.config.get("JWT_ALGORITHM", "HS256")
+    if algorithm.startswith("HS") or not current_app.config.get("JWT_PUBLIC_KEY"):
+        return {"keys": []}
+    # RS*/ES* доступны только с пакетом cryptography
+    algo = jwt.algorithms.get_default_algorithms()[algorithm]
+    entry = json.loads(algo.to_jwk(algo.prepare_key(current_app.config["JWT_PUBLIC_KEY"])))
+    entry.update({"kid": current_app.config.get("JWT_KEY_ID"), "alg": algorithm, "use": "sig"})
+    return {"keys": [entry]}
 
 
 def token_required(f):
@@ -52,3 +124,73 @@ def token_required(f):
         return f(user_id, *args, **kwargs)
 
     return decorated
+
+
+class RefreshError(Exception):
+    """Refresh-токен не принят (неизвестен, истёк, отозван или использован повторно)."""
+
+
+def _refresh_hash(token):
+    # токен случайный (256 бит), поэтому достаточно быстрого хеша — bcrypt здесь не нужен
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def issue_refresh_token(user_id, family_id=None):
+    """Создаёт refresh-токен (добавляет строку в сессию; коммит — за вызывающим)."""
+    token = secrets.token_urlsafe(32)
+    days = int(current_app.config.get("REFRESH_TOKEN_DAYS", 30))
+    # при входе и при каждом обмене убираем истёкшие токены пользователя (использованные,
+    # но ещё не истёкшие остаются — по ним распознаётся повторное использование)
+    RefreshToken.query.filter(
+        RefreshToken.user_id == user_id, RefreshToken.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.add(RefreshToken(
+        user_id=user_id,
+        token_hash=_refresh_hash(token),
+        family_id=family_id or str(uuid.uuid4()),
+        expires_at=datetime.utcnow() + timedelta(days=days),
+    ))
+    return token
+
+
+def rotate_refresh_token(token):
+    """Обменивает refresh-токен на новый той же цепочки. Возвращает (user_id, новый токен).
+
+    Строка блокируется (FOR UPDATE), так что два одновременных обмена одного токена
+    выполняются по очереди. Повторное предъявление в течение REFRESH_REUSE_GRACE секунд
+    после обмена (обмен из другой вкладки с тем же токеном, потерянный ответ) получает
+    ещё один токен той же цепочки. Более позднее — признак кражи: вся цепочка
+    отзывается. Коммит — за вызывающим (при RefreshError отзыв цепочки уже закоммичен).
+    """
+    row = (RefreshToken.query
+           .filter_by(token_hash=_refresh_hash(token or ""))
+           .with_for_update()
+           .first())
+    now = datetime.utcnow()
+    if row is None or row.revoked_at is not None or row.expires_at <= now:
+        db.session.rollback()
+        raise RefreshError("Invalid refresh token")
+    if row.used_at is not None:
+        grace = timedelta(seconds=float(current_app.config.get("REFRESH_REUSE_GRACE", 10)))
+        if now - row.used_at <= grace:
+            return row.user_id, issue_refresh_token(row.user_id, row.family_id)
+        revoke_refresh_family(row.family_id)
+        db.session.commit()
+        raise RefreshError("Refresh token reuse detected")
+    row.used_at = now
+    return row.user_id, issue_refresh_token(row.user_id, row.family_id)
+
+
+def revoke_refresh_family(family_id):
+    RefreshToken.query.filter(
+        RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+
+
+def revoke_refresh_token(token):
+    """Выход: отзывает цепочку, к которой относится токен. False — токен неизвестен."""
+    row = RefreshToken.query.filter_by(token_hash=_refresh_hash(token or "")).first()
+    if row is None:
+        return False
+    revoke_refresh_family(row.family_id)
+    return True
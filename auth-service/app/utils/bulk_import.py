@@ -0,0 +1,125 @@
+"""Массовый импорт пользователей (POST /auth/admin/users/import).
+
+Вход — CSV с заголовком или NDJSON (по строке JSON на пользователя) с полями
+email, first_name, last_name, password и необязательным is_admin. Все email
+проверяются одним запросом; дальше по IMPORT_BATCH строк: пароли пачки
+хешируются на всех ядрах (hashing.hash_many), пачка вставляется многострочным
+INSERT и сразу коммитится. Большой файл импортируется долго (bcrypt), и если
+запрос оборвётся по таймауту, уже записанные пачки не пропадут, а повторный
+импорт отметит их как "Email already registered".
+Строки с ошибками пропускаются и попадают в отчёт с номером строки.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import db
+from app.models.user import User
+from app.utils.auth import admin_emails
+from app.utils.hashing import get_password_hasher, hash_many
+
+REQUIRED = ("email", "first_name", "last_name", "password")
+TRUE_VALUES = ("1", "true", "yes", "y")
+
+
+class ImportRejected(ValueError):
+    """Файл целиком не подходит (формат, размер) — 400."""
+
+
+def _rows(stream, fmt):
+    """(номер строки, dict) из потока; номер — строка файла, считая заголовок CSV."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        missing = [f for f in REQUIRED if f not in (reader.fieldnames or [])]
+        if missing:
+            raise ImportRejected(f"CSV header is missing columns: {', '.join(missing)}")
+        for n, row in enumerate(reader, start=2):
+            yield n, row
+    else:
+        for n, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield n, {"_error": f"Invalid JSON: {e}"}
+                continue
+            yield n, row if isinstance(row, dict) else {"_error": "Expected a JSON object"}
+
+
+def import_users(stream, fmt, max_rows, batch_size, workers=0):
+    """Импортирует пользователей из потока. Возвращает отчёт {total, created, failed, errors}."""
+    errors = []
+    candidates = []   # (номер строки, email, first_name, last_name, password, is_admin)
+    seen = set()
+    total = 0
+    admins = admin_emails()
+    for n, row in _rows(stream, fmt):
+        total += 1
+        if total > max_rows:
+            raise ImportRejected(f"Too many rows (limit {max_rows})")
+        if "_error" in row:
+            errors.append({"row": n, "error": row["_error"]})
+            continue
+        values = {f: str(row.get(f) or "").strip() for f in REQUIRED}
+        email = values["email"]
+        missing = [f for f in REQUIRED if not values[f]]
+        if missing:
+            errors.append({"row": n, "email": email or None, "error": f"Missing fields: {', '.join(missing)}"})
+            continue
+        if "@" not in email or len(email) > 120:
+            errors.append({"row": n, "email": email, "error": "Invalid email"})
+            continue
+        if email in seen:
+            errors.append({"row": n, "email": email, "error": "Duplicate email in file"})
+            continue
+        seen.add(email)
+        is_admin = str(row.get("is_admin") or "").strip().lower() in TRUE_VALUES or email.lower() in admins
+        candidates.append((n, email, values["first_name"][:100], values["last_name"][:100],
+                           values["password"], is_admin))
+
+    # один запрос на все email вместо filter_by(email) на каждого пользователя
+    existing = set()
+    if candidates:
+        existing = {e for (e,) in db.session.query(User.email).filter(User.email.in_(seen))}
+    fresh = []
+    for c in candidates:
+        if c[1] in existing:
+            errors.append({"row": c[0], "email": c[1], "error": "Email already registered"})
+        else:
+            fresh.append(c)
+
+    created = 0
+    if fresh:
+        hasher = get_password_hasher()
+        rounds = hasher.rounds if hasher else 12
+        postgres = db.engine.dialect.name == "postgresql"
+        for i in range(0, len(fresh), batch_size):
+            batch = fresh[i:i + batch_size]
+            hashes = hash_many([c[4] for c in batch], rounds, workers)
+            now = datetime.utcnow()
+            chunk = [{"email": c[1], "first_name": c[2], "last_name": c[3], "password_hash": h,
+                      "is_admin": c[5], "created_at": now} for c, h in zip(batch, hashes)]
+            if postgres:
+                # email мог появиться между проверкой и вставкой — такие строки пропускаем
+                stmt = (pg_insert(User.__table__).values(chunk)
+                        .on_conflict_do_nothing(index_elements=["email"])
+                        .returning(User.__table__.c.email))
+                inserted = {e for (e,) in db.session.execute(stmt)}
+            else:
+                db.session.execute(insert(User.__table__).values(chunk))
+                inserted = {r["email"] for r in chunk}
+            db.session.commit()
+            created += len(inserted)
+            for c in batch:
+                if c[1] not in inserted:
+                    errors.append({"row": c[0], "email": c[1], "error": "Email already registered"})
+
+    errors.sort(key=lambda e: e["row"])
+    return {"total": total, "created": created, "failed": len(errors), "errors": errors}
@@ -0,0 +1,202 @@
+"""Хеширование паролей bcrypt в отдельном пуле процессов.
+
+bcrypt занимает ядро на сотни миллисекунд. В потоке Flask волна входов в начале
+занятия забирает весь CPU, и за ней встают все остальные запросы, включая
+/auth/me. Поэтому хеширование и проверка идут в ограниченном пуле процессов
+(BCRYPT_WORKERS). Ожидающих задач не больше BCRYPT_MAX_PENDING: дальше
+запрос ждёт BCRYPT_QUEUE_TIMEOUT секунд и получает 503 (HashingBusy).
+
+Стоимость bcrypt (rounds) задаётся BCRYPT_ROUNDS или, при значении auto,
+подбирается при старте под BCRYPT_TARGET_MS на этой машине (не ниже 12 —
+стоимости bcrypt.gensalt() по умолчанию). Подбор у каждой реплики свой, поэтому
+при нескольких репликах BCRYPT_ROUNDS лучше задать явно. Хеши со стоимостью
+ниже текущей пересчитываются при входе, более дорогие не трогаются.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+MIN_ROUNDS = 12     # стоимость bcrypt.gensalt() по умолчанию: auto не ослабляет хеши
+MAX_ROUNDS = 15
+
+
+class HashingBusy(Exception):
+    """Пул хеширования перегружен — клиенту стоит повторить запрос позже."""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Password hashing pool is busy")
+        self.retry_after = retry_after
+
+
+def _hash(password: bytes, rounds: int) -> str:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_rounds(hashed: str):
+    """Стоимость из хеша вида $2b$12$...; None — не bcrypt."""
+    parts = (hashed or "").split("$")
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def calibrate_rounds(target_ms: float) -> int:
+    """Наименьшая стоимость, при которой хеш занимает не меньше target_ms (медиана 3 замеров)."""
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        samples = []
+        for _ in range(3):
+            started = time.perf_counter()
+            _hash(b"calibration", rounds)
+            samples.append((time.perf_counter() - started) * 1000)
+        if sorted(samples)[1] >= target_ms:
+            return rounds
+    return MAX_ROUNDS
+
+
+class PasswordHasher:
+    def __init__(self, rounds, workers, max_pending, queue_timeout):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._pool = self._new_pool()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"hashed": 0, "checked": 0, "rejected": 0, "rehashed": 0, "pool_restarts": 0}
+        self._wait_ms = 0.0     # ожидание места в очереди
+        self._total_ms = 0.0    # от вызова до результата
+        self._wait_max_ms = 0.0
+
+    def _new_pool(self):
+        # spawn: процесс сервиса многопоточный, fork из него небезопасен
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def _submit(self, fn, *args):
+        """Выполняет задачу в пуле. Если дочерний процесс умер (OOM, сбой), пул
+        сломан навсегда — пересоздаём его и повторяем задачу один раз."""
+        pool = self._pool
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    print("[auth-service] bcrypt pool broken, restarting")
+                    pool.shutdown(wait=False)
+                    self._pool = self._new_pool()
+                    self._stats["pool_restarts"] += 1
+                pool = self._pool
+            return pool.submit(fn, *args).result()
+
+    def _run(self, kind, fn, *args):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise HashingBusy(retry_after=max(1, int(self.queue_timeout)))
+        waited = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._pending += 1
+        try:
+            return self._submit(fn, *args)
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._pending -= 1
+                self._stats[kind] += 1
+                self._wait_ms += waited
+                self._wait_max_ms = max(self._wait_max_ms, waited)
+                self._total_ms += (time.perf_counter() - started) * 1000
+
+    def hash(self, password: str) -> str:
+        return self._run("hashed", _hash, password.encode("utf-8"), self.rounds)
+
+    def check(self, password: str, hashed: str) -> bool:
+        return self._run("checked", _check, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Только повышение стоимости: иначе реплики с разным подбором
+        перехешировали бы пароли туда-обратно при каждом входе."""
+        rounds = hash_rounds(hashed)
+        return rounds is not None and rounds < self.rounds
+
+    def note_rehash(self):
+        with self._lock:
+            self._stats["rehashed"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            pending = self._pending
+            done = stats["hashed"] + stats["checked"]
+            stats.update({
+                "avg_wait_ms": round(self._wait_ms / done, 1) if done else None,
+                "max_wait_ms": round(self._wait_max_ms, 1),
+                "avg_total_ms": round(self._total_ms / done, 1) if done else None,
+            })
+        stats.update({
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": pending,
+            "queued": max(0, pending - self.workers),
+        })
+        return stats
+
+
+_hasher = None
+
+
+def init_password_hasher(app):
+    """Создаёт пул хеширования (BCRYPT_WORKERS = 0 — по числу ядер без одного)."""
+    global _hasher
+    # дочерние процессы пула (spawn) тоже импортируют приложение — им пул не нужен
+    if _hasher is not None or multiprocessing.parent_process() is not None:
+        return _hasher
+    cfg = app.config
+    rounds = str(cfg.get("BCRYPT_ROUNDS", "auto")).strip().lower()
+    if rounds == "auto":
+        rounds = calibrate_rounds(float(cfg.get("BCRYPT_TARGET_MS", 250)))
+        print(f"[auth-service] bcrypt cost calibrated to {rounds} "
+              f"(with several replicas set BCRYPT_ROUNDS={rounds} explicitly)")
+    rounds = min(max(int(rounds), 4), 31)
+    workers = int(cfg.get("BCRYPT_WORKERS") or 0) or max(1, (os.cpu_count() or 2) - 1)
+    max_pending = int(cfg.get("BCRYPT_MAX_PENDING") or 0) or workers * 4
+    _hasher = PasswordHasher(rounds, workers, max_pending, float(cfg.get("BCRYPT_QUEUE_TIMEOUT", 5)))
+    return _hasher
+
+
+def get_password_hasher():
+    return _hasher
+
+
+def _hash_batch(passwords, rounds):
+    return [_hash(p, rounds) for p in passwords]
+
+
+def hash_many(passwords, rounds, workers=0, batch=50):
+    """Хеширует много паролей сразу (массовый импорт) во временном пуле на все ядра.
+
+    Отдельный пул, а не общий: импорт не должен занимать очередь входов, а ОС
+    поделит ядра между ними.
+    """
+    workers = workers or os.cpu_count() or 1
+    encoded = [p.encode("utf-8") for p in passwords]
+    chunks = [encoded[i:i + batch] for i in range(0, len(encoded), batch)]
+    if len(chunks) <= 1 or workers == 1:
+        return [h for chunk in chunks for h in _hash_batch(chunk, rounds)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = pool.map(_hash_batch, chunks, [rounds] * len(chunks))
+        return [h for chunk in results for h in chunk]
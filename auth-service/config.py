@@ -14,3 +14,32 @@ class Config:
     # Общие настройки
     SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
     ADMIN_EMAILS = os.getenv("ADMIN_EMAILS", "admin@example.com")
+
+    # Подпись токенов: HS256 (SECRET_KEY, общий с core-service) или асимметричная
+    # (RS256/ES256: JWT_PRIVATE_KEY/JWT_PUBLIC_KEY в PEM, открытый ключ публикуется
+    # в /auth/.well-known/jwks.json под идентификатором JWT_KEY_ID)
+    JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+    JWT_PRIVATE_KEY = os.getenv("JWT_PRIVATE_KEY", "")
+    JWT_PUBLIC_KEY = os.getenv("JWT_PUBLIC_KEY", "")
+    JWT_KEY_ID = os.getenv("JWT_KEY_ID", "auth-1")
+
+    # bcrypt: стоимость (число или auto — подобрать при старте под BCRYPT_TARGET_MS, не ниже 12;
+    # при нескольких репликах задайте число, чтобы у всех была одна стоимость),
+    # пул процессов (0 — по числу ядер без одного), лимит ожидающих задач (0 — 4 на процесс)
+    # и сколько секунд ждать места в очереди до ответа 503
+    BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS", "auto")
+    BCRYPT_TARGET_MS = int(os.getenv("BCRYPT_TARGET_MS", "250"))
+    BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "0"))
+    BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "0"))
+    BCRYPT_QUEUE_TIMEOUT = float(os.getenv("BCRYPT_QUEUE_TIMEOUT", "5"))
+
+    # Refresh-токены: срок жизни (дней); при каждом обмене выдаётся новый
+    REFRESH_TOKEN_DAYS = int(os.getenv("REFRESH_TOKEN_DAYS", "30"))
+    # секунд после обмена, когда тот же refresh-токен ещё принимается (вкладки, потерянный ответ)
+    REFRESH_REUSE_GRACE = float(os.getenv("REFRESH_REUSE_GRACE", "10"))
+
+    # Массовый импорт пользователей: предел строк в файле, строк в одном INSERT
+    # (и в одном коммите) и процессов для хеширования паролей (0 — все ядра)
+    IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "20000"))
+    IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "1000"))
+    IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "0"))
@@ -1,3 +1,5 @@
+import time
+
 from flask import Flask, request, g, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_pymongo import PyMongo
@@ -16,6 +18,46 @@ def create_app():
     db.init_app(app)
     mongo.init_app(app)
 
+    # Клиенты других сервисов (пул keep-alive соединений, таймауты, предохранитель)
+    from app.utils.service_client import init_service_clients
+    init_service_clients(app)
+
+    # Кеш проверенных токенов (token_required)
+    from app.utils.token_cache import init_token_cache
+    init_token_cache(app)
+
+    # Прогреваем пул mongosh-воркеров для выполнения попыток
+    from app.utils.mongosh_pool import init_pool
+    init_pool(app)
+
+    # Кеш результатов детерминированных попыток
+    from app.utils.result_cache import init_result_cache
+    init_result_cache(app)
+
+    # Контексты проверки заданий (задание, конфиг, тесты) в памяти процесса
+    from app.utils.grading_context import init_grading_context
+    init_grading_context(app)
+
+    # Каталог коллекций для диагностики пустых результатов
+    from app.utils.catalog import init_catalog
+    init_catalog(app)
+
+    # Ограничение числа одновременно выполняемых попыток (глобально и на пользователя)
+    from app.utils.admission import init_admission
+    init_admission(app)
+
+    # Запись попыток в queries (опционально — пачками из буфера)
+    from app.utils.attempt_writer import init_attempt_writer
+    init_attempt_writer(app)
+
+    # Пул для асинхронной проверки попыток (202 + опрос результата)
+    from app.utils.attempt_jobs import init_attempt_jobs
+    init_attempt_jobs(app)
+
+    # Фоновый пересчёт эталонных решений после смены версии данных
+    from app.utils.reference import init_reference_refresher
+    init_reference_refresher(app)
+
     # Swagger для авто-документации
     swagger = Swagger(app)
 
@@ -46,70 +88,35 @@ def create_app():
         supports_credentials=True
     )
 
-    # Request logging: сохраняем информацию о запросах для админской панели
-    from app.models.request_log import RequestLog
-
-    # For request-level logging we prefer to use a separate connection so that
-    # missing tables or SQL errors do not taint the global ORM session.
-    from sqlalchemy import inspect, text
-
-    @app.after_request
-    def log_request(response):
-        try:
-            user_id = None
-            # если token_required кладёт user_id в g или в headers, попробуем взять
-            from flask import g
-            user_id = getattr(g, 'user_id', None)
-        except Exception:
-            user_id = None
-
-        try:
-            payload = None
-            if request.method in ('POST', 'PUT', 'PATCH'):
-                payload = request.get_data(as_text=True)
-        except Exception:
-            payload = None
-
-        try:
-            inspector = inspect(db.engine)
-            if not inspector.has_table('request_logs'):
-                # Skip logging if table not present
-                return response
-
-            params = {
-                'path': request.path,
-                'method': request.method,
-                'status_code': response.status_code,
-                'user_id': user_id,
-                'created_at': None,  # server-side default will apply
-                'payload': payload,
-            }
-            # Insert in its own connection/transaction to avoid affecting ORM session
-            conn = db.engine.connect()
-            trans = conn.begin()
+    # Request logging: сохраняем информацию о запросах для админской панели.
+    # Запись идёт пачками в фоновом потоке (app.utils.request_log), ответ её не ждёт.
+    from app.utils.request_log import init_request_log
+    request_log = init_request_log(app)
+
+    if request_log is not None:
+        @app.before_request
+        def start_request_timer():
+            g.request_started = time.perf_counter()
+
+        @app.after_request
+        def log_request(response):
             try:
-                # Use parameterized insert; created_at uses default if None
-                insert_sql = text(
-                    "INSERT INTO request_logs (path, method, status_code, user_id, created_at, payload) "
-                    "VALUES (:path, :method, :status_code, :user_id, now(), :payload)"
+                started = getattr(g, 'request_started', None)
+                view_args = request.view_args or {}
+                request_log.record(
+                    request.path,
+                    request.method,
+                    response.status_code,
+                    # token_required кладёт user_id в g
+                    getattr(g, 'user_id', None),
+                    request_log.payload_of(request),
+                    route=request.url_rule.rule if request.url_rule else None,
+                    assignment_id=view_args.get('assignment_id'),
+                    latency_ms=int((time.perf_counter() - started) * 1000) if started else None,
                 )
-                conn.execute(insert_sql, **params)
-                trans.commit()
             except Exception as e:
-                try:
-                    trans.rollback()
-                except Exception:
-                    pass
                 print(f"[request_log] failed: {e}")
-            finally:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-        except Exception as e:
-            # In case inspector or connection fails, avoid breaking the response
-            print(f"[request_log] failed: {e}")
-        return response
+            return response
 
     # Return JSON for uncaught exceptions (avoid Werkzeug HTML page leaking)
     from sqlalchemy.exc import SQLAlchemyError
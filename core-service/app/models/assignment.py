@@ -14,6 +14,16 @@ class Assignment(db.Model):
     # новое поле
     schema_json = db.Column(db.JSON)
 
+    # эталонное решение и его предвычисленный результат (app.utils.reference)
+    reference_query = db.Column(db.Text)
+    reference_result = db.Column(db.JSON)
+    reference_hashes = db.Column(db.JSON)
+    reference_digest = db.Column(db.String(100))
+    reference_count = db.Column(db.Integer)
+    reference_version = db.Column(db.String(100))   # версия набора данных, на которой получен результат
+    reference_error = db.Column(db.Text)
+    reference_updated_at = db.Column(db.DateTime)
+
     @property
     def required_method(self):
         try:
@@ -8,4 +8,10 @@ class AssignmentTest(db.Model):
     assignment_id = db.Column(db.Integer, db.ForeignKey("assignments.assignment_id"), nullable=False)
     expected_result = db.Column(db.JSON, nullable=False)  # было Text
     test_description = db.Column(db.Text, nullable=False)
+    # канонические хеши ожидаемых документов и общий дайджест (app.utils.canonical)
+    expected_hashes = db.Column(db.JSON)
+    expected_digest = db.Column(db.String(100))
+    # режим сравнения: ordered / unordered / subset / tolerance (NULL — из schema_json задания или ordered)
+    compare_mode = db.Column(db.String(20))
+    tolerance = db.Column(db.Float)                      # допуск для чисел в режиме tolerance
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,19 @@
+from app import db
+from datetime import datetime
+
+class GradingJob(db.Model):
+    __tablename__ = "grading_jobs"
+
+    job_id = db.Column(db.Integer, primary_key=True)
+    query_id = db.Column(db.Integer, db.ForeignKey("queries.query_id", ondelete="CASCADE"), nullable=False)
+
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued / running / done / dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)          # сколько раз задание забирали
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)          # не раньше (backoff)
+    locked_by = db.Column(db.String(255))                                # воркер, который держит задание
+    locked_until = db.Column(db.DateTime)                                # конец visibility timeout
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
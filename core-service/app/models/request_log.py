@@ -4,11 +4,15 @@ from datetime import datetime
 class RequestLog(db.Model):
     __tablename__ = 'request_logs'
 
-    id = db.Column(db.Integer, primary_key=True)
+    # в Postgres таблица секционирована по дням: первичный ключ (id, created_at)
+    id = db.Column(db.BigInteger, primary_key=True)
     path = db.Column(db.String(512), nullable=False)
     method = db.Column(db.String(10), nullable=False)
+    route = db.Column(db.String(200), nullable=True)          # шаблон маршрута Flask
+    assignment_id = db.Column(db.Integer, nullable=True)      # из параметров маршрута
     status_code = db.Column(db.Integer, nullable=True)
     user_id = db.Column(db.Integer, nullable=True)
+    latency_ms = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     payload = db.Column(db.Text, nullable=True)
 
@@ -17,8 +21,11 @@ class RequestLog(db.Model):
             'id': self.id,
             'path': self.path,
             'method': self.method,
+            'route': self.route,
+            'assignment_id': self.assignment_id,
             'status_code': self.status_code,
             'user_id': self.user_id,
+            'latency_ms': self.latency_ms,
             'created_at': self.created_at.isoformat(),
             'payload': self.payload,
         }
@@ -1,16 +1,28 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, current_app
 from app import db
 from app.models.request_log import RequestLog
 from app.utils.auth import token_required
-from app.utils.admin import require_admin
+from app.utils.admin import require_admin, forget_admin_status, admin_metrics
+from app.utils.mongosh_pool import get_pool
+from app.utils.result_cache import get_result_cache
+from app.utils.attempt_jobs import get_attempt_jobs
+from app.utils.admission import get_admission
+from app.utils.catalog import get_catalog
+from app.utils.grading_context import get_grading_context_cache
+from app.utils.reference import refresh_all, get_reference_refresher
+from app.utils.regrade import start_regrade, get_regrade
+from app.utils.attempt_writer import get_attempt_writer
+from app.utils.request_log import get_request_log, log_stats
+from app.utils.token_cache import get_token_cache
+from app.utils.service_client import get_auth_client, service_metrics
+from app.utils import job_queue
+from app.utils.dataset import bump_dataset_version
+from pymongo.errors import PyMongoError
 import requests
 from sqlalchemy.exc import SQLAlchemyError, NoReferencedTableError, ProgrammingError
 
 ADMIN_BP = Blueprint('admin', __name__, url_prefix='/admin')
 
-AUTH_SERVICE = 'http://auth-service:5001'
-
-
 @ADMIN_BP.route('/logs', methods=['GET'])
 @token_required
 @require_admin
@@ -18,7 +30,17 @@ def list_logs(user_id):
     limit = min(int(request.args.get('limit', 50)), 200)
     offset = max(0, int(request.args.get('offset', 0)))
     try:
-        q = RequestLog.query.order_by(RequestLog.created_at.desc()).offset(offset).limit(limit).all()
+        q = RequestLog.query
+        # фильтры по индексированным колонкам; path — подстрока (без индекса)
+        if request.args.get('route'):
+            q = q.filter(RequestLog.route == request.args['route'])
+        if request.args.get('user_id', '').isdigit():
+            q = q.filter(RequestLog.user_id == int(request.args['user_id']))
+        if request.args.get('status_code', '').isdigit():
+            q = q.filter(RequestLog.status_code == int(request.args['status_code']))
+        if request.args.get('path'):
+            q = q.filter(RequestLog.path.ilike(f"%{request.args['path']}%"))
+        q = q.order_by(RequestLog.created_at.desc()).offset(offset).limit(limit).all()
         return jsonify([r.to_dict() for r in q])
     except (NoReferencedTableError, ProgrammingError) as e:
         # missing table(s) — provide actionable, concise message
@@ -35,6 +57,27 @@ def list_logs(user_id):
         return jsonify({"error": "Database error while listing logs", "details": str(e)}), 500
 
 
+@ADMIN_BP.route('/logs/stats', methods=['GET'])
+@token_required
+@require_admin
+def get_log_stats(user_id):
+    """Per-route request counts and latency from the per-minute rollups (?minutes=60&route=...)."""
+    minutes = min(max(int(request.args.get('minutes', 60)), 1), 7 * 24 * 60)
+    try:
+        return jsonify(log_stats(minutes, route=request.args.get('route') or None))
+    except (NoReferencedTableError, ProgrammingError) as e:
+        print(f"[admin_routes] DB schema issue reading log stats: {e}")
+        db.session.rollback()
+        return jsonify({
+            "routes": [], "series": [],
+            "warning": "Request log rollups are not available: request_log_minutes table missing. See /docker/migrations/add_missing_tables.sql",
+        }), 200
+    except SQLAlchemyError as e:
+        print(f"[admin_routes] SQL error reading log stats: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Database error while reading log stats", "details": str(e)}), 500
+
+
 @ADMIN_BP.route('/logs/<int:log_id>', methods=['GET'])
 @token_required
 @require_admin
@@ -53,15 +96,14 @@ def get_log(user_id, log_id):
 @token_required
 @require_admin
 def get_assignment_request_logs(user_id, assignment_id):
-    """Return RequestLog entries related to a specific assignment (by path containing assignment_id).
+    """Return RequestLog entries related to a specific assignment (by the indexed assignment_id column).
     This helps admins inspect HTTP-level requests for a given assignment (including attempts POSTs).
     """
     limit = min(int(request.args.get('limit', 100)), 1000)
     offset = max(0, int(request.args.get('offset', 0)))
     try:
-        pattern = f"/assignments/{assignment_id}"
         q = (RequestLog.query
-             .filter(RequestLog.path.ilike(f"%{pattern}%"))
+             .filter(RequestLog.assignment_id == assignment_id)
              .order_by(RequestLog.created_at.desc())
              .offset(offset)
              .limit(limit)
@@ -78,29 +120,204 @@ def get_assignment_request_logs(user_id, assignment_id):
         return jsonify({"error": "Database error while fetching logs", "details": str(e)}), 500
 
 
-# Proxy user management to auth-service (CRUD)
-@ADMIN_BP.route('/users', methods=['GET'])
+@ADMIN_BP.route('/metrics', methods=['GET'])
 @token_required
 @require_admin
-def list_users(user_id):
-    headers = {}
+def get_metrics(user_id):
+    """Runtime metrics of the grading path (mongosh pool etc.)."""
+    pool = get_pool()
+    cache = get_result_cache()
+    jobs = get_attempt_jobs()
+    limiter = get_admission()
+    catalog = get_catalog()
+    contexts = get_grading_context_cache()
+    refresher = get_reference_refresher()
+    writer = get_attempt_writer()
+    request_log = get_request_log()
+    token_cache = get_token_cache()
+    grading_queue = None
+    if current_app.config.get('ATTEMPTS_QUEUE') == 'postgres':
+        try:
+            grading_queue = job_queue.queue_stats()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            grading_queue = {'error': str(e)}
+    return jsonify({
+        'mongosh_pool': pool.metrics() if pool else None,
+        'result_cache': cache.metrics() if cache else None,
+        'attempt_jobs': jobs.metrics() if jobs else None,
+        'admission': limiter.metrics() if limiter else None,
+        'catalog': catalog.metrics() if catalog else None,
+        'grading_context': contexts.metrics() if contexts else None,
+        'reference_refresher': refresher.metrics() if refresher else None,
+        'attempt_writer': writer.metrics() if writer else None,
+        'request_log': request_log.metrics() if request_log else None,
+        'token_cache': token_cache.metrics() if token_cache else None,
+        'admin_auth': admin_metrics(),
+        'services': service_metrics(),
+        'grading_queue': grading_queue,
+    })
+
+
+@ADMIN_BP.route('/dataset/reseeded', methods=['POST'])
+@token_required
+@require_admin
+def dataset_reseeded(user_id):
+    """Mark the training dataset as reseeded: bump its version and drop cached results."""
+    try:
+        version = bump_dataset_version()
+    except PyMongoError as e:
+        return jsonify({"error": "Failed to update dataset version", "details": str(e)}), 500
+    cache = get_result_cache()
+    if cache:
+        cache.clear()
+    catalog = get_catalog()
+    if catalog:
+        catalog.invalidate()
+    refresher = get_reference_refresher()
+    if refresher:
+        refresher.trigger(force=True)
+    return jsonify({"message": "Dataset version updated", "dataset_version": version})
+
+
+@ADMIN_BP.route('/references/validate', methods=['POST'])
+@token_required
+@require_admin
+def validate_references(user_id):
+    """Re-run reference solutions of all assignments in parallel.
+
+    ?stale=1 re-runs only those computed on an older dataset version. Each report
+    says whether the result changed and whether it still passes the literal tests.
+    """
+    only_stale = request.args.get('stale') in ('1', 'true')
+    parallelism = current_app.config.get('REFERENCE_PARALLELISM', 4)
+    reports = refresh_all(current_app._get_current_object(), only_stale=only_stale,
+                          parallelism=parallelism)
+    summary = {}
+    for r in reports:
+        summary[r['status']] = summary.get(r['status'], 0) + 1
+    return jsonify({'summary': summary, 'reports': reports})
+
+
+@ADMIN_BP.route('/assignments/<int:assignment_id>/regrade', methods=['POST'])
+@token_required
+@require_admin
+def regrade(user_id, assignment_id):
+    """Re-evaluate stored attempt results of an assignment against its current tests.
+
+    Runs in the background; poll the returned status_url for progress.
+    """
+    job = start_regrade(current_app._get_current_object(), assignment_id)
+    body = job.to_dict()
+    body['status_url'] = f"/admin/regrade/{job.job_id}"
+    return jsonify(body), 202
+
+
+@ADMIN_BP.route('/regrade/<job_id>', methods=['GET'])
+@token_required
+@require_admin
+def regrade_status(user_id, job_id):
+    job = get_regrade(job_id)
+    if job is None:
+        return jsonify({"error": "Regrade job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+# Proxy user management to auth-service (CRUD)
+def _forget_user(u_id):
+    """Права пользователя изменились: сбрасываем закешированные статус админа и токены.
+    Роль в уже выданных токенах меняется только при следующем входе (ADMIN_LIVE_CHECK=1 — сразу)."""
+    forget_admin_status(u_id)
+    token_cache = get_token_cache()
+    if token_cache:
+        token_cache.invalidate_user(u_id)
+
+
+def _forward_headers(headers=None):
+    """Заголовки запроса к auth-service от имени текущего админа."""
+    headers = dict(headers or {})
     auth = request.headers.get('Authorization')
     if auth:
         headers['Authorization'] = auth
-    r = requests.get(f"{AUTH_SERVICE}/auth/admin/users", headers=headers)
-    return jsonify(r.json()), r.status_code
+    return headers
+
+
+def _auth_request(method, path, endpoint, headers=None, **kwargs):
+    """Запрос к admin API auth-service от имени текущего админа (None — сервис недоступен)."""
+    try:
+        return get_auth_client().request(method, path, endpoint=endpoint,
+                                         headers=_forward_headers(headers), **kwargs)
+    except requests.RequestException as e:
+        print(f"[admin_routes] auth-service request failed: {e}")
+        return None
+
+
+def _proxy_users(method, path, endpoint, headers=None, **kwargs):
+    """Запрос к admin API auth-service; тело ответа передаётся как есть, без разбора JSON."""
+    r = _auth_request(method, path, endpoint, headers, **kwargs)
+    if r is None:
+        return None, (jsonify({"error": "Auth service unreachable"}), 503)
+    return r, Response(r.content, status=r.status_code,
+                       content_type=r.headers.get('Content-Type', 'application/json'))
+
+
+def _stream_users(path, endpoint):
+    """GET к admin API auth-service с параметрами текущего запроса; тело ответа
+    передаётся клиенту потоком, без разбора и повторной сериализации JSON."""
+    r = _auth_request('GET', path, endpoint, params=request.args, stream=True)
+    if r is None:
+        return jsonify({"error": "Auth service unreachable"}), 503
+
+    def body():
+        try:
+            yield from r.iter_content(chunk_size=64 * 1024)
+        finally:
+            r.close()
+
+    return Response(body(), status=r.status_code,
+                    content_type=r.headers.get('Content-Type', 'application/json'))
+
+
+@ADMIN_BP.route('/users', methods=['GET'])
+@token_required
+@require_admin
+def list_users(user_id):
+    """Параметры limit, cursor, q и fields передаются в auth-service как есть."""
+    return _stream_users("/auth/admin/users", "/auth/admin/users")
+
+
+@ADMIN_BP.route('/users/import', methods=['POST'])
+@token_required
+@require_admin
+def import_users(user_id):
+    """Bulk user import (CSV or NDJSON); the body is streamed to auth-service as is.
+
+    auth-service commits every IMPORT_BATCH rows, so after a timeout part of the file
+    may already be imported: a retry reports those rows as already registered.
+    """
+    params = {'format': request.args['format']} if request.args.get('format') else None
+    timeout = (current_app.config.get('SERVICE_CONNECT_TIMEOUT', 2),
+               current_app.config.get('USER_IMPORT_TIMEOUT', 1800))
+    headers = _forward_headers({'Content-Type': request.content_type or 'text/csv'})
+    try:
+        r = get_auth_client().request('POST', "/auth/admin/users/import",
+                                      endpoint="/auth/admin/users/import", headers=headers,
+                                      data=request.stream, params=params, timeout=timeout)
+    except requests.Timeout:
+        return jsonify({"error": "Import did not finish within USER_IMPORT_TIMEOUT; auth-service "
+                                 "may still be importing. Check the user list before retrying."}), 504
+    except requests.RequestException as e:
+        print(f"[admin_routes] auth-service request failed: {e}")
+        return jsonify({"error": "Auth service unreachable"}), 503
+    return Response(r.content, status=r.status_code,
+                    content_type=r.headers.get('Content-Type', 'application/json'))
 
 
 @ADMIN_BP.route('/users/<int:u_id>', methods=['GET'])
 @token_required
 @require_admin
 def get_user(user_id, u_id):
-    headers = {}
-    auth = request.headers.get('Authorization')
-    if auth:
-        headers['Authorization'] = auth
-    r = requests.get(f"{AUTH_SERVICE}/auth/admin/users/{u_id}", headers=headers)
-    return jsonify(r.json()), r.status_code
+    return _stream_users(f"/auth/admin/users/{u_id}", "/auth/admin/users/<id>")
 
 
 @ADMIN_BP.route('/users/<int:u_id>', methods=['PUT'])
@@ -108,21 +325,17 @@ def get_user(user_id, u_id):
 @require_admin
 def update_user(user_id, u_id):
     payload = request.get_json(force=True)
-    headers = {}
-    auth = request.headers.get('Authorization')
-    if auth:
-        headers['Authorization'] = auth
-    r = requests.put(f"{AUTH_SERVICE}/auth/admin/users/{u_id}", json=payload, headers=headers)
-    return jsonify(r.json()), r.status_code
+    r, resp = _proxy_users('PUT', f"/auth/admin/users/{u_id}", "/auth/admin/users/<id>", json=payload)
+    if r is not None and r.ok:
+        _forget_user(u_id)
+    return resp
 
 
 @ADMIN_BP.route('/users/<int:u_id>', methods=['DELETE'])
 @token_required
 @require_admin
 def delete_user(user_id, u_id):
-    headers = {}
-    auth = request.headers.get('Authorization')
-    if auth:
-        headers['Authorization'] = auth
-    r = requests.delete(f"{AUTH_SERVICE}/auth/admin/users/{u_id}", headers=headers)
-    return jsonify(r.json()), r.status_code
+    r, resp = _proxy_users('DELETE', f"/auth/admin/users/{u_id}", "/auth/admin/users/<id>")
+    if r is not None and r.ok:
+        _forget_user(u_id)
+    return resp
@@ -5,6 +5,12 @@ from app.models.assignment_test import AssignmentTest
 from app.utils.auth import token_required
 from app.utils.admin import is_admin  # Используем is_admin для проверки прав
 from app.models.topic import Topic
+from app.utils.grading_context import (
+    invalidate_grading_context, expected_fingerprint, compare_settings, parse_config,
+)
+from app.utils.grading import ALLOWED_SHELL
+from app.utils.query_engine import has_write_stage
+from app.utils.reference import refresh_reference
 from sqlalchemy.exc import SQLAlchemyError
 
 
@@ -17,6 +23,46 @@ def _safe_rollback():
         except Exception:
             pass
 
+def _set_reference(a, query):
+    """Меняет эталонный запрос; посчитанный результат сбрасывается до пересчёта."""
+    query = (query or "").strip() or None
+    if query == a.reference_query:
+        return False
+    a.reference_query = query
+    a.reference_result = a.reference_hashes = a.reference_digest = None
+    a.reference_count = a.reference_version = a.reference_error = None
+    a.reference_updated_at = None
+    return query is not None
+
+def _make_test(assignment_id, t):
+    """AssignmentTest из тела запроса; хеши ожидаемого результата считаются при записи."""
+    expected = t.get("expected_result", "[]")
+    hashes, digest = expected_fingerprint(expected)
+    mode, tolerance = compare_settings(t.get("compare_mode"), t.get("tolerance"))
+    return AssignmentTest(
+        assignment_id=assignment_id,
+        expected_result=expected,
+        expected_hashes=hashes,
+        expected_digest=digest,
+        compare_mode=mode,
+        tolerance=tolerance,
+        test_description=t.get("test_description", "")
+    )
+
+def _validate_payload(data):
+    """Эталонный запрос и режимы сравнения задания (schema.compare_mode) и тестов;
+    ValueError — некорректны."""
+    ref = data.get("reference_query")
+    if ref and not (isinstance(ref, str) and ALLOWED_SHELL.match(ref)):
+        raise ValueError("reference_query must be db.<coll>.find(...) / aggregate(...)")
+    if ref and has_write_stage(ref):
+        raise ValueError("reference_query must not contain $out or $merge")
+    if "schema" in data:
+        conf = parse_config(data.get("schema"))
+        compare_settings(conf.get("compare_mode"), conf.get("tolerance"))
+    for t in data.get("tests") or []:
+        compare_settings(t.get("compare_mode"), t.get("tolerance"))
+
 assignments_bp = Blueprint("assignments", __name__, url_prefix="/assignments")
 
 
@@ -64,10 +110,12 @@ def get_assignment(user_id, assignment_id):
         "difficulty": a.difficulty,
         "created_at": a.created_at.isoformat(),
         "schema": a.schema_json,  # Показываем схему задания
+        "has_reference": bool(a.reference_query),
         "tests": [
             {
                 "test_id": t.test_id,
-                "test_description": t.test_description
+                "test_description": t.test_description,
+                "compare_mode": t.compare_mode
             } for t in a.tests
         ]
     })
@@ -83,6 +131,10 @@ def create_assignment(user_id):
     data = request.get_json(force=True)
     if not data.get("topic_id") or not data.get("title"):
         return jsonify({"error": "Missing required fields"}), 400
+    try:
+        _validate_payload(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # validate topic exists
     topic = Topic.query.get(data["topic_id"])
@@ -96,6 +148,7 @@ def create_assignment(user_id):
         difficulty=data.get("difficulty"),
         schema_json=data.get("schema")  # Сохраняем схему
     )
+    recompute = _set_reference(a, data.get("reference_query"))
     try:
         db.session.add(a)
         db.session.flush()
@@ -104,11 +157,7 @@ def create_assignment(user_id):
         return jsonify({"error": "Database error creating assignment", "details": str(e)}), 500
 
     for t in data.get("tests", []):
-        db.session.add(AssignmentTest(
-            assignment_id=a.assignment_id,
-            expected_result=t.get("expected_result", "[]"),
-            test_description=t.get("test_description", "")
-        ))
+        db.session.add(_make_test(a.assignment_id, t))
 
     try:
         db.session.commit()
@@ -116,7 +165,12 @@ def create_assignment(user_id):
         _safe_rollback()
         return jsonify({"error": "Database error committing assignment", "details": str(e)}), 500
 
-    return jsonify({"message": "Assignment created", "assignment_id": a.assignment_id}), 201
+    invalidate_grading_context(a.assignment_id)
+    resp = {"message": "Assignment created", "assignment_id": a.assignment_id}
+    if recompute:
+        # эталон считается сразу: ошибка в запросе видна админу в ответе
+        resp["reference"] = refresh_reference(a.assignment_id)
+    return jsonify(resp), 201
 
 # PUT /assignments/<assignment_id> — обновить задание
 @assignments_bp.route("/<int:assignment_id>", methods=["PUT"])
@@ -131,20 +185,25 @@ def update_assignment(user_id, assignment_id):
         return jsonify({"error": "Assignment not found"}), 404
 
     data = request.get_json(force=True)
+    try:
+        _validate_payload(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     if "title" in data: a.title = data["title"]
     if "description" in data: a.description = data["description"]
     if "difficulty" in data: a.difficulty = data["difficulty"]
     if "schema" in data: a.schema_json = data["schema"]
+    recompute = "reference_query" in data and _set_reference(a, data["reference_query"])
 
     if "tests" in data:
         for old in a.tests:
             db.session.delete(old)
         for t in data["tests"] or []:
-            db.session.add(AssignmentTest(
-                assignment_id=a.assignment_id,
-                expected_result=t.get("expected_result", "[]"),
-                test_description=t.get("test_description", "")
-            ))
+            db.session.add(_make_test(a.assignment_id, t))
 
     db.session.commit()
-    return jsonify({"message": "Assignment updated"})
+    invalidate_grading_context(assignment_id)
+    resp = {"message": "Assignment updated"}
+    if recompute:
+        resp["reference"] = refresh_reference(assignment_id)
+    return jsonify(resp)
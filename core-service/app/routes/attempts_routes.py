@@ -1,109 +1,27 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from app import db
-from app.models.assignment_test import AssignmentTest
 from app.models.query import Query
-from app.models.assignment import Assignment
+from app.utils.grading_context import get_grading_context
 from app.utils.auth import token_required  # Оставляем проверку токена
-from bson import ObjectId
-from datetime import datetime
-import json, re, subprocess
-from sqlalchemy.exc import SQLAlchemyError, NoReferencedTableError, ProgrammingError
-
-
-def _safe_rollback():
-    """Rollback session if possible, swallow errors to avoid SAWarning when
-    session state is not active.
-    """
-    try:
-        # Only rollback if there is an active transaction; otherwise removing the session
-        # is safer (rollback on non-active transaction emits SAWarning).
-        try:
-            in_tx = False
-            if hasattr(db.session, 'in_transaction'):
-                # SQLAlchemy 1.4+: in_transaction() returns a Transaction or None
-                in_tx = bool(db.session.in_transaction())
-            elif hasattr(db.session, 'get_transaction'):
-                in_tx = bool(db.session.get_transaction())
-        except Exception:
-            in_tx = False
-
-        if in_tx:
-            db.session.rollback()
-        else:
-            try:
-                db.session.remove()
-            except Exception:
-                pass
-    except Exception:
-        # best-effort cleanup
-        try:
-            db.session.remove()
-        except Exception:
-            pass
+from app.utils.grading import ALLOWED_SHELL, grade_attempt, _safe_rollback
+from app.utils.query_engine import has_write_stage
+from app.utils.attempt_jobs import get_attempt_jobs, stored_result, PENDING_STATUSES
+from app.utils.admission import get_admission, AdmissionRejected
+from app.utils import job_queue
+import json, time
+from sqlalchemy.exc import SQLAlchemyError
 
 attempts_bp = Blueprint("attempts", __name__, url_prefix="/assignments")
 
-MAX_DOCS = 200
-MAX_TIME_MS = 3000            # лимит для операций внутри Mongo
-MONGOSH_TIMEOUT = 5           # секунд на выполнение mongosh
-MAX_OUTPUT_BYTES = 2_000_000  # защитный лимит на размер вывода
+SSE_TIMEOUT = 60         # секунд держим SSE-соединение
+SSE_HEARTBEAT = 15       # секунд между keep-alive комментариями
+RETRY_AFTER = 2          # секунд — подсказка клиенту при перегрузке
 
-# Разрешаем только чтение: find / aggregate (+ sort/limit цепочки)
-ALLOWED_SHELL = re.compile(
-    r"""^\s*db\.(?P<coll>[A-Za-z0-9_]+)\.(?P<op>find|aggregate)\s*\([\s\S]*?\)\s*(\.\s*(sort|limit)\s*\([\s\S]*?\)\s*)*;?\s*$""",
-    re.IGNORECASE,
-)
 
-def normalize_value(v):
-    if isinstance(v, ObjectId):
-        return str(v)
-    if isinstance(v, datetime):
-        return v.isoformat()
-    if isinstance(v, list):
-        return [normalize_value(x) for x in v]
-    if isinstance(v, dict):
-        return {k: normalize_value(v[k]) for k in sorted(v)}
-    return v
+def _wants_async(body):
+    prefer = request.headers.get("Prefer", "")
+    return bool(body.get("async")) or "respond-async" in prefer.lower()
 
-def normalize_docs(docs):
-    return [normalize_value(doc) for doc in docs[:MAX_DOCS]]
-
-def _run_mongosh(code: str, mongo_uri: str) -> tuple[int, str, str]:
-    """
-    Запускает mongosh, если выражение вернёт курсор — делает toArray(),
-    печатает JSON через print(JSON.stringify(...)).
-    """
-    user_code = code.strip()
-    if user_code.endswith(";"):
-        user_code = user_code[:-1]
-
-    script = f"""
-try {{
-  const __expr_result = (function() {{ return ({user_code}); }})();
-  let __out;
-  if (__expr_result && typeof __expr_result.toArray === 'function') {{
-    __out = __expr_result.toArray();
-  }} else {{
-    __out = __expr_result;
-  }}
-  const __json = JSON.stringify(__out);
-  if (__json.length > {MAX_OUTPUT_BYTES}) {{
-    throw new Error("Result too large");
-  }}
-  print(__json);
-}} catch (e) {{
-  print(JSON.stringify({{__mongo_error: String(e.message || e)}}));
-  quit(2);
-}}
-"""
-    cmd = ["mongosh", mongo_uri, "--quiet", "--eval", script]
-    proc = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=MONGOSH_TIMEOUT
-    )
-    return proc.returncode, proc.stdout.strip(), proc.stderr.strip()
 
 @attempts_bp.route("/<int:assignment_id>/attempts", methods=["POST"])
 @token_required
@@ -115,6 +33,10 @@ def attempt_assignment(user_id, assignment_id):
       - Attempts
     security:
       - BearerAuth: []
+    description: >
+      С {"async": true} в теле (или заголовком Prefer: respond-async) попытка
+      ставится в очередь и сразу возвращается 202 с query_id; результат —
+      GET /assignments/<id>/attempts/<query_id>/result.
     """
     body = request.get_json(silent=True) or {}
     code = body.get("code", "")
@@ -125,304 +47,172 @@ def attempt_assignment(user_id, assignment_id):
         return jsonify({
             "error": "Only read queries allowed: db.<coll>.find(...) / aggregate(...) with optional sort/limit"
         }), 403
+    if has_write_stage(code):
+        return jsonify({"error": "$out and $merge stages are not allowed: the training database is read-only"}), 400
+
+    if _wants_async(body):
+        if current_app.config.get("ATTEMPTS_QUEUE") == "postgres":
+            return _submit_async(None, user_id, assignment_id, code)
+        jobs = get_attempt_jobs()
+        if jobs is not None:
+            return _submit_async(jobs, user_id, assignment_id, code)
+
+    limiter = get_admission()
+    if limiter is None:
+        payload, status = grade_attempt(user_id, assignment_id, code)
+        return jsonify(payload), status
+    try:
+        with limiter.admit(user_id):
+            payload, status = grade_attempt(user_id, assignment_id, code)
+    except AdmissionRejected as e:
+        return _rejected(e)
+    return jsonify(payload), status
+
+
+def _rejected(err):
+    resp = jsonify({"error": err.reason, "retry_after": err.retry_after})
+    resp.headers["Retry-After"] = str(err.retry_after)
+    return resp, err.status
+
+
+def _busy():
+    return _rejected(AdmissionRejected(503, "Too many attempts in progress, retry later", RETRY_AFTER))
 
-    assignment = Assignment.query.get(assignment_id)
-    if not assignment:
+
+def _submit_async(jobs, user_id, assignment_id, code):
+    """jobs=None — попытка ставится в очередь grading_jobs в Postgres."""
+    if get_grading_context(assignment_id) is None:
         return jsonify({"error": "Assignment not found"}), 404
 
-    # Optional enforcement: assignment may require using a specific method (e.g. "find")
-    # The config may be stored in assignment.schema_json as {"required_method": "find"}
-    required_method = None
-    try:
-        conf = None
-        if assignment.schema_json:
-            if isinstance(assignment.schema_json, dict):
-                conf = assignment.schema_json
-            else:
-                # sometimes stored as JSON string
-                try:
-                    conf = json.loads(assignment.schema_json)
-                except Exception:
-                    conf = None
-        if conf and isinstance(conf, dict):
-            required_method = conf.get("required_method")
-    except Exception:
-        required_method = None
+    limiter = get_admission()
+    reserved = False
+    if jobs is None:
+        # у воркеров своя конкурентность; лимит пользователя считаем по его попыткам в очереди
+        if limiter and limiter.per_user:
+            pending = Query.query.filter(
+                Query.user_id == user_id, Query.status.in_(PENDING_STATUSES)
+            ).count()
+            if pending >= limiter.per_user:
+                return _rejected(AdmissionRejected(
+                    429, f"Too many attempts in progress (limit {limiter.per_user} per user)",
+                    RETRY_AFTER))
+    else:
+        if not jobs.has_capacity():
+            return _busy()
+        if limiter:
+            # место освобождает фоновое задание по завершении
+            try:
+                limiter.acquire_user(user_id)
+            except AdmissionRejected as e:
+                return _rejected(e)
+            reserved = True
 
-    # Create an initial Query row ASAP so we have a persistent record of the submission
-    q = None
     try:
         q = Query(
             user_id=user_id,
             assignment_id=assignment_id,
             query_text=code,
-            status="running",
+            status="pending",
         )
         db.session.add(q)
+        if jobs is None:
+            db.session.flush()
+            job_queue.enqueue(q.query_id, current_app.config.get("GRADING_MAX_ATTEMPTS", 3))
         db.session.commit()
-    except SQLAlchemyError:
-        # if saving fails, continue without persistent q; we'll try to save later
+    except SQLAlchemyError as e:
         _safe_rollback()
+        if reserved:
+            limiter.release_user(user_id)
+        return jsonify({"error": "Database error saving attempt", "details": str(e)}), 500
 
-    if required_method:
-        # robust check: look for a dot + method name + opening parenthesis, allow spaces and case-insensitive
-        try:
-            meth_re = re.compile(rf"\.\s*{re.escape(required_method)}\s*\(", re.IGNORECASE)
-        except re.error:
-            meth_re = None
-
-        if not meth_re or not meth_re.search(code):
-            # save failed attempt with reason (update existing q if present)
-            msg = f"Submission must use {required_method}() as required by the assignment"
-            try:
-                if q:
-                    q.status = "failed"
-                    q.error_message = msg
-                    db.session.add(q)
-                    db.session.commit()
-                else:
-                    q2 = Query(
-                        user_id=user_id,
-                        assignment_id=assignment_id,
-                        query_text=code,
-                        status="failed",
-                        error_message=msg,
-                    )
-                    db.session.add(q2)
-                    db.session.commit()
-            except SQLAlchemyError:
-                _safe_rollback()
-            return jsonify({"error": msg, "error_text": msg, "required_method": required_method}), 400
-
-    mongo_uri = current_app.config.get("MONGO_URI")
-    if not mongo_uri or "/" not in mongo_uri.strip("/"):
-        return jsonify({"error": "MONGO_URI must include database name, e.g. mongodb://mongo:27017/mongo_train"}), 500
-
-    started = datetime.utcnow()
-    try:
-        rc, out, err = _run_mongosh(code, mongo_uri)
-    except subprocess.TimeoutExpired:
+    if jobs is not None and not jobs.submit(q.query_id, user_id, assignment_id, code):
+        if reserved:
+            limiter.release_user(user_id)
         try:
-            msg = "mongosh timed out"
-            if q:
-                q.status = "error"
-                q.error_message = msg
-                db.session.add(q)
-                db.session.commit()
-            else:
-                q2 = Query(
-                    user_id=user_id,
-                    assignment_id=assignment_id,
-                    query_text=code,
-                    status="error",
-                    error_message=msg,
-                )
-                db.session.add(q2)
-                db.session.commit()
-        except SQLAlchemyError:
-            _safe_rollback()
-        return jsonify({"error": "Mongo shell timed out"}), 504
-    except FileNotFoundError:
-        return jsonify({"error": "mongosh not found. Install mongosh in your container/image."}), 500
-
-    exec_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
-
-    if rc != 0:
-        # Prefer structured error from our JS wrapper (stdout JSON), fallback to stderr
-        msg = "Unknown mongosh error"
-        try:
-            parsed = json.loads(out or "{}")
-            if isinstance(parsed, dict) and "__mongo_error" in parsed:
-                msg = parsed["__mongo_error"]
-            else:
-                # if stdout contains something else, use it
-                if out:
-                    msg = out
-        except Exception:
-            # stdout wasn't JSON; prefer stderr if present
-            if err:
-                msg = err
-            elif out:
-                msg = out
-
-        # Save / update Query with error info
-        try:
-            if q:
-                q.status = "error"
-                q.error_message = msg
-                try:
-                    q.error_json = {"stdout": out, "stderr": err}
-                except Exception:
-                    pass
-                db.session.add(q)
-                db.session.commit()
-            else:
-                q2 = Query(
-                    user_id=user_id,
-                    assignment_id=assignment_id,
-                    query_text=code,
-                    status="error",
-                    error_message=msg,
-                )
-                try:
-                    q2.error_json = {"stdout": out, "stderr": err}
-                except Exception:
-                    pass
-                db.session.add(q2)
-                db.session.commit()
-        except SQLAlchemyError:
-            _safe_rollback()
-
-        return jsonify({"error": msg, "error_text": msg, "required_method": required_method}), 400
-
-    try:
-        data = json.loads(out) if out else []
-        if isinstance(data, dict):
-            docs = [data]
-        elif isinstance(data, list):
-            docs = data
-        else:
-            docs = [data]
-    except Exception as e:
-        msg = f"Invalid mongosh JSON output: {e}"
-        try:
-            if q:
-                q.status = "error"
-                q.error_message = msg
-                db.session.add(q)
-                db.session.commit()
-            else:
-                q2 = Query(
-                    user_id=user_id,
-                    assignment_id=assignment_id,
-                    query_text=code,
-                    status="error",
-                    error_message=msg,
-                )
-                db.session.add(q2)
-                db.session.commit()
-        except SQLAlchemyError:
-            _safe_rollback()
-        return jsonify({"error": msg}), 500
-
-    normalized = normalize_docs(docs)
-
-    # diagnostics: if result is empty but tests expect rows, run quick diagnostics
-    diag = None
-    try:
-        match = ALLOWED_SHELL.match(code)
-        coll_name = match.group('coll') if match else None
-        # we'll only run diagnostics if there was a collection name and normalized empty
-        if coll_name and len(normalized) == 0:
-            diag_script = f"printjson(db.getCollectionNames()); printjson(db.{coll_name}.find().limit(5).toArray());"
-            rc2, out2, err2 = _run_mongosh(diag_script, mongo_uri)
-            diag = {"rc": rc2, "out": out2, "err": err2}
-    except Exception:
-        diag = {"rc": -1, "out": None, "err": "diag-failed"}
-
-    tests = AssignmentTest.query.filter_by(assignment_id=assignment_id).all()
-    all_passed, test_results = True, []
-    failure_reasons = []
-    for t in tests:
-        expected = t.expected_result
-        if isinstance(expected, str):
-            try:
-                expected = json.loads(expected)
-            except Exception:
-                expected = {"_raw": expected}
-
-        passed = (expected == normalized)
-        all_passed &= passed
-
-        # build detailed result for UI
-        tr = {
-            "test_id": t.test_id,
-            "description": t.test_description,
-            "passed": passed
-        }
-        if not passed:
-            # include small samples to help debugging
-            expected_sample = expected if (isinstance(expected, list) or isinstance(expected, dict)) else [expected]
-            actual_sample = normalized[:5]
-            if isinstance(expected, list):
-                reason = f"expected {len(expected)} docs, got {len(normalized)}"
-            else:
-                reason = "expected value mismatch"
-            tr.update({
-                "expected_sample": expected_sample if isinstance(expected_sample, list) else [expected_sample],
-                "actual_sample": actual_sample,
-                "failure_reason": reason
-            })
-            failure_reasons.append(f"Test {t.test_id}: {reason}")
-
-        test_results.append(tr)
-
-    # Update the previously-created Query record if present, otherwise create a new one
-    try:
-        if q:
-            q.status = "ok" if all_passed else "failed"
-            q.result = normalized
-            q.exec_ms = exec_ms
-            q.result_count = len(normalized)
-            if diag:
-                try:
-                    q.error_json = diag
-                except Exception:
-                    pass
-            db.session.add(q)
-            db.session.commit()
-        else:
-            q = Query(
-                user_id=user_id,
-                assignment_id=assignment_id,
-                query_text=code,
-                status="ok" if all_passed else "failed",
-                result=normalized,
-                exec_ms=exec_ms,
-                result_count=len(normalized),
-            )
-            if diag:
-                try:
-                    q.error_json = diag
-                except Exception:
-                    pass
-            db.session.add(q)
+            q.status = "error"
+            q.error_message = "server busy"
             db.session.commit()
-    except (NoReferencedTableError, ProgrammingError) as e:
-        # FK / table missing: DB schema not initialized or broken. Log and return success result to user
-        print(f"[attempts_routes] DB schema issue saving query result: {e}")
-        # try to persist a minimal Query without FK fields if possible
-        try:
-            q.user_id = None
-            db.session.add(q)
-            db.session.commit()
-        except Exception:
+        except SQLAlchemyError:
             _safe_rollback()
-        # include failure reasons in error_text if tests failed
-        error_text = None
-        if not all_passed:
-            error_text = "; ".join(failure_reasons) if failure_reasons else None
-        return jsonify({
-            "passed": all_passed,
-            "tests": test_results,
-            "result_sample": normalized[:5],
-            "warning": "Database schema not initialized; query result not fully saved",
-            "error_text": error_text,
-            "required_method": required_method
-        }), 200
-    except SQLAlchemyError as e:
-        _safe_rollback()
-        return jsonify({"error": "Database error saving query result", "details": str(e)}), 500
-
-    # build top-level error_text when tests failed to help user
-    error_text = None
-    if not all_passed:
-        error_text = "; ".join(failure_reasons) if failure_reasons else None
+        return _busy()
 
     return jsonify({
-        "passed": all_passed,
-        "tests": test_results,
-        "result_sample": normalized[:5],
-        "required_method": required_method,
-        "error_text": error_text
-    })
+        "query_id": q.query_id,
+        "status": "pending",
+        "result_url": f"/assignments/{assignment_id}/attempts/{q.query_id}/result",
+    }), 202
+
+
+def _current_result(user_id, assignment_id, query_id):
+    """(payload, http_status) попытки: из памяти процесса или из таблицы queries."""
+    jobs = get_attempt_jobs()
+    job = jobs.get(query_id) if jobs else None
+    if job is not None:
+        if job.user_id != user_id or job.assignment_id != assignment_id:
+            return {"error": "Attempt not found"}, 404
+        if job.state != "done":
+            return {"query_id": query_id, "status": job.state}, 202
+        return dict(job.payload, query_id=query_id), job.status_code
+
+    q = Query.query.get(query_id)
+    if not q or q.user_id != user_id or q.assignment_id != assignment_id:
+        return {"error": "Attempt not found"}, 404
+    return stored_result(q)
+
+
+@attempts_bp.route("/<int:assignment_id>/attempts/<int:query_id>/result", methods=["GET"])
+@token_required
+def attempt_result(user_id, assignment_id, query_id):
+    """
+    Результат асинхронной попытки
+    ---
+    tags:
+      - Attempts
+    security:
+      - BearerAuth: []
+    description: >
+      202 — попытка ещё выполняется; иначе тот же ответ, что у синхронного POST.
+      С Accept: text/event-stream (или ?stream=1) отдаёт Server-Sent Events:
+      события status и итоговое событие result.
+    """
+    if request.args.get("stream") or "text/event-stream" in request.headers.get("Accept", ""):
+        return Response(
+            stream_with_context(_result_events(user_id, assignment_id, query_id)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    payload, status = _current_result(user_id, assignment_id, query_id)
+    return jsonify(payload), status
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _result_events(user_id, assignment_id, query_id):
+    deadline = time.monotonic() + SSE_TIMEOUT
+    last_beat = time.monotonic()
+    last_state = None
+    while True:
+        payload, status = _current_result(user_id, assignment_id, query_id)
+        if status != 202:
+            yield _sse("result", dict(payload, http_status=status))
+            return
+        if payload.get("status") != last_state:
+            last_state = payload.get("status")
+            yield _sse("status", payload)
+        if time.monotonic() >= deadline:
+            yield _sse("timeout", {"query_id": query_id})
+            return
+
+        jobs = get_attempt_jobs()
+        job = jobs.get(query_id) if jobs else None
+        if job is not None:
+            job.done.wait(1.0)
+        else:
+            # попытка выполняется в другом процессе — опрашиваем таблицу
+            db.session.remove()
+            time.sleep(1.0)
+        if time.monotonic() - last_beat >= SSE_HEARTBEAT:
+            last_beat = time.monotonic()
+            yield ": keep-alive\n\n"
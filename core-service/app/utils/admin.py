@@ -1,26 +1,87 @@
-import requests
-from flask import jsonify, request
+import threading
+import time
+
+from flask import jsonify, request, g, current_app
 from functools import wraps
 
-AUTH_SERVICE_URL = "http://auth-service:5001"
+from app.utils.service_client import get_auth_client
 
+# кеш ответов /auth/is-admin: user_id -> (истекает, is_admin)
+_admin_cache = {}
+_admin_lock = threading.Lock()
+_admin_stats = {"claim": 0, "cache_hits": 0, "live_checks": 0}
+
+
+def _claimed_admin(user_id):
+    """Флаг админа из проверенного токена текущего запроса (None — неизвестен)."""
+    if getattr(g, "user_id", None) != user_id:
+        return None
+    claims = getattr(g, "token_claims", None)
+    if claims and "role" in claims:
+        return claims["role"] == "admin"
+    # в режиме AUTH_MODE=remote флаг приходит из /auth/me
+    return getattr(g, "token_is_admin", None)
 
-def is_admin(user_id):
-    """Query auth-service to check whether a user is admin.
+
+def _live_is_admin(user_id):
+    """Query auth-service to check whether a user is admin (cached for ADMIN_CACHE_TTL seconds).
 
     Forwards the incoming Authorization header so auth-service can validate the token.
     """
+    now = time.monotonic()
+    with _admin_lock:
+        item = _admin_cache.get(user_id)
+        if item is not None and item[0] > now:
+            _admin_stats["cache_hits"] += 1
+            return item[1]
+        _admin_stats["live_checks"] += 1
     try:
         auth = request.headers.get('Authorization')
         headers = {'Authorization': auth} if auth else {}
-        r = requests.get(f"{AUTH_SERVICE_URL}/auth/is-admin/{user_id}", headers=headers, timeout=5)
+        r = get_auth_client().get(f"/auth/is-admin/{user_id}", endpoint="/auth/is-admin/<id>",
+                                  headers=headers)
         if r.status_code == 200:
-            return r.json().get("is_admin", False)
+            result = bool(r.json().get("is_admin", False))
+            with _admin_lock:
+                _admin_cache[user_id] = (now + float(current_app.config.get("ADMIN_CACHE_TTL", 30)), result)
+            return result
     except Exception as e:
         print(f"[core-service] Ошибка при запросе к auth-service: {e}")
     return False
 
 
+def is_admin(user_id):
+    """Является ли пользователь админом.
+
+    По умолчанию доверяем роли из проверенного токена (claim "role" выдаёт auth-service
+    при входе) — без обращений к auth-service. Если роли в токене нет (старый токен)
+    или ADMIN_LIVE_CHECK=1 (права нужно отзывать сразу, а не через срок жизни токена),
+    спрашиваем auth-service с коротким кешем.
+    """
+    if not current_app.config.get("ADMIN_LIVE_CHECK"):
+        claimed = _claimed_admin(user_id)
+        if claimed is not None:
+            with _admin_lock:
+                _admin_stats["claim"] += 1
+            return claimed
+    return _live_is_admin(user_id)
+
+
+def forget_admin_status(user_id):
+    """Сбрасывает закешированный статус (после изменения прав пользователя)."""
+    with _admin_lock:
+        _admin_cache.pop(user_id, None)
+
+
+def admin_metrics() -> dict:
+    with _admin_lock:
+        stats = dict(_admin_stats)
+        stats["cached"] = len(_admin_cache)
+    stats["ttl"] = float(current_app.config.get("ADMIN_CACHE_TTL", 30))
+    stats["live_check"] = bool(current_app.config.get("ADMIN_LIVE_CHECK"))
+    return stats
+
+
 def require_admin(fn):
     @wraps(fn)
     def wrapper(user_id, *args, **kwargs):
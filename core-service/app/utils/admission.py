@@ -0,0 +1,160 @@
+"""Контроль допуска к выполнению попыток.
+
+Глобальный лимит одновременно выполняемых попыток с ограниченной очередью
+ожидания и лимит на пользователя. Лишние запросы отклоняются сразу: 429 — у
+пользователя слишком много попыток в работе, 503 — сервис перегружен. В обоих
+случаях клиент получает Retry-After, а не ждёт, пока узел захлебнётся.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent, max_queued, per_user, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.per_user = per_user
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queued = 0
+        self._users = {}
+        self._service_s = 1.0  # EWMA времени выполнения, для Retry-After
+        self._stats = {"admitted": 0, "rejected_user": 0, "rejected_queue_full": 0,
+                       "rejected_timeout": 0, "wait_ms_total": 0.0}
+
+    def retry_after(self) -> int:
+        """Оценка, через сколько секунд освободится место в очереди."""
+        with self._cond:
+            return self._retry_after_locked()
+
+    # --- лимит на пользователя -------------------------------------------
+    def acquire_user(self, user_id):
+        """Занимает место пользователя; AdmissionRejected(429), если лимит исчерпан."""
+        with self._cond:
+            active = self._users.get(user_id, 0)
+            if self.per_user and active >= self.per_user:
+                self._stats["rejected_user"] += 1
+                raise AdmissionRejected(
+                    429, f"Too many attempts in progress (limit {self.per_user} per user)",
+                    max(1, math.ceil(self._service_s)))
+            self._users[user_id] = active + 1
+
+    def release_user(self, user_id):
+        with self._cond:
+            active = self._users.get(user_id, 0) - 1
+            if active > 0:
+                self._users[user_id] = active
+            else:
+                self._users.pop(user_id, None)
+
+    def user_active(self, user_id) -> int:
+        with self._cond:
+            return self._users.get(user_id, 0)
+
+    # --- глобальный лимит -------------------------------------------------
+    def acquire_slot(self, timeout=None, bounded=True):
+        """Ждёт свободного слота выполнения.
+
+        bounded=True — запрос из HTTP: при полной очереди или по истечении
+        timeout (по умолчанию queue_timeout) — AdmissionRejected(503).
+        bounded=False — фоновые задания, уже ограниченные своей очередью: ждут без лимита.
+        """
+        started = time.monotonic()
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._cond:
+            if self._in_flight >= self.max_concurrent:
+                if bounded and self._queued >= self.max_queued:
+                    self._stats["rejected_queue_full"] += 1
+                    raise AdmissionRejected(503, "Server is busy, retry later",
+                                            self._retry_after_locked())
+                self._queued += 1
+                try:
+                    deadline = started + timeout
+                    while self._in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic() if bounded else None
+                        if remaining is not None and remaining <= 0:
+                            self._stats["rejected_timeout"] += 1
+                            raise AdmissionRejected(503, "Server is busy, retry later",
+                                                    self._retry_after_locked())
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+            self._in_flight += 1
+            self._stats["admitted"] += 1
+            self._stats["wait_ms_total"] += (time.monotonic() - started) * 1000
+        return started
+
+    def release_slot(self, service_s=None):
+        with self._cond:
+            self._in_flight -= 1
+            if service_s is not None:
+                self._service_s = 0.8 * self._service_s + 0.2 * service_s
+            self._cond.notify()
+
+    def _retry_after_locked(self):
+        backlog = self._queued + 1
+        return max(1, math.ceil(self._service_s * backlog / max(1, self.max_concurrent)))
+
+    @contextmanager
+    def admit(self, user_id):
+        """Лимит пользователя + глобальный слот на время выполнения попытки."""
+        self.acquire_user(user_id)
+        try:
+            self.acquire_slot()
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self.release_slot(time.monotonic() - started)
+        finally:
+            self.release_user(user_id)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "max_concurrent": self.max_concurrent,
+                "max_queued": self.max_queued,
+                "per_user": self.per_user,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "users_active": len(self._users),
+                "avg_service_ms": round(self._service_s * 1000, 1),
+            })
+        admitted = stats["admitted"]
+        stats["avg_wait_ms"] = round(stats.pop("wait_ms_total") / admitted, 2) if admitted else 0.0
+        stats["rejected"] = (stats["rejected_user"] + stats["rejected_queue_full"]
+                             + stats["rejected_timeout"])
+        return stats
+
+
+_controller = None
+
+
+def init_admission(app):
+    """Создаёт контроллер допуска (ATTEMPTS_MAX_CONCURRENT = 0 — без ограничений)."""
+    global _controller
+    limit = int(app.config.get("ATTEMPTS_MAX_CONCURRENT") or 0)
+    if limit > 0 and _controller is None:
+        _controller = AdmissionController(
+            max_concurrent=limit,
+            max_queued=int(app.config.get("ATTEMPTS_MAX_QUEUED", 32)),
+            per_user=int(app.config.get("ATTEMPTS_PER_USER", 2)),
+            queue_timeout=float(app.config.get("ATTEMPTS_QUEUE_TIMEOUT", 10)),
+        )
+    return _controller
+
+
+def get_admission():
+    return _controller
@@ -0,0 +1,226 @@
+"""Асинхронное выполнение попыток.
+
+POST /assignments/<id>/attempts в асинхронном режиме создаёт строку Query со
+статусом pending и ставит проверку в ограниченный пул потоков. Результат
+хранится в памяти процесса ATTEMPTS_RESULT_TTL секунд; после этого (или из другого
+процесса) он восстанавливается из строки Query.
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.query import Query
+from app.utils.grading import grade_attempt, save_attempt_error
+from app.utils.grading_context import get_grading_context
+from app.utils.admission import get_admission
+
+PENDING_STATUSES = ("pending", "running")
+
+
+class AttemptJob:
+    __slots__ = ("query_id", "user_id", "assignment_id", "state", "payload",
+                 "status_code", "done", "finished_at")
+
+    def __init__(self, query_id, user_id, assignment_id):
+        self.query_id = query_id
+        self.user_id = user_id
+        self.assignment_id = assignment_id
+        self.state = "pending"
+        self.payload = None
+        self.status_code = None
+        self.done = threading.Event()
+        self.finished_at = None
+
+
+class AttemptJobs:
+    """Ограниченный пул потоков для проверки попыток + реестр результатов."""
+
+    def __init__(self, app, workers, queue_size, result_ttl):
+        self.app = app
+        self.workers = workers
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attempt")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def has_capacity(self) -> bool:
+        with self._lock:
+            return self._queued < self.queue_size
+
+    def submit(self, query_id, user_id, assignment_id, code) -> bool:
+        """Ставит попытку в очередь; False — очередь заполнена."""
+        job = AttemptJob(query_id, user_id, assignment_id)
+        with self._lock:
+            if self._queued >= self.queue_size:
+                self._stats["rejected"] += 1
+                return False
+            self._queued += 1
+            self._stats["submitted"] += 1
+            self._jobs[query_id] = job
+            self._cleanup_locked()
+        self._executor.submit(self._run, job, code)
+        return True
+
+    def get(self, query_id):
+        with self._lock:
+            return self._jobs.get(query_id)
+
+    def _cleanup_locked(self):
+        now = time.monotonic()
+        stale = [qid for qid, j in self._jobs.items()
+                 if j.finished_at is not None and now - j.finished_at > self.result_ttl]
+        for qid in stale:
+            del self._jobs[qid]
+
+    def _run(self, job, code):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        # место пользователя занято при постановке в очередь (см. attempts_routes),
+        # здесь ждём общий слот выполнения наравне с синхронными попытками
+        limiter = get_admission()
+        started = limiter.acquire_slot(bounded=False) if limiter else None
+        job.state = "running"
+        try:
+            with self.app.app_context():
+                try:
+                    q = Query.query.get(job.query_id)
+                    if q is not None:
+                        q.status = "running"
+                        db.session.commit()
+                    job.payload, job.status_code = grade_attempt(
+                        job.user_id, job.assignment_id, code, q=q
+                    )
+                except Exception as e:
+                    print(f"[attempt_jobs] attempt {job.query_id} failed: {e}")
+                    job.payload = {"error": "Internal server error", "details": str(e)}
+                    job.status_code = 500
+                    # БД может быть недоступна — сохранение ошибки не должно помешать
+                    # завершить задачу, иначе опрос результата ждал бы вечно
+                    try:
+                        db.session.rollback()
+                        q = Query.query.get(job.query_id)
+                        save_attempt_error(q, job.user_id, job.assignment_id, code, "error", str(e))
+                    except Exception as save_error:
+                        print(f"[attempt_jobs] failed to save error of attempt {job.query_id}: {save_error}")
+                finally:
+                    db.session.remove()
+        finally:
+            if limiter:
+                limiter.release_slot(time.monotonic() - started)
+                limiter.release_user(job.user_id)
+            if job.status_code is None:
+                job.payload = {"error": "Internal server error"}
+                job.status_code = 500
+            with self._lock:
+                self._running -= 1
+                self._stats["completed" if job.status_code < 500 else "failed"] += 1
+            job.state = "done"
+            job.finished_at = time.monotonic()
+            job.done.set()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queued": self._queued,
+                "running": self._running,
+                "results_held": len(self._jobs),
+            })
+        return stats
+
+
+def stored_result(q):
+    """Ответ по сохранённой строке Query (результат из другого процесса или
+    вытесненный из памяти) — тот же, что у синхронного POST. Возвращает (payload, http_status)."""
+    if q.status in PENDING_STATUSES:
+        return {"query_id": q.query_id, "status": q.status}, 202
+    details = q.error_json if isinstance(q.error_json, dict) else {}
+    required_method = details.get("required_method")
+    if required_method is None:
+        ctx = get_grading_context(q.assignment_id)
+        required_method = ctx.required_method if ctx is not None else None
+    if q.status == "error" or (q.status == "failed" and q.result is None):
+        msg = q.error_message or "Attempt failed"
+        return {"query_id": q.query_id, "error": msg, "error_text": msg,
+                "required_method": required_method}, 400
+    result = q.result or []
+    return {
+        "query_id": q.query_id,
+        "passed": q.status == "ok",
+        "tests": details.get("tests", []),
+        "result_sample": result[:5],
+        "truncated": details.get("truncated", False),
+        "cached": details.get("cached", False),
+        "required_method": required_method,
+        "error_text": q.error_message,
+    }, 200
+
+
+def reap_stale_attempts(older_than):
+    """Помечает ошибкой попытки, зависшие в pending/running дольше older_than секунд.
+
+    В режиме ATTEMPTS_QUEUE=memory очередь живёт только в памяти процесса: после
+    перезапуска такие строки никто не доделает, а они держат лимит попыток
+    пользователя и заставляют интерфейс опрашивать результат бесконечно.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    try:
+        # обычный SQL: на старте приложения модели ещё не все импортированы
+        n = db.session.execute(text(
+            "UPDATE queries SET status = 'error', error_message = :msg"
+            " WHERE status IN ('pending', 'running') AND created_at < :cutoff"
+        ), {"msg": "grading interrupted: service restarted", "cutoff": cutoff}).rowcount
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"[attempt_jobs] failed to reap stale attempts: {e}")
+        return 0
+    finally:
+        db.session.remove()
+    if n:
+        print(f"[attempt_jobs] marked {n} stale pending attempts as error")
+    return n
+
+
+_jobs = None
+
+
+def init_attempt_jobs(app):
+    """Создаёт пул асинхронных попыток (ATTEMPTS_ASYNC_WORKERS = 0 — выключен).
+    В режиме memory заодно закрывает попытки, брошенные прошлым запуском."""
+    global _jobs
+    # дочерние процессы пула (spawn, см. regrade) тоже создают приложение — им это не нужно
+    if multiprocessing.parent_process() is not None:
+        return _jobs
+    workers = int(app.config.get("ATTEMPTS_ASYNC_WORKERS") or 0)
+    # с очередью в Postgres попытки выполняют отдельные воркеры (worker.py)
+    if app.config.get("ATTEMPTS_QUEUE") == "postgres":
+        workers = 0
+    elif _jobs is None:
+        with app.app_context():
+            reap_stale_attempts(float(app.config.get("ATTEMPTS_RESULT_TTL", 300)))
+    if workers > 0 and _jobs is None:
+        _jobs = AttemptJobs(
+            app,
+            workers=workers,
+            queue_size=int(app.config.get("ATTEMPTS_ASYNC_QUEUE", 100)),
+            result_ttl=float(app.config.get("ATTEMPTS_RESULT_TTL", 300)),
+        )
+    return _jobs
+
+
+def get_attempt_jobs():
+    return _jobs
@@ -0,0 +1,165 @@
+"""Запись попыток в queries одной вставкой готовой строки.
+
+Синхронная попытка сохраняется один раз — уже с итоговым статусом и результатом.
+С ATTEMPTS_WRITE_BEHIND строки копятся в буфере и пишутся фоновым потоком
+многострочным INSERT (по размеру пачки или по интервалу); при остановке
+процесса, в том числе по SIGTERM (app.utils.shutdown), буфер сбрасывается. Если буфер переполнен, строка пишется сразу —
+попытки не теряются.
+"""
+import multiprocessing
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import null
+
+from app import db
+from app.models.query import Query
+from app.utils.shutdown import on_shutdown
+
+COLUMNS = ("user_id", "assignment_id", "query_text", "status", "result", "error_message",
+           "error_json", "exec_ms", "result_count", "created_at")
+
+
+def attempt_row(user_id, assignment_id, code, status, **fields):
+    """Строка queries со всеми колонками (многострочный INSERT требует одинаковых ключей)."""
+    row = dict.fromkeys(COLUMNS)
+    row.update(user_id=user_id, assignment_id=assignment_id, query_text=code,
+               status=status, created_at=datetime.utcnow())
+    row.update(fields)
+    # None в JSON-колонке записался бы как JSON 'null', а не SQL NULL
+    for key in ("result", "error_json"):
+        if row[key] is None:
+            row[key] = null()
+    return row
+
+
+def insert_rows(rows):
+    """Один INSERT ... VALUES (...), (...) в отдельной транзакции (ORM-сессия не затрагивается)."""
+    if not rows:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(Query.__table__.insert().values(list(rows)))
+
+
+class AttemptWriter:
+    def __init__(self, app, batch_size, flush_interval, max_buffer):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._stats = {"buffered": 0, "written": 0, "batches": 0, "direct": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._loop, name="attempt-writer", daemon=True)
+        self._thread.start()
+
+    def offer(self, row) -> bool:
+        """Кладёт строку в буфер; False — буфер полон или писатель остановлен."""
+        with self._cond:
+            if self._stopping or len(self._buffer) >= self.max_buffer:
+                self._stats["direct"] += 1
+                return False
+            self._buffer.append(row)
+            self._stats["buffered"] += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _take(self):
+        with self._cond:
+            batch = [self._buffer.popleft()
+                     for _ in range(min(self.batch_size, len(self._buffer)))]
+        return batch
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def flush(self):
+        """Пишет всё, что накопилось (пачками по batch_size)."""
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            with self.app.app_context():
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            insert_rows(batch)
+            with self._cond:
+                self._stats["written"] += len(batch)
+                self._stats["batches"] += 1
+            return
+        except Exception as e:
+            print(f"[attempt_writer] batch of {len(batch)} failed, retrying row by row: {e}")
+        # одна плохая строка (например, удалённый пользователь) не должна терять остальные
+        for row in batch:
+            try:
+                insert_rows([row])
+                with self._cond:
+                    self._stats["written"] += 1
+            except Exception as e:
+                with self._cond:
+                    self._stats["failed"] += 1
+                print(f"[attempt_writer] dropped attempt of user {row.get('user_id')}: {e}")
+
+    def stop(self, timeout=10.0):
+        """Останавливает поток, дописав буфер."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if self._buffer:
+            self.flush()
+
+    def metrics(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "pending": len(self._buffer),
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+                "max_buffer": self.max_buffer,
+            })
+        return stats
+
+
+_writer = None
+
+
+def persist_attempt(row):
+    """Сохраняет итоговую строку попытки: через буфер, если он включён, иначе сразу.
+    Прямая запись бросает SQLAlchemyError — вызывающий код решает, что с ней делать."""
+    if _writer is not None and _writer.offer(row):
+        return
+    insert_rows([row])
+
+
+def init_attempt_writer(app):
+    """Включает буфер записи попыток (ATTEMPTS_WRITE_BEHIND = 0 — каждая попытка пишется сразу)."""
+    global _writer
+    # дочерние процессы пула (spawn, см. regrade) тоже создают приложение — им это не нужно
+    if multiprocessing.parent_process() is not None:
+        return _writer
+    if app.config.get("ATTEMPTS_WRITE_BEHIND") and _writer is None:
+        _writer = AttemptWriter(
+            app,
+            batch_size=int(app.config.get("ATTEMPTS_WRITE_BATCH", 200)),
+            flush_interval=float(app.config.get("ATTEMPTS_WRITE_INTERVAL", 0.5)),
+            max_buffer=int(app.config.get("ATTEMPTS_WRITE_MAX_BUFFER", 10000)),
+        )
+        on_shutdown(_writer.stop)
+    return _writer
+
+
+def get_attempt_writer():
+    return _writer
@@ -1,16 +1,113 @@
+import threading
+
+import jwt
 import requests
-from flask import request, jsonify, g
+from flask import request, jsonify, g, current_app
 from functools import wraps
 
-AUTH_SERVICE_URL = "http://auth-service:5001"
+from app.utils.service_client import get_auth_client
+from app.utils.token_cache import get_token_cache, token_key
+
+# кеш наборов ключей JWKS по URL (PyJWKClient сам перечитывает набор по истечении lifespan)
+_jwks_clients = {}
+_jwks_lock = threading.Lock()
+
+
+def _jwks_client(url, ttl):
+    with _jwks_lock:
+        client = _jwks_clients.get(url)
+        if client is None:
+            client = _jwks_clients[url] = jwt.PyJWKClient(url, cache_keys=True, lifespan=ttl)
+        return client
+
+
+def decode_access_token(token):
+    """Проверяет подпись и срок действия токена, выданного auth-service
+    (generate_access_token), без обращения к auth-service.
+
+    Ключ: JWT_SECRET (HS256, общий с auth-service через конфиг) или, если задан
+    JWT_JWKS_URL, открытый ключ из набора JWKS auth-service по kid из заголовка.
+    Бросает jwt.InvalidTokenError (в т.ч. ExpiredSignatureError) и jwt.PyJWKClientError.
+    """
+    cfg = current_app.config
+    algorithms = [a.strip() for a in cfg.get("JWT_ALGORITHMS", "HS256").split(",") if a.strip()]
+    jwks_url = cfg.get("JWT_JWKS_URL")
+    if jwks_url:
+        key = _jwks_client(jwks_url, float(cfg.get("JWT_JWKS_TTL", 300))).get_signing_key_from_jwt(token).key
+    else:
+        key = cfg.get("JWT_SECRET")
+    return jwt.decode(
+        token,
+        key,
+        algorithms=algorithms,
+        leeway=float(cfg.get("JWT_LEEWAY", 0)),
+        options={"require": ["exp", "sub"]},
+    )
+
+
+def _unverified_exp(token):
+    """exp токена без проверки подписи — только чтобы ограничить срок записи в кеше."""
+    try:
+        return jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.InvalidTokenError:
+        return None
+
+
+def _remote_user(auth_header):
+    """Проверка токена через GET /auth/me.
+
+    Возвращает (user_id, is_admin, None) или (None, None, (ответ с ошибкой, можно ли его кешировать)).
+    """
+    try:
+        headers = {"Authorization": auth_header}
+        r = get_auth_client().get("/auth/me", headers=headers)
+        if r.status_code == 200:
+            data = r.json()
+            user_id = data.get("id")
+            if user_id is None:
+                return None, None, ("Invalid token (no user)", True)
+            return user_id, data.get("is_admin"), None
+    except requests.RequestException as e:
+        print(f"[core-service] token validation error: {e}")
+        return None, None, ("Auth service unreachable", False)
+    # 401/403 и прочие ответы auth-service считаем недействительным токеном
+    return None, None, ("Missing or invalid token", True)
+
+
+def _authenticate(token, auth_header):
+    """Проверяет токен (локально или через auth-service).
+
+    Возвращает запись для кеша {"user_id", "is_admin", "claims", "error"}, срок действия
+    токена и признак, можно ли кешировать результат (сбой auth-service — нельзя).
+    """
+    cfg = current_app.config
+    if cfg.get("AUTH_MODE", "local") != "remote":
+        try:
+            claims = decode_access_token(token)
+            return {"user_id": int(claims["sub"]), "is_admin": None, "claims": claims,
+                    "error": None}, claims["exp"], True
+        except jwt.ExpiredSignatureError:
+            return {"error": "Token expired"}, None, True
+        except (jwt.InvalidTokenError, jwt.PyJWKClientError, ValueError, TypeError) as e:
+            if not cfg.get("AUTH_REMOTE_FALLBACK"):
+                print(f"[core-service] invalid token: {e}")
+                return {"error": "Missing or invalid token"}, None, True
+    user_id, is_admin, failure = _remote_user(auth_header)
+    if failure is not None:
+        error, cacheable = failure
+        return {"error": error}, None, cacheable
+    return {"user_id": user_id, "is_admin": is_admin, "claims": None, "error": None}, \
+        _unverified_exp(token), True
 
 
 def token_required(f):
-    """Decorator: validate token by asking auth-service for /auth/me.
+    """Decorator: validate the bearer token and pass its user id as user_id.
 
-    Forwards the Authorization header to auth-service; if auth-service returns 200,
-    we extract `id` from its JSON and pass it as user_id to the wrapped function.
-    This keeps token secret validation centralised in auth-service.
+    By default (AUTH_MODE=local) the JWT is verified locally with the key from config,
+    so authenticated requests cost no round trip to auth-service. AUTH_MODE=remote
+    keeps the old behaviour (ask auth-service /auth/me); with AUTH_REMOTE_FALLBACK=1
+    tokens that fail local verification (e.g. during key rotation) are re-checked remotely.
+    Results are kept in the token cache (app.utils.token_cache) until the token expires.
     """
 
     @wraps(f)
@@ -18,27 +115,25 @@ def token_required(f):
         auth_header = request.headers.get("Authorization", "")
         if not auth_header or not auth_header.lower().startswith("bearer "):
             return jsonify({"error": "Missing or invalid token"}), 401
+        token = auth_header.split(" ", 1)[1].strip()
 
-        try:
-            headers = {"Authorization": auth_header}
-            r = requests.get(f"{AUTH_SERVICE_URL}/auth/me", headers=headers, timeout=5)
-            if r.status_code == 200:
-                data = r.json()
-                user_id = data.get("id")
-                if user_id is None:
-                    return jsonify({"error": "Invalid token (no user)"}), 401
-                try:
-                    g.user_id = user_id
-                except Exception:
-                    pass
-                return f(user_id, *args, **kwargs)
-            # forward 401/403 from auth-service as unauthorized
-            if r.status_code in (401, 403):
-                return jsonify({"error": "Missing or invalid token"}), 401
-        except requests.RequestException as e:
-            print(f"[core-service] token validation error: {e}")
-            return jsonify({"error": "Auth service unreachable"}), 503
-
-        return jsonify({"error": "Missing or invalid token"}), 401
+        cache = get_token_cache()
+        key = token_key(token) if cache else None
+        entry = cache.get(key) if cache else None
+        if entry is None:
+            entry, exp, cacheable = _authenticate(token, auth_header)
+            if cache and cacheable:
+                if entry["error"]:
+                    cache.put_invalid(key, entry["error"])
+                else:
+                    cache.put_valid(key, entry["user_id"], entry["claims"], entry["is_admin"], exp)
+        if entry["error"]:
+            status = 503 if entry["error"] == "Auth service unreachable" else 401
+            return jsonify({"error": entry["error"]}), status
+
+        g.user_id = entry["user_id"]
+        g.token_claims = entry["claims"]
+        g.token_is_admin = entry["is_admin"]
+        return f(entry["user_id"], *args, **kwargs)
 
     return decorated
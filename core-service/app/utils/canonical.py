@@ -0,0 +1,221 @@
+"""Каноническое представление результатов запросов и сравнение по хешам.
+
+Документ (уже нормализованный normalize_value) кодируется в стабильные байты —
+JSON с отсортированными ключами без пробелов — и хешируется. Результат целиком
+описывается списком хешей документов и общим дайджестом, поэтому проверка теста
+сводится к сравнению двух строк, а разбор несовпадения — к проходу по спискам
+хешей без глубокого сравнения структур.
+
+Режимы сравнения (compare_results), все за линейное время:
+  ordered   — те же документы в том же порядке (дайджест списка хешей);
+  unordered — те же документы в любом порядке (мультимножество хешей);
+  subset    — все ожидаемые документы есть в ответе, лишние допускаются;
+  tolerance — как ordered, но числа сравниваются с допуском.
+"""
+import hashlib
+import json
+from collections import Counter
+
+ORDERED, UNORDERED, SUBSET, TOLERANCE = "ordered", "unordered", "subset", "tolerance"
+COMPARE_MODES = (ORDERED, UNORDERED, SUBSET, TOLERANCE)
+DEFAULT_TOLERANCE = 1e-6
+
+# меняется вместе со способом кодирования — сохранённые хеши другой версии пересчитываются
+CANONICAL_VERSION = "c1"
+
+
+def canonical_bytes(value) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"),
+                      ensure_ascii=False).encode("utf-8")
+
+
+def doc_hash(value) -> str:
+    return hashlib.blake2b(canonical_bytes(value), digest_size=16).hexdigest()
+
+
+def result_digest(hashes) -> str:
+    """Дайджест упорядоченного списка хешей документов."""
+    h = hashlib.sha256()
+    for item in hashes:
+        h.update(bytes.fromhex(item))
+    return f"{CANONICAL_VERSION}:{len(hashes)}:{h.hexdigest()}"
+
+
+def multiset_digest(hashes) -> str:
+    """Дайджест, не зависящий от порядка: сумма хешей по модулю 2^128 и их число."""
+    total = 0
+    for item in hashes:
+        total += int(item, 16)
+    return f"{CANONICAL_VERSION}:m{len(hashes)}:{total % (1 << 128):032x}"
+
+
+_NUMBER = "\u0000num"
+
+
+def numeric_signature(value):
+    """(хеш структуры с числами, заменёнными меткой; числа в каноническом порядке)."""
+    numbers = []
+
+    def shape(v):
+        if isinstance(v, bool) or v is None or isinstance(v, str):
+            return v
+        if isinstance(v, (int, float)):
+            numbers.append(v)
+            return _NUMBER
+        if isinstance(v, list):
+            return [shape(x) for x in v]
+        if isinstance(v, dict):
+            return {k: shape(v[k]) for k in sorted(v)}
+        return v
+
+    return doc_hash(shape(value)), numbers
+
+
+class HashedResult:
+    """Документы результата и их хеши; сводки для режимов сравнения считаются по требованию."""
+    __slots__ = ("docs", "hashes", "_digest", "_multiset", "_signatures")
+
+    def __init__(self, docs, hashes=None, digest=None):
+        self.docs = docs
+        self.hashes = hashes if hashes is not None else [doc_hash(d) for d in docs]
+        self._digest = digest if is_current(digest) else None
+        self._multiset = None
+        self._signatures = None
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            self._digest = result_digest(self.hashes)
+        return self._digest
+
+    @property
+    def multiset(self):
+        if self._multiset is None:
+            self._multiset = multiset_digest(self.hashes)
+        return self._multiset
+
+    @property
+    def signatures(self):
+        if self._signatures is None:
+            self._signatures = [numeric_signature(d) for d in self.docs]
+        return self._signatures
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+def hash_result(value):
+    """(хеши документов, дайджест) для ожидаемого результата.
+
+    Список сравнивается поштучно; любое другое значение (объект, скаляр) не может
+    совпасть с курсором — для него хешей нет, а дайджест — хеш самого значения.
+    """
+    if isinstance(value, list):
+        hashes = [doc_hash(doc) for doc in value]
+        return hashes, result_digest(hashes)
+    return None, f"{CANONICAL_VERSION}:value:{doc_hash(value)}"
+
+
+def is_current(digest) -> bool:
+    return isinstance(digest, str) and digest.startswith(CANONICAL_VERSION + ":")
+
+
+def diff_hashes(expected, actual, limit=5) -> dict:
+    """Разница двух результатов по спискам хешей.
+
+    first_mismatch_index — первая позиция, где результаты расходятся (проход
+    останавливается на ней); missing/extra — индексы ожидаемых документов,
+    которых нет в ответе, и лишних документов ответа (как мультимножества),
+    не больше limit каждого.
+    """
+    first = None
+    for i, (e, a) in enumerate(zip(expected, actual)):
+        if e != a:
+            first = i
+            break
+    if first is None and len(expected) != len(actual):
+        first = min(len(expected), len(actual))
+
+    surplus = Counter(actual)
+    surplus.subtract(expected)
+    missing_left = Counter({h: -n for h, n in surplus.items() if n < 0})
+    extra_left = Counter({h: n for h, n in surplus.items() if n > 0})
+    missing_count = sum(missing_left.values())
+    extra_count = sum(extra_left.values())
+
+    missing, extra = [], []
+    for i, h in enumerate(expected):
+        if len(missing) >= limit:
+            break
+        if missing_left[h] > 0:
+            missing_left[h] -= 1
+            missing.append(i)
+    # лишними считаем последние вхождения повторяющихся документов
+    for i in range(len(actual) - 1, -1, -1):
+        if len(extra) >= limit:
+            break
+        if extra_left[actual[i]] > 0:
+            extra_left[actual[i]] -= 1
+            extra.append(i)
+    extra.reverse()
+
+    return {
+        "first_mismatch_index": first,
+        "missing": missing,
+        "extra": extra,
+        "missing_count": missing_count,
+        "extra_count": extra_count,
+    }
+
+
+def _within(expected_sig, actual_sig, tolerance):
+    (e_shape, e_nums), (a_shape, a_nums) = expected_sig, actual_sig
+    if e_shape != a_shape:
+        return False
+    return all(abs(e - a) <= tolerance for e, a in zip(e_nums, a_nums))
+
+
+def _tolerance_diff(expected, actual, tolerance, limit):
+    """Поэлементное сравнение с допуском: несовпавшие позиции — недостающие/лишние."""
+    e_sigs, a_sigs = expected.signatures, actual.signatures
+    bad = [i for i, (e, a) in enumerate(zip(e_sigs, a_sigs)) if not _within(e, a, tolerance)]
+    common = min(len(e_sigs), len(a_sigs))
+    missing = bad + list(range(common, len(e_sigs)))
+    extra = bad + list(range(common, len(a_sigs)))
+    if not missing and not extra:
+        return None
+    return {
+        "first_mismatch_index": (bad or [common])[0],
+        "missing": missing[:limit],
+        "extra": extra[:limit],
+        "missing_count": len(missing),
+        "extra_count": len(extra),
+    }
+
+
+def compare_results(expected, actual, mode=ORDERED, tolerance=None, limit=5):
+    """Сравнивает HashedResult по режиму; None — совпадают, иначе разбор как у diff_hashes."""
+    if mode == UNORDERED:
+        if expected.multiset == actual.multiset:
+            return None
+        diff = diff_hashes(expected.hashes, actual.hashes, limit)
+        diff["first_mismatch_index"] = None
+        return diff
+    if mode == SUBSET:
+        if len(expected) <= len(actual):
+            present = Counter(actual.hashes)
+            present.subtract(expected.hashes)
+            if min(present.values(), default=0) >= 0:
+                return None
+        diff = diff_hashes(expected.hashes, actual.hashes, limit)
+        diff.update(first_mismatch_index=None, extra=[], extra_count=0)
+        return diff
+    if mode == TOLERANCE:
+        # точное совпадение проверяется дайджестом, допуск — только если он нужен
+        if expected.digest == actual.digest:
+            return None
+        return _tolerance_diff(expected, actual,
+                               DEFAULT_TOLERANCE if tolerance is None else tolerance, limit)
+    if expected.digest == actual.digest:
+        return None
+    return diff_hashes(expected.hashes, actual.hashes, limit)
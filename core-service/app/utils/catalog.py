@@ -0,0 +1,110 @@
+"""Каталог коллекций учебной базы: имена, число документов и примеры.
+
+Нужен для диагностики пустых результатов («коллекции нет» / «в ней вот такие
+документы»). Строится один раз через PyMongo и живёт, пока не сменится версия
+набора данных (app.utils.dataset) или не истечёт CATALOG_TTL.
+"""
+import threading
+import time
+
+from app import mongo
+from app.utils.dataset import META_COLLECTION, dataset_version
+
+
+class CollectionCatalog:
+    def __init__(self, ttl: float, sample_size: int = 5, max_time_ms: int = 2000):
+        self.ttl = ttl
+        self.sample_size = sample_size
+        self.max_time_ms = max_time_ms
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._stats = {"hits": 0, "builds": 0, "last_build_ms": None}
+
+    def _fresh(self, snap, version):
+        return (snap is not None and snap["version"] == version
+                and time.monotonic() < snap["expires"])
+
+    def snapshot(self, database=None) -> dict:
+        """{"version", "collections": {name: {"count", "sample"}}} — из кеша или заново."""
+        version = dataset_version()
+        with self._lock:
+            snap = self._snapshot
+            if self._fresh(snap, version):
+                self._stats["hits"] += 1
+                return snap
+        # строит один поток, остальные ждут его результата
+        with self._build_lock:
+            with self._lock:
+                snap = self._snapshot
+                if self._fresh(snap, version):
+                    self._stats["hits"] += 1
+                    return snap
+            snap = self._build(database if database is not None else mongo.db, version)
+            with self._lock:
+                self._snapshot = snap
+            return snap
+
+    def _build(self, database, version):
+        started = time.monotonic()
+        collections = {}
+        for name in sorted(database.list_collection_names()):
+            if name == META_COLLECTION or name.startswith("system."):
+                continue
+            coll = database[name]
+            collections[name] = {
+                "count": coll.estimated_document_count(maxTimeMS=self.max_time_ms),
+                "sample": list(coll.find({}).limit(self.sample_size).max_time_ms(self.max_time_ms)),
+            }
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats["builds"] += 1
+            self._stats["last_build_ms"] = round(elapsed * 1000, 1)
+        return {"version": version, "expires": time.monotonic() + self.ttl,
+                "collections": collections}
+
+    def diagnose(self, collection: str, transform=None) -> dict:
+        """Диагностика для пустого результата запроса к collection."""
+        snap = self.snapshot()
+        info = snap["collections"].get(collection)
+        sample = info["sample"] if info else []
+        if transform is not None:
+            sample = [transform(doc) for doc in sample]
+        return {
+            "collection": collection,
+            "exists": info is not None,
+            "count": info["count"] if info else 0,
+            "sample": sample,
+            "collections": list(snap["collections"]),
+        }
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            snap = self._snapshot
+        stats.update({
+            "ttl": self.ttl,
+            "version": snap["version"] if snap else None,
+            "collections": len(snap["collections"]) if snap else 0,
+        })
+        return stats
+
+
+_catalog = None
+
+
+def init_catalog(app):
+    """Создаёт каталог коллекций (CATALOG_TTL = 0 — диагностика выключена)."""
+    global _catalog
+    ttl = float(app.config.get("CATALOG_TTL") or 0)
+    if ttl > 0 and _catalog is None:
+        _catalog = CollectionCatalog(ttl, int(app.config.get("CATALOG_SAMPLE_SIZE", 5)))
+    return _catalog
+
+
+def get_catalog():
+    return _catalog
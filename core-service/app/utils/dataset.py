@@ -0,0 +1,55 @@
+"""Версия учебного набора данных в MongoDB.
+
+Версия складывается из DATASET_VERSION (конфиг) и метки в служебной коллекции
+`_dataset_meta` ({_id: "version"}), которую обновляют скрипты заливки данных или
+POST /admin/dataset/reseeded. Значение кешируется на DATASET_VERSION_TTL секунд,
+поэтому после перезаливки все процессы сервиса увидят новую версию не позже TTL.
+"""
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from pymongo.errors import PyMongoError
+
+from app import mongo
+
+META_COLLECTION = "_dataset_meta"
+
+_lock = threading.Lock()
+_cached = {"value": None, "expires": 0.0}
+
+
+def dataset_version() -> str:
+    now = time.monotonic()
+    with _lock:
+        if _cached["value"] is not None and now < _cached["expires"]:
+            return _cached["value"]
+
+    stamp = None
+    try:
+        doc = mongo.db[META_COLLECTION].find_one({"_id": "version"})
+        stamp = doc.get("version") if doc else None
+    except PyMongoError as e:
+        print(f"[dataset] failed to read dataset version: {e}")
+        with _lock:
+            if _cached["value"] is not None:
+                return _cached["value"]
+
+    value = f"{current_app.config.get('DATASET_VERSION', '1')}:{stamp or 0}"
+    with _lock:
+        _cached["value"] = value
+        _cached["expires"] = now + float(current_app.config.get("DATASET_VERSION_TTL", 5))
+    return value
+
+
+def bump_dataset_version() -> str:
+    """Отмечает перезаливку данных: новая метка версии в Mongo и сброс локального кеша."""
+    stamp = datetime.utcnow().isoformat()
+    mongo.db[META_COLLECTION].update_one(
+        {"_id": "version"}, {"$set": {"version": stamp}}, upsert=True
+    )
+    with _lock:
+        _cached["value"] = None
+        _cached["expires"] = 0.0
+    return dataset_version()
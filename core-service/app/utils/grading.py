@@ -0,0 +1,387 @@
+"""Проверка решений: выполнение запроса студента и сравнение с тестами задания.
+
+grade_attempt не зависит от HTTP-запроса и используется как синхронным
+обработчиком POST /assignments/<id>/attempts, так и фоновым выполнением.
+"""
+from flask import current_app
+from app import db
+from app.utils.mongosh_pool import get_pool, run_once, MongoshResult, MongoshWorkerError
+from app.utils.query_engine import execute_native, has_write_stage
+from app.utils.result_cache import get_result_cache, query_fingerprint
+from app.utils.dataset import dataset_version
+from app.utils.catalog import get_catalog
+from app.utils.grading_context import get_grading_context
+from app.utils.attempt_writer import attempt_row, persist_attempt, insert_rows
+from app.utils.canonical import doc_hash, HashedResult, compare_results, SUBSET, TOLERANCE
+from app.utils.shell_parser import ShellParseError
+from bson import ObjectId, Binary, Regex, Timestamp, MinKey, MaxKey
+from bson.decimal128 import Decimal128
+from pymongo.errors import PyMongoError, ExecutionTimeout
+from datetime import datetime
+import base64, re, subprocess, uuid
+from sqlalchemy.exc import SQLAlchemyError, NoReferencedTableError, ProgrammingError
+
+
+def _safe_rollback():
+    """Rollback session if possible, swallow errors to avoid SAWarning when
+    session state is not active.
+    """
+    try:
+        # Only rollback if there is an active transaction; otherwise removing the session
+        # is safer (rollback on non-active transaction emits SAWarning).
+        try:
+            in_tx = False
+            if hasattr(db.session, 'in_transaction'):
+                # SQLAlchemy 1.4+: in_transaction() returns a Transaction or None
+                in_tx = bool(db.session.in_transaction())
+            elif hasattr(db.session, 'get_transaction'):
+                in_tx = bool(db.session.get_transaction())
+        except Exception:
+            in_tx = False
+
+        if in_tx:
+            db.session.rollback()
+        else:
+            try:
+                db.session.remove()
+            except Exception:
+                pass
+    except Exception:
+        # best-effort cleanup
+        try:
+            db.session.remove()
+        except Exception:
+            pass
+
+def save_attempt_error(q, user_id, assignment_id, code, status, msg, error_json=None):
+    """Save failed/errored attempt: update the Query row of an async attempt if given,
+    otherwise insert the final row once. DB errors are swallowed (best-effort)."""
+    try:
+        if q is None:
+            persist_attempt(attempt_row(user_id, assignment_id, code, status,
+                                        error_message=msg, error_json=error_json))
+            return
+        q.status = status
+        q.error_message = msg
+        if error_json is not None:
+            q.error_json = error_json
+        db.session.add(q)
+        db.session.commit()
+    except SQLAlchemyError:
+        _safe_rollback()
+
+MAX_DOCS = 200               # больше документов не читаем (результат помечается truncated)
+MAX_TIME_MS = 3000            # maxTimeMS для find/aggregate внутри Mongo
+MONGOSH_TIMEOUT = 5           # секунд на выполнение mongosh
+MAX_OUTPUT_BYTES = 2_000_000  # бюджет по байтам: дальше вывод mongosh не читаем
+
+# Разрешаем только чтение: find / aggregate (+ sort/limit цепочки)
+ALLOWED_SHELL = re.compile(
+    r"""^\s*db\.(?P<coll>[A-Za-z0-9_]+)\.(?P<op>find|aggregate)\s*\([\s\S]*?\)\s*(\.\s*(sort|limit)\s*\([\s\S]*?\)\s*)*;?\s*$""",
+    re.IGNORECASE,
+)
+
+def normalize_value(v):
+    if isinstance(v, ObjectId):
+        return str(v)
+    if isinstance(v, datetime):
+        # тот же формат, что у Date.toJSON() в mongosh
+        return v.strftime("%Y-%m-%dT%H:%M:%S.") + f"{v.microsecond // 1000:03d}Z"
+    if isinstance(v, Decimal128):
+        return {"$numberDecimal": str(v)}
+    # остальные BSON-типы — в том виде, в каком их отдаёт JSON.stringify в mongosh
+    if isinstance(v, (bytes, Binary)):
+        return base64.b64encode(bytes(v)).decode("ascii")
+    if isinstance(v, uuid.UUID):
+        return base64.b64encode(v.bytes).decode("ascii")
+    if isinstance(v, Timestamp):
+        return {"$timestamp": str((v.time << 32) | v.inc)}
+    if isinstance(v, (Regex, re.Pattern)):
+        return {}  # драйвер Node отдаёт RegExp, а JSON.stringify(RegExp) — {}
+    if isinstance(v, MinKey):
+        return {"$minKey": 1}
+    if isinstance(v, MaxKey):
+        return {"$maxKey": 1}
+    if isinstance(v, float) and v.is_integer():
+        # double 5.0 из PyMongo и 5 из JSON mongosh — одно и то же значение
+        return int(v)
+    if isinstance(v, list):
+        return [normalize_value(x) for x in v]
+    if isinstance(v, dict):
+        # порядок ключей не важен: канонические байты (app.utils.canonical) сортируют их сами
+        return {k: normalize_value(x) for k, x in v.items()}
+    return v
+
+def normalize_docs(docs):
+    return [normalize_value(doc) for doc in docs[:MAX_DOCS]]
+
+def normalize_hashed(doc):
+    """transform для чтения курсора: (нормализованный документ, его хеш)."""
+    doc = normalize_value(doc)
+    return doc, doc_hash(doc)
+
+def _run_mongosh(code: str, mongo_uri: str) -> MongoshResult:
+    """
+    Выполняет код на прогретом воркере из пула, если пул включён;
+    при сбое воркера (или без пула) — разовым запуском mongosh.
+    Документы читаются потоком, нормализуются и хешируются по мере поступления.
+    """
+    pool = get_pool()
+    if pool is not None:
+        try:
+            return pool.run(code, MONGOSH_TIMEOUT, MAX_DOCS, MAX_TIME_MS, transform=normalize_hashed)
+        except MongoshWorkerError as e:
+            print(f"[grading] mongosh worker failed, falling back to subprocess: {e}")
+    return run_once(code, mongo_uri, MONGOSH_TIMEOUT, MAX_DOCS, MAX_TIME_MS,
+                    max_bytes=MAX_OUTPUT_BYTES, transform=normalize_hashed)
+
+
+def _describe_diff(diff, expected, actual, mode):
+    """Поля разбора непрошедшего теста: причина, первая позиция расхождения,
+    недостающие и лишние документы (по несколько штук)."""
+    first = diff["first_mismatch_index"]
+    if mode == SUBSET:
+        reason = f"{diff['missing_count']} expected docs missing from the result"
+    elif len(expected) != len(actual):
+        reason = f"expected {len(expected)} docs, got {len(actual)}"
+    elif not diff["missing_count"] and not diff["extra_count"]:
+        reason = f"documents are in a different order (first difference at index {first})"
+    elif mode == TOLERANCE:
+        reason = f"values differ beyond tolerance (first difference at index {first})"
+    elif first is None:
+        reason = (f"{diff['missing_count']} expected docs missing, "
+                  f"{diff['extra_count']} unexpected")
+    else:
+        reason = (f"first difference at index {first}: {diff['missing_count']} expected "
+                  f"docs missing, {diff['extra_count']} unexpected")
+    return {
+        "failure_reason": reason,
+        "first_mismatch_index": first,
+        "expected_count": len(expected),
+        "actual_count": len(actual),
+        "missing_count": diff["missing_count"],
+        "extra_count": diff["extra_count"],
+        "missing": [{"index": i, "doc": expected[i]} for i in diff["missing"]],
+        "extra": [{"index": i, "doc": actual[i]} for i in diff["extra"]],
+    }
+
+
+def run_tests(tests, normalized, hashes=None):
+    """Проверяет результат тестами задания (GradingTest).
+
+    Возвращает (все ли прошли, разбор по тестам для интерфейса, error_text —
+    причины непрошедших тестов или None). Используется и перепроверкой (regrade).
+    """
+    actual = HashedResult(normalized, hashes)
+    all_passed, test_results = True, []
+    failure_reasons = []
+    for t in tests:
+        diff = None
+        if t.expected is not None:
+            diff = compare_results(t.expected, actual, t.mode, t.tolerance)
+        passed = t.expected is not None and diff is None
+        all_passed &= passed
+
+        # build detailed result for UI
+        tr = {
+            "test_id": t.test_id,
+            "description": t.description,
+            "compare_mode": t.mode,
+            "passed": passed
+        }
+        if not passed:
+            if t.expected is None:
+                reason = "expected value mismatch"
+                tr["failure_reason"] = reason
+            else:
+                tr.update(_describe_diff(diff, t.expected.docs, normalized, t.mode))
+                reason = tr["failure_reason"]
+            failure_reasons.append(f"Test {t.test_id}: {reason}")
+
+        test_results.append(tr)
+
+    # build top-level error_text when tests failed to help user
+    error_text = None
+    if not all_passed:
+        error_text = "; ".join(failure_reasons) if failure_reasons else None
+    return all_passed, test_results, error_text
+
+
+def grade_attempt(user_id, assignment_id, code, q=None):
+    """Выполняет решение и проверяет его тестами задания.
+
+    Код уже должен пройти ALLOWED_SHELL; стадии записи ($out / $merge) отклоняются
+    с 400. Возвращает (payload, http_status); попытка сохраняется в queries
+    (в переданную строку q, если она есть).
+    """
+    # assignment, parsed config, method check and decoded tests — cached per assignment
+    ctx = get_grading_context(assignment_id)
+    if ctx is None:
+        return {"error": "Assignment not found"}, 404
+    required_method = ctx.required_method
+    if has_write_stage(code):
+        msg = "$out and $merge stages are not allowed: the training database is read-only"
+        save_attempt_error(q, user_id, assignment_id, code, "failed", msg)
+        return {"error": msg, "error_text": msg, "required_method": required_method}, 400
+    if ctx.has_reference_query and ctx.reference_version != dataset_version():
+        # данные перезалиты (или прошлый пересчёт не удался) — эталон пересчитается
+        # в фоне, пока проверяем по прежнему
+        from app.utils.reference import get_reference_refresher
+        refresher = get_reference_refresher()
+        if refresher is not None:
+            refresher.trigger()
+
+    # Synchronous attempts are persisted once, with their final status (see attempt_writer);
+    # asynchronous submissions pass the row created at submit time and update it
+
+    if not ctx.uses_required_method(code):
+        # save failed attempt with reason (update existing q if present)
+        msg = f"Submission must use {required_method}() as required by the assignment"
+        save_attempt_error(q, user_id, assignment_id, code, "failed", msg)
+        return {"error": msg, "error_text": msg, "required_method": required_method}, 400
+
+    mongo_uri = current_app.config.get("MONGO_URI")
+    if not mongo_uri or "/" not in mongo_uri.strip("/"):
+        return {"error": "MONGO_URI must include database name, e.g. mongodb://mongo:27017/mongo_train"}, 500
+
+    started = datetime.utcnow()
+    normalized = hashes = None
+    truncated = False
+
+    # одинаковый запрос на той же версии данных даёт тот же результат
+    cache = get_result_cache()
+    cache_key = cached = None
+    if cache is not None:
+        fingerprint = query_fingerprint(code)
+        if fingerprint:
+            cache_key = (fingerprint, dataset_version())
+            cached = cache.get(cache_key)
+            if cached is not None:
+                normalized, hashes, truncated = cached
+
+    if normalized is None and current_app.config.get("QUERY_ENGINE") == "native":
+        try:
+            docs = execute_native(code, max_docs=MAX_DOCS, max_time_ms=MAX_TIME_MS,
+                                  transform=normalize_hashed)
+            # движок читает не больше MAX_DOCS + 1 документов: лишний означает усечение
+            truncated = len(docs) > MAX_DOCS
+            normalized = [d for d, _ in docs[:MAX_DOCS]]
+            hashes = [h for _, h in docs[:MAX_DOCS]]
+        except (ShellParseError, TypeError):
+            # синтаксис не поддерживается (или тип значения не сериализуется) — выполняем через mongosh
+            normalized = None
+        except ExecutionTimeout:
+            save_attempt_error(q, user_id, assignment_id, code, "error", "query exceeded time limit")
+            return {"error": f"Query exceeded time limit ({MAX_TIME_MS} ms)"}, 504
+        except PyMongoError as e:
+            details = getattr(e, "details", None) or {}
+            msg = details.get("errmsg") or str(e)
+            save_attempt_error(q, user_id, assignment_id, code, "error", msg)
+            return {"error": msg, "error_text": msg, "required_method": required_method}, 400
+
+    if normalized is None:
+        try:
+            res = _run_mongosh(code, mongo_uri)
+        except subprocess.TimeoutExpired:
+            save_attempt_error(q, user_id, assignment_id, code, "error", "mongosh timed out")
+            return {"error": "Mongo shell timed out"}, 504
+        except FileNotFoundError:
+            return {"error": "mongosh not found. Install mongosh in your container/image."}, 500
+        except ValueError as e:
+            msg = f"Invalid mongosh JSON output: {e}"
+            save_attempt_error(q, user_id, assignment_id, code, "error", msg)
+            return {"error": msg}, 500
+
+        if res.rc != 0:
+            # Prefer structured error from our JS wrapper, fallback to other mongosh output
+            msg = res.error or res.noise or "Unknown mongosh error"
+            save_attempt_error(q, user_id, assignment_id, code, "error", msg,
+                                error_json={"stderr": res.noise})
+            return {"error": msg, "error_text": msg, "required_method": required_method}, 400
+
+        # документы уже нормализованы и захешированы при чтении; лишний (MAX_DOCS + 1) отбрасываем
+        truncated = res.truncated
+        normalized = [d for d, _ in res.docs[:MAX_DOCS]]
+        hashes = [h for _, h in res.docs[:MAX_DOCS]]
+
+    exec_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
+    if cache_key is not None and cached is None:
+        cache.put(cache_key, (normalized, hashes, truncated))
+
+    # diagnostics: if result is empty, show what the collection actually holds
+    # (from the cached collection catalog, without running another query)
+    diag = None
+    match = ALLOWED_SHELL.match(code)
+    coll_name = match.group('coll') if match else None
+    catalog = get_catalog()
+    if coll_name and len(normalized) == 0 and catalog is not None:
+        try:
+            diag = catalog.diagnose(coll_name, transform=normalize_value)
+        except PyMongoError as e:
+            diag = {"collection": coll_name, "error": "diag-failed", "details": str(e)}
+
+    # каждый тест — сравнение дайджестов в его режиме; при несовпадении разбор по хешам.
+    # Результат сравнивается после чтения, а не с досрочным выходом на первом
+    # расхождении: он же кладётся в кеш результатов (общий для всех заданий),
+    # сохраняется в queries и нужен для списка недостающих/лишних документов,
+    # а само чтение и так ограничено MAX_DOCS + 1 документами на стороне сервера.
+    all_passed, test_results, error_text = run_tests(ctx.all_tests, normalized, hashes)
+    # разбор тестов хранится в строке, чтобы ответ можно было собрать из БД
+    # (асинхронные попытки, другой процесс) — см. attempt_jobs.stored_result
+    details = {"tests": test_results, "truncated": truncated, "cached": cached is not None,
+               "required_method": required_method, "diagnostics": diag}
+
+    # Update the async attempt's Query row if present, otherwise insert the final row once
+    status = "ok" if all_passed else "failed"
+    row = None
+    try:
+        if q:
+            q.status = status
+            q.result = normalized
+            q.exec_ms = exec_ms
+            q.result_count = len(normalized)
+            q.error_message = error_text
+            q.error_json = details
+            db.session.add(q)
+            db.session.commit()
+        else:
+            row = attempt_row(user_id, assignment_id, code, status, result=normalized,
+                              exec_ms=exec_ms, result_count=len(normalized),
+                              error_message=error_text, error_json=details)
+            persist_attempt(row)
+    except (NoReferencedTableError, ProgrammingError) as e:
+        # FK / table missing: DB schema not initialized or broken. Log and return success result to user
+        print(f"[grading] DB schema issue saving query result: {e}")
+        # try to persist a minimal Query without FK fields if possible
+        try:
+            if q:
+                q.user_id = None
+                db.session.add(q)
+                db.session.commit()
+            else:
+                insert_rows([dict(row, user_id=None)])
+        except Exception:
+            _safe_rollback()
+        return {
+            "passed": all_passed,
+            "tests": test_results,
+            "result_sample": normalized[:5],
+            "truncated": truncated,
+            "cached": cached is not None,
+            "warning": "Database schema not initialized; query result not fully saved",
+            "error_text": error_text,
+            "required_method": required_method
+        }, 200
+    except SQLAlchemyError as e:
+        _safe_rollback()
+        return {"error": "Database error saving query result", "details": str(e)}, 500
+
+    return {
+        "passed": all_passed,
+        "tests": test_results,
+        "result_sample": normalized[:5],
+        "truncated": truncated,
+        "cached": cached is not None,
+        "required_method": required_method,
+        "error_text": error_text
+    }, 200
@@ -0,0 +1,245 @@
+"""Контекст проверки задания: всё, что нужно grade_attempt, кроме самого запроса.
+
+Задание, разобранный schema_json, скомпилированная проверка required_method и
+декодированные ожидаемые результаты тестов собираются один раз и кешируются в
+процессе. Запись задания (create_assignment / update_assignment) сбрасывает
+контекст; GRADING_CONTEXT_TTL ограничивает устаревание в других процессах.
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import selectinload
+
+from app.models.assignment import Assignment
+from app.utils.canonical import (
+    hash_result, is_current, HashedResult, COMPARE_MODES, ORDERED,
+)
+
+# reference_error, который не мешает использовать эталон
+REFERENCE_TRUNCATED = "result truncated"
+
+
+class GradingTest:
+    """expected — HashedResult ожидаемых документов (None, если ожидается не список)."""
+    __slots__ = ("test_id", "description", "expected", "mode", "tolerance")
+
+    def __init__(self, test_id, description, expected, mode, tolerance):
+        self.test_id = test_id
+        self.description = description
+        self.expected = expected
+        self.mode = mode
+        self.tolerance = tolerance
+
+
+class GradingContext:
+    """tests — тесты задания; reference — тест по результату эталонного решения
+    (None, если эталона нет, он не посчитан или последний пересчёт не удался);
+    reference_version — версия данных, на которой эталон посчитан в последний раз."""
+    __slots__ = ("assignment_id", "topic_id", "title", "config", "required_method",
+                 "method_re", "tests", "reference", "reference_version", "has_reference_query")
+
+    def __init__(self, assignment_id, topic_id, title, config, required_method, method_re, tests,
+                 reference=None, reference_version=None, has_reference_query=False):
+        self.assignment_id = assignment_id
+        self.topic_id = topic_id
+        self.title = title
+        self.config = config
+        self.required_method = required_method
+        self.method_re = method_re
+        self.tests = tests
+        self.reference = reference
+        self.reference_version = reference_version
+        self.has_reference_query = has_reference_query
+
+    @property
+    def all_tests(self):
+        return self.tests + (self.reference,) if self.reference is not None else self.tests
+
+    def uses_required_method(self, code: str) -> bool:
+        if not self.required_method:
+            return True
+        return bool(self.method_re and self.method_re.search(code))
+
+
+def parse_config(schema_json) -> dict:
+    """schema_json задания как dict (может храниться строкой JSON)."""
+    if isinstance(schema_json, dict):
+        return schema_json
+    if isinstance(schema_json, str) and schema_json:
+        try:
+            conf = json.loads(schema_json)
+        except ValueError:
+            return {}
+        return conf if isinstance(conf, dict) else {}
+    return {}
+
+
+def decode_expected(expected):
+    """expected_result теста как значение (может храниться строкой JSON), нормализованное
+    так же, как результат запроса."""
+    from app.utils.grading import normalize_value  # grading импортирует этот модуль
+
+    if isinstance(expected, str):
+        try:
+            expected = json.loads(expected)
+        except ValueError:
+            return {"_raw": expected}
+    return normalize_value(expected)
+
+
+def expected_fingerprint(expected_result):
+    """(хеши документов, дайджест) ожидаемого результата — сохраняются вместе с тестом."""
+    return hash_result(decode_expected(expected_result))
+
+
+def compare_settings(mode, tolerance):
+    """Проверяет режим сравнения и допуск из тела запроса; ValueError — некорректны."""
+    if mode is not None and mode not in COMPARE_MODES:
+        raise ValueError(f"compare_mode must be one of: {', '.join(COMPARE_MODES)}")
+    if tolerance is not None:
+        try:
+            tolerance = float(tolerance)
+        except (TypeError, ValueError):
+            raise ValueError("tolerance must be a number")
+        if tolerance < 0:
+            raise ValueError("tolerance must be non-negative")
+    return mode, tolerance
+
+
+def _resolve_mode(mode, tolerance, config):
+    # режим теста важнее режима задания (schema_json.compare_mode)
+    mode = mode or config.get("compare_mode") or ORDERED
+    if mode not in COMPARE_MODES:
+        mode = ORDERED
+    tolerance = tolerance if tolerance is not None else config.get("tolerance")
+    try:
+        tolerance = float(tolerance) if tolerance is not None else None
+    except (TypeError, ValueError):
+        tolerance = None
+    return mode, tolerance
+
+
+def _grading_test(t, config):
+    expected = decode_expected(t.expected_result)
+    mode, tolerance = _resolve_mode(t.compare_mode, t.tolerance, config)
+    if not isinstance(expected, list):
+        return GradingTest(t.test_id, t.test_description, None, mode, tolerance)
+    hashes, digest = t.expected_hashes, t.expected_digest
+    if not is_current(digest) or not isinstance(hashes, list) or len(hashes) != len(expected):
+        # тест записан до появления хешей или другой версией кодирования
+        hashes, digest = hash_result(expected)
+    return GradingTest(t.test_id, t.test_description, HashedResult(expected, hashes, digest),
+                       mode, tolerance)
+
+
+def build_context(assignment_id):
+    """Загружает задание вместе с тестами; None — задания нет."""
+    a = (Assignment.query.options(selectinload(Assignment.tests))
+         .filter_by(assignment_id=assignment_id).first())
+    if a is None:
+        return None
+    config = parse_config(a.schema_json)
+    required_method = config.get("required_method") or None
+    method_re = None
+    if required_method:
+        # a dot + method name + opening parenthesis, spaces allowed, case-insensitive
+        try:
+            method_re = re.compile(rf"\.\s*{re.escape(str(required_method))}\s*\(", re.IGNORECASE)
+        except re.error:
+            method_re = None
+    tests = tuple(_grading_test(t, config) for t in sorted(a.tests, key=lambda t: t.test_id))
+
+    reference = None
+    # эталон, который не удалось пересчитать, не используем: он от других данных
+    reference_failed = bool(a.reference_error) and a.reference_error != REFERENCE_TRUNCATED
+    if a.reference_query and isinstance(a.reference_result, list) and not reference_failed:
+        mode, tolerance = _resolve_mode(None, None, config)
+        reference = GradingTest(
+            "reference", "Результат совпадает с эталонным решением",
+            HashedResult(a.reference_result, a.reference_hashes
+                         if isinstance(a.reference_hashes, list)
+                         and len(a.reference_hashes) == len(a.reference_result) else None,
+                         a.reference_digest),
+            mode, tolerance,
+        )
+    return GradingContext(a.assignment_id, a.topic_id, a.title, config,
+                          required_method, method_re, tests,
+                          reference, a.reference_version if a.reference_query else None,
+                          bool(a.reference_query))
+
+
+class GradingContextCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, assignment_id):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(assignment_id)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(assignment_id)
+                self._stats["hits"] += 1
+                return item[1]
+            self._stats["misses"] += 1
+        ctx = build_context(assignment_id)
+        if ctx is not None:
+            with self._lock:
+                self._data[assignment_id] = (time.monotonic() + self.ttl, ctx)
+                self._data.move_to_end(assignment_id)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+        return ctx
+
+    def invalidate(self, assignment_id=None):
+        with self._lock:
+            if assignment_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(assignment_id, None)
+            self._stats["invalidations"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "ttl": self.ttl,
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+        })
+        return stats
+
+
+_cache = None
+
+
+def init_grading_context(app):
+    """Создаёт кеш контекстов (GRADING_CONTEXT_SIZE = 0 — собирать на каждую попытку)."""
+    global _cache
+    size = int(app.config.get("GRADING_CONTEXT_SIZE") or 0)
+    if size > 0 and _cache is None:
+        _cache = GradingContextCache(size, float(app.config.get("GRADING_CONTEXT_TTL", 60)))
+    return _cache
+
+
+def get_grading_context(assignment_id):
+    """Контекст проверки задания (из кеша, если он включён) или None."""
+    if _cache is None:
+        return build_context(assignment_id)
+    return _cache.get(assignment_id)
+
+
+def invalidate_grading_context(assignment_id=None):
+    if _cache is not None:
+        _cache.invalidate(assignment_id)
+
+
+def get_grading_context_cache():
+    return _cache
@@ -0,0 +1,152 @@
+"""Очередь проверки попыток в Postgres (таблица grading_jobs).
+
+Задания забираются через FOR UPDATE SKIP LOCKED, поэтому любое число воркеров
+(worker.py) на разных машинах разбирает очередь без двойной обработки. Забранное
+задание «невидимо» для остальных до locked_until (visibility timeout); воркер
+продлевает аренду, пока выполняет его. Если воркер упал, аренда истекает и
+задание забирает другой. Ошибки повторяются с экспоненциальной задержкой, после
+max_attempts задание переводится в dead (dead-letter) и попытка помечается error.
+"""
+import random
+
+from sqlalchemy import text
+
+from app import db
+from app.models.grading_job import GradingJob
+
+QUEUED, RUNNING, DONE, DEAD = "queued", "running", "done", "dead"
+
+_CLAIM_SQL = text("""
+    UPDATE grading_jobs AS j
+       SET status = 'running',
+           attempts = j.attempts + 1,
+           locked_by = :worker,
+           locked_until = now() + make_interval(secs => :visibility),
+           updated_at = now()
+     WHERE j.job_id IN (
+            SELECT job_id FROM grading_jobs
+             WHERE (status = 'queued' AND run_after <= now())
+                OR (status = 'running' AND locked_until < now() AND attempts < max_attempts)
+             ORDER BY run_after, job_id
+             LIMIT :limit
+             FOR UPDATE SKIP LOCKED)
+    RETURNING j.job_id, j.query_id, j.attempts, j.max_attempts
+""")
+
+# аренда истекла, а попыток не осталось — воркер падал на этом задании
+_REAP_SQL = text("""
+    UPDATE grading_jobs
+       SET status = 'dead', locked_by = NULL, locked_until = NULL, updated_at = now(),
+           last_error = coalesce(last_error, 'visibility timeout expired')
+     WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts
+    RETURNING query_id
+""")
+
+_EXTEND_SQL = text("""
+    UPDATE grading_jobs
+       SET locked_until = now() + make_interval(secs => :visibility)
+     WHERE job_id = ANY(:ids) AND locked_by = :worker AND status = 'running'
+""")
+
+_DONE_SQL = text("""
+    UPDATE grading_jobs
+       SET status = 'done', locked_by = NULL, locked_until = NULL, updated_at = now()
+     WHERE job_id = :job_id AND locked_by = :worker
+""")
+
+_RETRY_SQL = text("""
+    UPDATE grading_jobs
+       SET status = 'queued', locked_by = NULL, locked_until = NULL, updated_at = now(),
+           run_after = now() + make_interval(secs => :delay), last_error = :error
+     WHERE job_id = :job_id AND locked_by = :worker
+""")
+
+# попытка так и не проверена — показываем пользователю ошибку вместо вечного pending
+_ABANDON_SQL = text("""
+    UPDATE queries
+       SET status = 'error', error_message = :error
+     WHERE query_id = ANY(:ids) AND status IN ('pending', 'running')
+""")
+
+_DEAD_SQL = text("""
+    UPDATE grading_jobs
+       SET status = 'dead', locked_by = NULL, locked_until = NULL, updated_at = now(),
+           last_error = :error
+     WHERE job_id = :job_id AND locked_by = :worker
+""")
+
+
+def enqueue(query_id, max_attempts=3):
+    """Добавляет задание в текущую сессию; коммит — вместе со строкой Query."""
+    job = GradingJob(query_id=query_id, status=QUEUED, max_attempts=max_attempts)
+    db.session.add(job)
+    return job
+
+
+def claim(worker, limit, visibility):
+    """Забирает до limit заданий и возвращает [(job_id, query_id, attempts, max_attempts)]."""
+    rows = db.session.execute(
+        _CLAIM_SQL, {"worker": worker, "limit": limit, "visibility": visibility}
+    ).fetchall()
+    db.session.commit()
+    return [tuple(r) for r in rows]
+
+
+def reap_expired():
+    """Переводит в dead задания с истёкшей арендой и исчерпанными попытками.
+    Возвращает query_id таких попыток."""
+    ids = [r[0] for r in db.session.execute(_REAP_SQL).fetchall()]
+    if ids:
+        db.session.execute(_ABANDON_SQL, {"ids": ids, "error": "grading failed: worker lost"})
+    db.session.commit()
+    return ids
+
+
+def extend(worker, job_ids, visibility):
+    if not job_ids:
+        return
+    db.session.execute(_EXTEND_SQL, {"worker": worker, "ids": list(job_ids),
+                                     "visibility": visibility})
+    db.session.commit()
+
+
+def complete(worker, job_id):
+    db.session.execute(_DONE_SQL, {"worker": worker, "job_id": job_id})
+    db.session.commit()
+
+
+def retry_delay(attempts, base, cap=300.0):
+    """Экспоненциальная задержка с джиттером: base * 2^(n-1) ± 50%, не больше cap."""
+    delay = min(cap, base * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.5, 1.5)
+
+
+def fail(worker, job_id, query_id, attempts, max_attempts, error, backoff):
+    """Планирует повтор или отправляет задание в dead-letter. True — задание мертво."""
+    error = (error or "")[:2000]
+    if attempts >= max_attempts:
+        db.session.execute(_DEAD_SQL, {"worker": worker, "job_id": job_id, "error": error})
+        db.session.execute(_ABANDON_SQL, {"ids": [query_id], "error": f"grading failed: {error}"})
+        db.session.commit()
+        return True
+    db.session.execute(_RETRY_SQL, {"worker": worker, "job_id": job_id, "error": error,
+                                    "delay": retry_delay(attempts, backoff)})
+    db.session.commit()
+    return False
+
+
+def queue_stats():
+    """Количество заданий по статусам и возраст самого старого ожидающего."""
+    rows = db.session.execute(text(
+        "SELECT status, count(*), "
+        "       extract(epoch FROM now() - min(created_at)) "
+        "  FROM grading_jobs GROUP BY status"
+    )).fetchall()
+    stats = {s: 0 for s in (QUEUED, RUNNING, DONE, DEAD)}
+    oldest = None
+    for status, count, age in rows:
+        stats[status] = count
+        if status == QUEUED and age is not None:
+            oldest = round(float(age), 1)
+    stats["oldest_queued_s"] = oldest
+    return stats
@@ -0,0 +1,545 @@
+"""Выполнение кода в mongosh: пул долгоживущих воркеров и разовый запуск.
+
+Каждый воркер — это процесс `mongosh <uri> --quiet` в режиме REPL с уже открытым
+соединением. Задание передаётся одной строкой в stdin, результат приходит в stdout
+потоком строк-кадров ``@@MSH@@<job_id>@@<kind>@@<payload>``:
+
+* ``D`` — один документ результата (JSON), по строке на документ (NDJSON);
+* ``E`` — ошибка выполнения ({"__mongo_error": ...});
+* ``Z`` — конец ответа.
+
+Всё, что не является кадром (приглашения REPL, эхо ввода), игнорируется. Разовый
+запуск (`mongosh --eval`) использует тот же формат, поэтому вывод в обоих случаях
+читается построчно и не буферизуется целиком: чтение прекращается, как только
+исчерпан бюджет по документам или байтам.
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import queue
+import selectors
+import subprocess
+import threading
+import time
+import uuid
+
+from app.utils.shell_parser import _skip_regex, ShellParseError
+
+FRAME_PREFIX = "@@MSH@@"
+
+WARMUP_TIMEOUT = 20            # секунд на запуск воркера и первый ping
+MAX_OUTPUT_BYTES = 2_000_000   # бюджет по байтам на один ответ
+
+
+class MongoshWorkerError(Exception):
+    """Воркер упал или нарушил протокол — его нужно заменить."""
+
+
+class MongoshResult:
+    """Результат выполнения: rc (0 — успех, 2 — ошибка запроса), документы,
+    текст ошибки, признак усечения и прочий вывод mongosh."""
+
+    __slots__ = ("rc", "docs", "error", "truncated", "noise", "complete")
+
+    def __init__(self):
+        self.rc = 0
+        self.docs = []
+        self.error = None
+        self.truncated = False
+        self.noise = ""
+        self.complete = False  # дочитали до кадра конца
+
+
+# после этих символов '/' начинает regex-литерал, а не деление
+REGEX_PREFIX = "(,=:[!&|?{};"
+
+
+def one_line(code: str) -> str:
+    """Сворачивает JS-код в одну строку для REPL: убирает комментарии, переводы строк
+    заменяет пробелами. Строковые и regex-литералы не трогаем."""
+    out = []
+    i, n = 0, len(code)
+    quote = None
+    last = ""
+    while i < n:
+        ch = code[i]
+        if quote:
+            out.append(ch)
+            if ch == "\\" and i + 1 < n:
+                out.append(code[i + 1])
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+            i += 1
+            continue
+        if ch in ("'", '"', "`"):
+            quote = ch
+            out.append(ch)
+        elif code.startswith("//", i):
+            while i < n and code[i] != "\n":
+                i += 1
+            continue
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            out.append(" ")
+            continue
+        elif ch == "/" and (not last or last in REGEX_PREFIX):
+            # кавычки внутри /O'Brien/ — часть шаблона, а не начало строки
+            try:
+                _, _, end = _skip_regex(code, i)
+            except ShellParseError:
+                end = i + 1
+            out.append(code[i:end])
+            last = "/"
+            i = end
+            continue
+        elif ch in "\r\n":
+            out.append(" ")
+        else:
+            out.append(ch)
+        if not ch.isspace():
+            last = ch
+        i += 1
+    return "".join(out).strip()
+
+
+def strip_code(code: str) -> str:
+    user_code = code.strip()
+    if user_code.endswith(";"):
+        user_code = user_code[:-1]
+    return user_code
+
+
+def _stream_js(max_docs: int, max_time_ms: int) -> str:
+    """JS-фрагмент: печатает результат выражения __r кадрами D, по документу на строку.
+
+    Курсору сразу задаются maxTimeMS и batchSize, читается не больше max_docs + 1
+    документов (лишний документ — признак усечения), после чего курсор закрывается.
+    Ожидает, что __f — префикс кадра.
+    """
+    fetch = max_docs + 1
+    return (
+        " const __emit = function(d) { print(__f + 'D@@' + JSON.stringify(d)); };"
+        " if (__r && typeof __r.hasNext === 'function') {"
+        f" if (typeof __r.maxTimeMS === 'function') {{ __r = __r.maxTimeMS({max_time_ms}); }}"
+        f" if (typeof __r.batchSize === 'function') {{ __r = __r.batchSize({fetch}); }}"
+        f" let __n = 0; while (__n < {fetch} && __r.hasNext()) {{ __emit(__r.next()); __n++; }}"
+        " if (typeof __r.close === 'function') { __r.close(); }"
+        " } else if (Array.isArray(__r)) {"
+        f" __r.slice(0, {fetch}).forEach(__emit);"
+        " } else if (__r !== undefined) {"
+        " __emit(__r);"
+        " }"
+        " print(__f + 'Z@@');"
+    )
+
+
+def _frame_js(job_id: str) -> str:
+    # маркер собирается из частей, чтобы эхо ввода в REPL не совпадало с кадром
+    return f" var __f = '@@MSH' + '@@' + '{job_id}' + '@@';"
+
+
+def build_eval_script(job_id: str, code: str, max_docs: int, max_time_ms: int) -> str:
+    """Скрипт для разового запуска `mongosh --eval` (ошибка — код выхода 2)."""
+    return (
+        _frame_js(job_id) +
+        " try {"
+        f" let __r = (function() {{ return ({strip_code(code)}); }})();"
+        + _stream_js(max_docs, max_time_ms) +
+        " } catch (e) {"
+        " print(__f + 'E@@' + JSON.stringify({__mongo_error: String(e.message || e)}));"
+        " quit(2);"
+        " }"
+    )
+
+
+def build_job_script(job_id: str, code: str, max_docs: int, max_time_ms: int) -> str:
+    """JS-обёртка задания для REPL-воркера (одна строка)."""
+    return (
+        "(function(){" + _frame_js(job_id) +
+        " try {"
+        f" let __r = (function() {{ return ({one_line(strip_code(code))}); }})();"
+        + _stream_js(max_docs, max_time_ms) +
+        " } catch (e) {"
+        " print(__f + 'E@@' + JSON.stringify({__mongo_error: String(e.message || e)}));"
+        " print(__f + 'Z@@');"
+        " }"
+        " })()\n"
+    )
+
+
+class _LineReader:
+    """Построчное чтение из pipe с дедлайном (без буферизации всего вывода)."""
+
+    def __init__(self, stream):
+        self._fd = stream.fileno()
+        self._buf = b""
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(stream, selectors.EVENT_READ)
+
+    def readline(self, deadline: float, max_line: int):
+        """Следующая строка без перевода строки; None — поток закрыт."""
+        while True:
+            nl = self._buf.find(b"\n")
+            if nl >= 0:
+                line, self._buf = self._buf[:nl], self._buf[nl + 1:]
+                return line
+            if len(self._buf) > max_line:
+                # строка длиннее бюджета: отдаём как есть, вызывающий остановит чтение
+                line, self._buf = self._buf, b""
+                return line
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise subprocess.TimeoutExpired("mongosh", 0)
+            if not self._sel.select(left):
+                continue
+            chunk = os.read(self._fd, 65536)
+            if not chunk:
+                if self._buf:
+                    line, self._buf = self._buf, b""
+                    return line
+                return None
+            self._buf += chunk
+
+    def close(self):
+        try:
+            self._sel.close()
+        except Exception:
+            pass
+
+
+def _collect(reader, job_id, deadline, max_docs, max_bytes, transform=None) -> MongoshResult:
+    """Читает кадры задания job_id, пока не встретит конец или не исчерпает бюджет.
+
+    Документы разбираются и преобразуются (transform) по мере поступления, в памяти
+    держится не больше max_docs + 1 документов.
+    """
+    res = MongoshResult()
+    marker = f"{FRAME_PREFIX}{job_id}@@".encode("utf-8")
+    job_tag = job_id.encode("utf-8")
+    noise = []
+    used = 0
+    while True:
+        line = reader.readline(deadline, max_bytes)
+        if line is None:
+            break
+        pos = line.find(marker)
+        if pos < 0:
+            # эхо нашего же ввода в шум не попадает
+            if len(noise) < 20 and job_tag not in line:
+                text = line.decode("utf-8", "replace").strip()
+                if text:
+                    noise.append(text)
+            continue
+        kind, payload = line[pos + len(marker):pos + len(marker) + 1], line[pos + len(marker) + 3:]
+        if kind == b"D":
+            if len(res.docs) > max_docs:
+                continue  # бюджет по документам исчерпан, ждём кадр конца
+            used += len(payload)
+            if used > max_bytes:
+                # бюджет по байтам: дальше не читаем, поток остаётся недочитанным
+                res.truncated = True
+                break
+            doc = json.loads(payload)
+            res.docs.append(transform(doc) if transform else doc)
+            if len(res.docs) > max_docs:
+                res.truncated = True
+        elif kind == b"E":
+            res.rc = 2
+            try:
+                res.error = json.loads(payload).get("__mongo_error")
+            except (ValueError, AttributeError):
+                res.error = payload.decode("utf-8", "replace")
+        elif kind == b"Z":
+            res.complete = True
+            break
+        else:
+            raise MongoshWorkerError(f"bad frame: {line[:100]!r}")
+    res.noise = "\n".join(noise)
+    return res
+
+
+def run_once(code, mongo_uri, timeout, max_docs, max_time_ms,
+             max_bytes=MAX_OUTPUT_BYTES, transform=None) -> MongoshResult:
+    """Разовый запуск mongosh. Процесс убивается, как только бюджет исчерпан."""
+    job_id = uuid.uuid4().hex
+    script = build_eval_script(job_id, code, max_docs, max_time_ms)
+    proc = subprocess.Popen(
+        ["mongosh", mongo_uri, "--quiet", "--eval", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        bufsize=0,
+    )
+    reader = _LineReader(proc.stdout)
+    try:
+        res = _collect(reader, job_id, time.monotonic() + timeout, max_docs, max_bytes, transform)
+    finally:
+        reader.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+    if res.rc == 0 and not res.complete and not res.truncated and proc.returncode:
+        res.rc = proc.returncode
+        res.error = res.noise or None
+    return res
+
+
+def _rss_mb(pid):
+    """Resident memory процесса в МБ (Linux /proc), None если недоступно."""
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class MongoshWorker:
+    """Один процесс mongosh в режиме REPL."""
+
+    def __init__(self, mongo_uri: str):
+        self.jobs_done = 0
+        self.started_at = time.monotonic()
+        self.proc = subprocess.Popen(
+            ["mongosh", mongo_uri, "--quiet", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0,
+        )
+        self._reader = _LineReader(self.proc.stdout)
+
+    @property
+    def pid(self):
+        return self.proc.pid
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def rss_mb(self):
+        return _rss_mb(self.proc.pid)
+
+    def warmup(self, timeout=WARMUP_TIMEOUT):
+        """Дожидается готовности REPL и открытого соединения (ping)."""
+        res = self.run("db.runCommand({ping: 1})", timeout, max_docs=1, max_time_ms=1000,
+                       max_bytes=MAX_OUTPUT_BYTES)
+        if res.rc != 0 or not res.complete:
+            raise MongoshWorkerError(f"warmup failed: {res.error or res.noise}")
+
+    def run(self, code, timeout, max_docs, max_time_ms, max_bytes, transform=None) -> MongoshResult:
+        """Выполняет выражение и читает ответ кадрами.
+
+        При превышении таймаута бросает subprocess.TimeoutExpired; если ответ дочитан
+        не до конца (таймаут, бюджет по байтам), воркер непригоден и должен быть убит
+        вызывающей стороной.
+        """
+        if not self.alive():
+            raise MongoshWorkerError("worker is not running")
+
+        job_id = uuid.uuid4().hex
+        script = build_job_script(job_id, code, max_docs, max_time_ms)
+        try:
+            self.proc.stdin.write(script.encode("utf-8"))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise MongoshWorkerError(f"stdin closed: {e}")
+
+        res = _collect(self._reader, job_id, time.monotonic() + timeout, max_docs, max_bytes, transform)
+        if not res.complete and not res.truncated:
+            raise MongoshWorkerError("worker exited")
+        self.jobs_done += 1
+        return res
+
+    def kill(self):
+        self._reader.close()
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=2)
+        except Exception:
+            pass
+
+
+class MongoshPool:
+    """Пул прогретых воркеров с переработкой, заменой упавших и метриками."""
+
+    def __init__(self, mongo_uri, size, max_jobs, max_rss_mb, max_output_bytes=MAX_OUTPUT_BYTES):
+        self.mongo_uri = mongo_uri
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.max_output_bytes = max_output_bytes
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._alive = 0      # запущенные + запускающиеся воркеры
+        self._busy = 0
+        self._closed = False
+        self._stats = {
+            "jobs_total": 0,
+            "jobs_failed": 0,
+            "timeouts": 0,
+            "crashes": 0,
+            "recycled": 0,
+            "spawned": 0,
+            "spawn_failures": 0,
+            "wait_ms_total": 0,
+        }
+
+    # ---- жизненный цикл воркеров ----
+
+    def start(self):
+        for _ in range(self.size):
+            self._spawn_async()
+
+    def _spawn_async(self):
+        with self._lock:
+            if self._closed or self._alive >= self.size:
+                return
+            self._alive += 1
+        threading.Thread(target=self._spawn, daemon=True).start()
+
+    def _spawn(self):
+        worker = None
+        try:
+            worker = MongoshWorker(self.mongo_uri)
+            worker.warmup()
+        except Exception as e:
+            print(f"[mongosh_pool] failed to start worker: {e}")
+            if worker:
+                worker.kill()
+            with self._lock:
+                self._alive -= 1
+                self._stats["spawn_failures"] += 1
+            return
+        with self._lock:
+            self._stats["spawned"] += 1
+            if self._closed:
+                self._alive -= 1
+                worker.kill()
+                return
+        self._idle.put(worker)
+
+    def _discard(self, worker, reason):
+        worker.kill()
+        with self._lock:
+            self._alive -= 1
+            if reason in self._stats:
+                self._stats[reason] += 1
+        self._spawn_async()
+
+    def _release(self, worker):
+        rss = worker.rss_mb()
+        if worker.jobs_done >= self.max_jobs or (rss is not None and rss > self.max_rss_mb):
+            self._discard(worker, "recycled")
+        elif not worker.alive():
+            self._discard(worker, "crashes")
+        else:
+            self._idle.put(worker)
+
+    # ---- выполнение ----
+
+    def run(self, code, timeout, max_docs, max_time_ms, transform=None) -> MongoshResult:
+        """Выполняет код на свободном воркере; ожидание воркера входит в таймаут."""
+        started = time.monotonic()
+        # если все воркеры умерли и не поднялись — пробуем поднять заново
+        if self._alive < self.size:
+            self._spawn_async()
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise subprocess.TimeoutExpired("mongosh-pool", timeout)
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._busy += 1
+            self._stats["jobs_total"] += 1
+            self._stats["wait_ms_total"] += int(waited * 1000)
+
+        try:
+            res = worker.run(code, max(0.1, timeout - waited), max_docs, max_time_ms,
+                             self.max_output_bytes, transform)
+        except subprocess.TimeoutExpired:
+            self._discard(worker, "timeouts")
+            raise
+        except (MongoshWorkerError, ValueError):
+            self._discard(worker, "crashes")
+            with self._lock:
+                self._stats["jobs_failed"] += 1
+            raise MongoshWorkerError("worker failed")
+        finally:
+            with self._lock:
+                self._busy -= 1
+
+        if res.rc != 0:
+            with self._lock:
+                self._stats["jobs_failed"] += 1
+        if not res.complete:
+            # ответ не дочитан (бюджет по байтам) — остаток вывода нам не нужен
+            self._discard(worker, "recycled")
+        else:
+            self._release(worker)
+        return res
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            busy = self._busy
+            alive = self._alive
+        jobs = stats["jobs_total"] or 1
+        stats.update({
+            "size": self.size,
+            "alive": alive,
+            "idle": self._idle.qsize(),
+            "busy": busy,
+            "utilization": round(busy / self.size, 3) if self.size else 0.0,
+            "avg_wait_ms": round(stats["wait_ms_total"] / jobs, 1),
+        })
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(app):
+    """Создаёт и прогревает пул для приложения (если MONGOSH_POOL_SIZE > 0)."""
+    global _pool
+    # дочерние процессы пула (spawn, см. regrade) тоже создают приложение — им это не нужно
+    if multiprocessing.parent_process() is not None:
+        return _pool
+    size = int(app.config.get("MONGOSH_POOL_SIZE") or 0)
+    mongo_uri = app.config.get("MONGO_URI")
+    if size <= 0 or not mongo_uri:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = MongoshPool(
+                mongo_uri,
+                size=size,
+                max_jobs=int(app.config.get("MONGOSH_WORKER_MAX_JOBS", 500)),
+                max_rss_mb=int(app.config.get("MONGOSH_WORKER_MAX_RSS_MB", 300)),
+            )
+            _pool.start()
+            atexit.register(_pool.shutdown)
+    return _pool
+
+
+def get_pool():
+    return _pool
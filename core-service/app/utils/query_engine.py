@@ -0,0 +1,61 @@
+"""Нативное выполнение запросов через PyMongo без запуска mongosh."""
+import re
+
+from app import mongo
+from app.utils.shell_parser import parse_shell_query
+
+
+# стадии записи: учебная база общая и только для чтения (на этом держатся кеш
+# результатов и эталоны), поэтому такие запросы не выполняем ни одним движком
+WRITE_STAGES = ("$out", "$merge")
+WRITE_STAGE_RE = re.compile(r"""["'`]?\$(?:out|merge)\b["'`]?\s*:""")
+
+
+class WriteStageError(ValueError):
+    """В запросе есть стадия записи ($out / $merge)."""
+
+
+def has_write_stage(code: str) -> bool:
+    """Есть ли в shell-коде стадия $out / $merge (проверка текста — до выполнения любым движком)."""
+    return bool(WRITE_STAGE_RE.search(code or ""))
+
+
+def run_native(spec: dict, database=None, max_docs=200, max_time_ms=3000, transform=None) -> list:
+    """Выполняет разобранный запрос (см. parse_shell_query) на пуле соединений PyMongo.
+
+    Бюджет передаётся серверу: maxTimeMS, limit/$limit на max_docs + 1 документов
+    и batchSize того же размера, так что лишние документы не читаются вовсе.
+    Вернётся не больше max_docs + 1 документов — лишний означает усечение.
+    transform применяется к каждому документу по мере чтения курсора.
+    """
+    database = database if database is not None else mongo.db
+    coll = database[spec["collection"]]
+    fetch = max_docs + 1
+    if spec["op"] == "find":
+        # пустая проекция в PyMongo означает {_id: 1}, а в shell — «все поля»
+        cursor = coll.find(spec["filter"], spec["projection"] or None)
+        if spec["sort"]:
+            cursor = cursor.sort(spec["sort"])
+        limit = abs(spec["limit"] or 0)
+        cursor = cursor.limit(min(limit, fetch) if limit else fetch)
+        cursor = cursor.batch_size(fetch).max_time_ms(max_time_ms)
+    else:
+        pipeline = list(spec["pipeline"])
+        if any(next(iter(stage), None) in WRITE_STAGES for stage in pipeline):
+            raise WriteStageError("$out and $merge are not allowed")
+        pipeline.append({"$limit": fetch})
+        cursor = coll.aggregate(pipeline, maxTimeMS=max_time_ms, batchSize=fetch)
+    with cursor:
+        if transform is None:
+            return list(cursor)
+        return [transform(doc) for doc in cursor]
+
+
+def execute_native(code: str, database=None, max_docs=200, max_time_ms=3000, transform=None) -> list:
+    """Разбирает и выполняет shell-код.
+
+    ShellParseError — синтаксис не поддерживается (нужно выполнить через mongosh),
+    WriteStageError — в конвейере есть стадия записи,
+    pymongo.errors.PyMongoError — ошибка самого запроса (вернуть пользователю).
+    """
+    return run_native(parse_shell_query(code), database, max_docs, max_time_ms, transform)
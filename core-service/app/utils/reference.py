@@ -0,0 +1,255 @@
+"""Эталонные решения заданий.
+
+У задания может быть reference_query — запрос-эталон. Его результат выполняется
+один раз, нормализуется и сохраняется в assignments вместе с хешами, дайджестом,
+числом документов и версией набора данных, на которой он получен. Grading
+сравнивает попытку с сохранённым результатом (см. grading_context), а после смены
+версии данных эталоны пересчитываются в фоне, так что расхождение данных и
+заданий видно админу раньше, чем студентам.
+"""
+import multiprocessing
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from pymongo.errors import PyMongoError
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.assignment import Assignment
+from app.utils.canonical import HashedResult, compare_results
+from app.utils.dataset import dataset_version
+from app.utils.grading import (
+    ALLOWED_SHELL, MAX_DOCS, MAX_TIME_MS, normalize_hashed, _run_mongosh, _safe_rollback,
+)
+from app.utils.grading_context import (
+    invalidate_grading_context, get_grading_context, REFERENCE_TRUNCATED,
+)
+from app.utils.query_engine import execute_native, has_write_stage
+from app.utils.shell_parser import ShellParseError
+
+# ключ pg_try_advisory_lock: пересчитывает эталоны один процесс из всех
+REFRESH_LOCK_KEY = 70130001
+ERROR_RETRY = 60        # секунд до повторного пересчёта эталонов, которые не удалось посчитать
+
+
+class ReferenceQueryError(Exception):
+    """Эталонный запрос не выполнился."""
+
+
+def run_reference(code):
+    """Выполняет эталонный запрос с теми же лимитами, что и попытки.
+    Возвращает (документы, хеши, truncated)."""
+    if not ALLOWED_SHELL.match(code or ""):
+        raise ReferenceQueryError("reference query must be db.<coll>.find(...) / aggregate(...)")
+    if has_write_stage(code):
+        raise ReferenceQueryError("reference query must not contain $out or $merge")
+    pairs = None
+    if current_app.config.get("QUERY_ENGINE") == "native":
+        try:
+            pairs = execute_native(code, max_docs=MAX_DOCS, max_time_ms=MAX_TIME_MS,
+                                   transform=normalize_hashed)
+        except ShellParseError:
+            pairs = None
+        except PyMongoError as e:
+            details = getattr(e, "details", None) or {}
+            raise ReferenceQueryError(details.get("errmsg") or str(e))
+        truncated = pairs is not None and len(pairs) > MAX_DOCS
+    if pairs is None:
+        try:
+            res = _run_mongosh(code, current_app.config.get("MONGO_URI"))
+        except subprocess.TimeoutExpired:
+            raise ReferenceQueryError("mongosh timed out")
+        except (FileNotFoundError, ValueError) as e:
+            raise ReferenceQueryError(str(e))
+        if res.rc != 0:
+            raise ReferenceQueryError(res.error or res.noise or "Unknown mongosh error")
+        pairs, truncated = res.docs, res.truncated
+    pairs = pairs[:MAX_DOCS]
+    return [d for d, _ in pairs], [h for _, h in pairs], truncated
+
+
+def refresh_reference(assignment_id, version=None):
+    """Пересчитывает эталон задания и сохраняет его. Возвращает отчёт:
+    status ok / changed / error / skipped, число документов, прошли ли тесты задания."""
+    a = Assignment.query.get(assignment_id)
+    if a is None or not a.reference_query:
+        return {"assignment_id": assignment_id, "status": "skipped"}
+    version = version or dataset_version()
+    previous = a.reference_digest
+    report = {"assignment_id": assignment_id, "title": a.title}
+    try:
+        docs, hashes, truncated = run_reference(a.reference_query)
+    except ReferenceQueryError as e:
+        # версию не отмечаем: эталон остаётся устаревшим, и следующий пересчёт повторит
+        # попытку; пока reference_error задан, тест по эталону не применяется (build_context)
+        a.reference_error = str(e)
+        a.reference_updated_at = datetime.utcnow()
+        report.update(status="error", error=str(e))
+    else:
+        result = HashedResult(docs, hashes)
+        a.reference_result = docs
+        a.reference_hashes = hashes
+        a.reference_digest = result.digest
+        a.reference_count = len(docs)
+        a.reference_error = REFERENCE_TRUNCATED if truncated else None
+        a.reference_version = version
+        a.reference_updated_at = datetime.utcnow()
+        report.update(
+            status="changed" if previous and previous != result.digest else "ok",
+            count=len(docs),
+            truncated=truncated,
+            digest=result.digest,
+        )
+    try:
+        db.session.commit()
+    except SQLAlchemyError as e:
+        _safe_rollback()
+        return {"assignment_id": assignment_id, "status": "error", "error": str(e)}
+    invalidate_grading_context(assignment_id)
+
+    if report["status"] in ("ok", "changed"):
+        report["tests"] = _check_literal_tests(assignment_id)
+    return report
+
+
+def _check_literal_tests(assignment_id):
+    """Проходит ли эталон заданные вручную тесты (расхождение — повод проверить задание)."""
+    ctx = get_grading_context(assignment_id)
+    if ctx is None or ctx.reference is None:
+        return []
+    out = []
+    for t in ctx.tests:
+        if t.expected is None:
+            out.append({"test_id": t.test_id, "passed": False})
+            continue
+        diff = compare_results(t.expected, ctx.reference.expected, t.mode, t.tolerance)
+        out.append({"test_id": t.test_id, "passed": diff is None})
+    return out
+
+
+def refresh_all(app, only_stale=True, parallelism=4):
+    """Пересчитывает эталоны (только устаревшие или все) в parallelism потоков."""
+    with app.app_context():
+        version = dataset_version()
+        qry = Assignment.query.filter(Assignment.reference_query.isnot(None))
+        if only_stale:
+            qry = qry.filter(db.or_(Assignment.reference_version.is_(None),
+                                    Assignment.reference_version != version))
+        ids = [a.assignment_id for a in qry.with_entities(Assignment.assignment_id)]
+        db.session.remove()
+
+    def _one(assignment_id):
+        with app.app_context():
+            try:
+                return refresh_reference(assignment_id, version)
+            except Exception as e:
+                _safe_rollback()
+                return {"assignment_id": assignment_id, "status": "error", "error": str(e)}
+            finally:
+                db.session.remove()
+
+    if not ids:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(ids))),
+                            thread_name_prefix="reference") as pool:
+        return list(pool.map(_one, ids))
+
+
+class ReferenceRefresher:
+    """Фоновый поток: при смене версии данных пересчитывает устаревшие эталоны.
+
+    Между процессами работу делит advisory lock Postgres — пересчёт выполняет тот,
+    кто его взял, остальные пропускают этот цикл.
+    """
+
+    def __init__(self, app, interval, parallelism):
+        self.app = app
+        self.interval = interval
+        self.parallelism = parallelism
+        self._wake = threading.Event()
+        self._last_version = None
+        self._retry_at = float("inf")   # когда пересчитать заново при той же версии (после ошибок)
+        self._thread = threading.Thread(target=self._loop, name="reference-refresher", daemon=True)
+        self._stats = {"runs": 0, "refreshed": 0, "errors": 0, "last_run": None}
+
+    def start(self):
+        self._thread.start()
+
+    def trigger(self, force=False):
+        """Проверить версию данных сейчас, не дожидаясь интервала
+        (force — пересчитать устаревшие эталоны, даже если версия уже проверялась)."""
+        if force:
+            self._last_version = None
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[reference] refresh failed: {e}")
+
+    def run_once(self):
+        with self.app.app_context():
+            version = dataset_version()
+            if version == self._last_version and time.monotonic() < self._retry_at:
+                return []
+            conn = db.engine.connect()
+            try:
+                locked = conn.execute(text("SELECT pg_try_advisory_lock(:k)"),
+                                      {"k": REFRESH_LOCK_KEY}).scalar()
+                if not locked:
+                    return []
+                try:
+                    reports = refresh_all(self.app, only_stale=True, parallelism=self.parallelism)
+                finally:
+                    conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": REFRESH_LOCK_KEY})
+            finally:
+                conn.close()
+        self._last_version = version
+        failed = any(r["status"] == "error" for r in reports)
+        self._retry_at = time.monotonic() + ERROR_RETRY if failed else float("inf")
+        self._stats["runs"] += 1
+        self._stats["refreshed"] += len(reports)
+        self._stats["errors"] += sum(1 for r in reports if r["status"] == "error")
+        self._stats["last_run"] = datetime.utcnow().isoformat()
+        for r in reports:
+            if r["status"] in ("changed", "error"):
+                print(f"[reference] assignment {r['assignment_id']}: {r['status']} {r.get('error', '')}")
+        return reports
+
+    def metrics(self) -> dict:
+        stats = dict(self._stats)
+        stats.update({"interval": self.interval, "dataset_version": self._last_version})
+        return stats
+
+
+_refresher = None
+
+
+def init_reference_refresher(app):
+    """Запускает фоновый пересчёт эталонов (REFERENCE_REFRESH_INTERVAL = 0 — выключен)."""
+    global _refresher
+    # дочерние процессы пула (spawn, см. regrade) тоже создают приложение — им это не нужно
+    if multiprocessing.parent_process() is not None:
+        return _refresher
+    interval = float(app.config.get("REFERENCE_REFRESH_INTERVAL") or 0)
+    with app.app_context():
+        # advisory lock есть только в Postgres
+        postgres = db.engine.dialect.name == "postgresql"
+    if interval > 0 and _refresher is None and postgres:
+        _refresher = ReferenceRefresher(app, interval,
+                                        int(app.config.get("REFERENCE_PARALLELISM", 4)))
+        _refresher.start()
+    return _refresher
+
+
+def get_reference_refresher():
+    return _refresher
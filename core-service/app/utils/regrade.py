@@ -0,0 +1,201 @@
+"""Перепроверка сохранённых попыток после изменения тестов задания.
+
+Запросы заново не выполняются: в queries.result уже лежит нормализованный
+результат. Строки читаются порциями по query_id (keyset-пагинация), сравнение
+идёт в пуле процессов, изменившиеся строки (статус, error_message и разбор
+тестов в error_json) записываются одним UPDATE ... FROM (VALUES ...) на порцию. Ход работы виден через get_regrade().
+"""
+import itertools
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import text
+
+from app import db
+from app.utils.canonical import HashedResult
+from app.utils.grading_context import build_context, GradingTest
+
+# в пуле процессов: тесты задания, переданные инициализатором
+_tests = None
+
+_PAGE_SQL = text("""
+    SELECT query_id, result, status, error_json FROM queries
+     WHERE assignment_id = :assignment_id AND query_id > :after
+       AND status IN ('ok', 'failed') AND result IS NOT NULL
+     ORDER BY query_id
+     LIMIT :limit
+""")
+
+_COUNT_SQL = text("""
+    SELECT count(*) FROM queries
+     WHERE assignment_id = :assignment_id AND status IN ('ok', 'failed') AND result IS NOT NULL
+""")
+
+
+def _init_worker(spec):
+    global _tests
+    _tests = [GradingTest(test_id, description,
+                          HashedResult(docs, hashes) if docs is not None else None, mode, tolerance)
+              for test_id, description, docs, hashes, mode, tolerance in spec]
+
+
+def _json(value):
+    # драйвер без декодирования JSON (в Postgres JSONB приходит уже разобранным)
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _evaluate(rows):
+    """[(query_id, result, status, error_json)] -> [(query_id, статус, error_text, error_json)]
+    для строк, у которых изменился статус или разбор тестов."""
+    from app.utils.grading import normalize_value, run_tests
+
+    changed = []
+    for query_id, result, status, details in rows:
+        result = _json(result)
+        if not isinstance(result, list):
+            continue
+        passed, tests, error_text = run_tests(_tests, [normalize_value(d) for d in result])
+        new_status = "ok" if passed else "failed"
+        details = _json(details)
+        # строки до сохранения разбора тестов: в error_json лежала только диагностика
+        if not (isinstance(details, dict) and "tests" in details):
+            details = {"diagnostics": details}
+        if new_status != status or details.get("tests") != tests:
+            changed.append((query_id, new_status, error_text, dict(details, tests=tests)))
+    return changed
+
+
+def _write_statuses(changed):
+    """Один UPDATE ... FROM (VALUES ...) на порцию изменившихся строк: статус,
+    error_message и error_json (их отдаёт attempt_jobs.stored_result)."""
+    if not changed:
+        return
+    params, values = {}, []
+    for i, (query_id, status, error_text, details) in enumerate(changed):
+        params[f"id{i}"], params[f"s{i}"] = query_id, status
+        params[f"e{i}"], params[f"j{i}"] = error_text, json.dumps(details, default=str)
+        values.append(f"(CAST(:id{i} AS INTEGER), :s{i}, CAST(:e{i} AS TEXT), CAST(:j{i} AS JSONB))")
+    db.session.execute(text(
+        "UPDATE queries AS q SET status = v.status, error_message = v.error_message, "
+        "error_json = v.error_json "
+        f"FROM (VALUES {', '.join(values)}) AS v(query_id, status, error_message, error_json) "
+        "WHERE q.query_id = v.query_id"
+    ), params)
+    db.session.commit()
+
+
+class RegradeJob:
+    def __init__(self, assignment_id):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.assignment_id = assignment_id
+        self.state = "pending"          # pending / running / done / error
+        self.total = None
+        self.processed = 0
+        self.changed = 0
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "assignment_id": self.assignment_id,
+            "state": self.state,
+            "total": self.total,
+            "processed": self.processed,
+            "changed": self.changed,
+            "progress": round(self.processed / self.total, 3) if self.total else None,
+            "elapsed_s": round(elapsed, 2),
+            "error": self.error,
+        }
+
+
+def regrade_assignment(app, job, processes=2, chunk_size=1000):
+    """Перепроверяет попытки задания; прогресс пишет в job."""
+    job.state = "running"
+    with app.app_context():
+        try:
+            ctx = build_context(job.assignment_id)
+            if ctx is None:
+                raise ValueError("Assignment not found")
+            spec = [(t.test_id, t.description, t.expected.docs if t.expected else None,
+                     t.expected.hashes if t.expected else None, t.mode, t.tolerance)
+                    for t in ctx.all_tests]
+            job.total = db.session.execute(
+                _COUNT_SQL, {"assignment_id": job.assignment_id}).scalar()
+
+            # spawn: процесс сервиса многопоточный, fork из него небезопасен
+            mp = multiprocessing.get_context("spawn")
+            slice_size = max(1, chunk_size // max(1, processes))
+            with ProcessPoolExecutor(max_workers=processes, mp_context=mp,
+                                     initializer=_init_worker, initargs=(spec,)) as pool:
+                after = 0
+                pending = deque()
+                while True:
+                    rows = [tuple(r) for r in db.session.execute(_PAGE_SQL, {
+                        "assignment_id": job.assignment_id, "after": after, "limit": chunk_size,
+                    })]
+                    db.session.commit()  # не держим транзакцию, пока считаем
+                    if rows:
+                        after = rows[-1][0]
+                        it = iter(rows)
+                        for part in iter(lambda: list(itertools.islice(it, slice_size)), []):
+                            pending.append((len(part), pool.submit(_evaluate, part)))
+                    # читаем следующую порцию, пока пул считает, но не копим больше двух
+                    while pending and (not rows or len(pending) > 2 * processes):
+                        count, fut = pending.popleft()
+                        changed = fut.result()
+                        _write_statuses(changed)
+                        job.processed += count
+                        job.changed += len(changed)
+                    if not rows:
+                        break
+            job.state = "done"
+        except Exception as e:
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            job.state = "error"
+            job.error = str(e)
+            print(f"[regrade] assignment {job.assignment_id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            db.session.remove()
+    return job
+
+
+_jobs = {}
+_lock = threading.Lock()
+
+
+def start_regrade(app, assignment_id):
+    """Запускает перепроверку в фоновом потоке; одна задача на задание одновременно."""
+    with _lock:
+        for job in _jobs.values():
+            if job.assignment_id == assignment_id and job.state in ("pending", "running"):
+                return job
+        job = RegradeJob(assignment_id)
+        _jobs[job.job_id] = job
+        # старые отчёты не копим
+        for old_id in [j.job_id for j in _jobs.values() if j.finished_at
+                       and time.time() - j.finished_at > 3600]:
+            del _jobs[old_id]
+    threading.Thread(
+        target=regrade_assignment,
+        args=(app, job, int(app.config.get("REGRADE_PROCESSES", 2)),
+              int(app.config.get("REGRADE_CHUNK", 1000))),
+        name=f"regrade-{assignment_id}", daemon=True,
+    ).start()
+    return job
+
+
+def get_regrade(job_id):
+    with _lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,358 @@
+"""Фоновая запись журнала запросов (request_logs) для админской панели.
+
+after_request только кладёт строку в ограниченную очередь в памяти; отдельный
+поток пишет накопленное пачками (executemany) по размеру пачки или по
+интервалу. Если Postgres не успевает, из очереди вытесняются самые старые
+записи (счётчик dropped). Наличие таблицы проверяется один раз и
+перепроверяется не чаще TABLE_RECHECK секунд, а не на каждый запрос.
+
+Поминутные агрегаты (request_log_minutes: число запросов и задержка по
+маршруту, методу и статусу) считаются в памяти при каждом запросе — вытеснение
+сырых строк их не искажает — и дописываются вместе с пачкой. В Postgres тот же
+поток раз в REQUEST_LOG_MAINTENANCE_INTERVAL секунд создаёт дневные секции
+request_logs наперёд и удаляет старые (см. docker/init_postgres.sql).
+"""
+import multiprocessing
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+
+from app import db
+from app.models.request_log import RequestLog
+from app.utils.shutdown import on_shutdown
+
+# как часто перепроверять отсутствующую таблицу (вдруг миграцию уже применили)
+TABLE_RECHECK = 60.0
+PAYLOAD_METHODS = ("POST", "PUT", "PATCH")
+# маршрут запросов, не попавших ни в одно правило (404)
+UNMATCHED_ROUTE = "<unmatched>"
+# advisory lock обслуживания секций (reference.py использует 70130001)
+MAINTENANCE_LOCK_KEY = 70130002
+
+_ROLLUP_SQL = text("""
+    INSERT INTO request_log_minutes AS m
+        (bucket, route, method, status_code, requests, latency_sum_ms, latency_max_ms)
+    VALUES (:bucket, :route, :method, :status_code, :requests, :latency_sum_ms, :latency_max_ms)
+    ON CONFLICT (bucket, route, method, status_code) DO UPDATE SET
+        requests = m.requests + EXCLUDED.requests,
+        latency_sum_ms = m.latency_sum_ms + EXCLUDED.latency_sum_ms,
+        latency_max_ms = GREATEST(m.latency_max_ms, EXCLUDED.latency_max_ms)
+""")
+
+_ENSURE_PARTITION_SQL = text("SELECT request_logs_ensure_partition(CAST(:day AS DATE))")
+_DROP_PARTITIONS_SQL = text("SELECT request_logs_drop_partitions(:days)")
+_PRUNE_ROLLUPS_SQL = text("DELETE FROM request_log_minutes WHERE bucket < :cutoff")
+
+_STATS_SQL = text("""
+    SELECT route, method, status_code,
+           SUM(requests) AS requests,
+           SUM(latency_sum_ms) AS latency_sum_ms,
+           MAX(latency_max_ms) AS latency_max_ms
+    FROM request_log_minutes
+    WHERE bucket >= :since
+    GROUP BY route, method, status_code
+    ORDER BY SUM(requests) DESC
+    LIMIT :limit
+""")
+
+_SERIES_SQL = text("""
+    SELECT bucket,
+           SUM(requests) AS requests,
+           SUM(CASE WHEN status_code >= 500 THEN requests ELSE 0 END) AS errors,
+           SUM(latency_sum_ms) AS latency_sum_ms,
+           MAX(latency_max_ms) AS latency_max_ms
+    FROM request_log_minutes
+    WHERE bucket >= :since AND (CAST(:route AS VARCHAR) IS NULL OR route = :route)
+    GROUP BY bucket
+    ORDER BY bucket
+""")
+
+
+class RequestLogWriter:
+    def __init__(self, app, queue_size, batch_size, flush_interval, payload_max, payload_sample,
+                 retention_days=14, rollup_retention_days=90, partitions_ahead=2,
+                 maintenance_interval=3600.0):
+        self.app = app
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.payload_max = payload_max
+        self.payload_sample = payload_sample
+        self.retention_days = retention_days
+        self.rollup_retention_days = rollup_retention_days
+        self.partitions_ahead = partitions_ahead
+        self.maintenance_interval = maintenance_interval
+        with app.app_context():
+            # секции, GREATEST и ON CONFLICT ... AS m — только в Postgres
+            self.postgres = db.engine.dialect.name == "postgresql"
+        self._next_maintenance = 0.0
+        self._queue = deque(maxlen=queue_size)
+        self._minutes = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._table_ok = None
+        self._table_checked = 0.0
+        self._stats = {"logged": 0, "written": 0, "batches": 0, "dropped": 0,
+                       "failed": 0, "skipped_no_table": 0, "payloads_truncated": 0,
+                       "payloads_sampled_out": 0, "rollup_rows": 0, "rollup_failed": 0,
+                       "partitions_dropped": 0, "maintenance_runs": 0}
+        self._thread = threading.Thread(target=self._loop, name="request-log", daemon=True)
+        self._thread.start()
+
+    def payload_of(self, req):
+        """Тело запроса для журнала: только для части запросов и не длиннее payload_max."""
+        if req.method not in PAYLOAD_METHODS:
+            return None
+        if self.payload_sample < 1.0 and random.random() >= self.payload_sample:
+            with self._cond:
+                self._stats["payloads_sampled_out"] += 1
+            return None
+        try:
+            data = req.get_data(cache=True)
+        except Exception:
+            return None
+        if not data:
+            return None
+        if len(data) > self.payload_max:
+            with self._cond:
+                self._stats["payloads_truncated"] += 1
+            text = data[:self.payload_max].decode("utf-8", errors="ignore")
+            return f"{text}... [truncated, {len(data)} bytes]"
+        return data.decode("utf-8", errors="replace")
+
+    def record(self, path, method, status_code, user_id, payload,
+               route=None, assignment_id=None, latency_ms=None):
+        now = datetime.utcnow()
+        row = {
+            "path": path[:512],
+            "method": method,
+            "route": route[:200] if route else None,
+            "assignment_id": assignment_id,
+            "status_code": status_code,
+            "user_id": user_id,
+            "latency_ms": latency_ms,
+            "created_at": now,
+            "payload": payload,
+        }
+        key = (now.replace(second=0, microsecond=0), row["route"] or UNMATCHED_ROUTE,
+               method, status_code)
+        with self._cond:
+            if self.postgres:
+                agg = self._minutes.get(key)
+                if agg is None:
+                    agg = self._minutes[key] = [0, 0, 0]
+                agg[0] += 1
+                agg[1] += latency_ms or 0
+                agg[2] = max(agg[2], latency_ms or 0)
+            if len(self._queue) == self.queue_size:
+                # deque(maxlen) сам вытеснит самую старую запись
+                self._stats["dropped"] += 1
+            self._queue.append(row)
+            self._stats["logged"] += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[request_log] flush failed: {e}")
+                if stopping:
+                    return
+            if self.postgres and time.monotonic() >= self._next_maintenance:
+                self._next_maintenance = time.monotonic() + self.maintenance_interval
+                try:
+                    self.maintain()
+                except Exception as e:
+                    print(f"[request_log] maintenance failed: {e}")
+            # при остановке дописываем очередь целиком, пачка за пачкой
+            if stopping and not self._queue:
+                return
+
+    def _take(self):
+        with self._cond:
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def _has_table(self):
+        now = time.monotonic()
+        if self._table_ok or (self._table_ok is False and now - self._table_checked < TABLE_RECHECK):
+            return self._table_ok
+        try:
+            self._table_ok = inspect(db.engine).has_table(RequestLog.__tablename__)
+        except Exception as e:
+            print(f"[request_log] table check failed: {e}")
+            self._table_ok = False
+        self._table_checked = now
+        return self._table_ok
+
+    def flush(self):
+        with self.app.app_context():
+            self._flush_rows()
+            if self.postgres:
+                self._flush_minutes()
+
+    def _flush_rows(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            if not self._has_table():
+                with self._cond:
+                    self._stats["skipped_no_table"] += len(batch)
+                continue
+            try:
+                self._insert(batch)
+            except Exception as e:
+                print(f"[request_log] failed to write {len(batch)} rows: {e}")
+                # таблицу могли удалить — перепроверим при следующей пачке
+                self._table_ok = None
+                with self._cond:
+                    self._stats["failed"] += len(batch)
+                continue
+            with self._cond:
+                self._stats["written"] += len(batch)
+                self._stats["batches"] += 1
+
+    def _insert(self, batch):
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(RequestLog.__table__.insert(), batch)
+        except Exception as e:
+            # секции на эти дни ещё нет (например, после долгого простоя) — создаём и повторяем
+            if not (self.postgres and "no partition" in str(e)):
+                raise
+            self._ensure_partitions({row["created_at"].date() for row in batch})
+            with db.engine.begin() as conn:
+                conn.execute(RequestLog.__table__.insert(), batch)
+
+    def _flush_minutes(self):
+        with self._cond:
+            minutes, self._minutes = self._minutes, {}
+        if not minutes:
+            return
+        rows = [{"bucket": bucket, "route": route, "method": method, "status_code": status or 0,
+                 "requests": n, "latency_sum_ms": total, "latency_max_ms": peak}
+                for (bucket, route, method, status), (n, total, peak) in minutes.items()]
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(_ROLLUP_SQL, rows)
+        except Exception as e:
+            print(f"[request_log] failed to write {len(rows)} rollup rows: {e}")
+            with self._cond:
+                self._stats["rollup_failed"] += len(rows)
+            return
+        with self._cond:
+            self._stats["rollup_rows"] += len(rows)
+
+    def _ensure_partitions(self, days):
+        with db.engine.begin() as conn:
+            for day in sorted(days):
+                conn.execute(_ENSURE_PARTITION_SQL, {"day": day})
+
+    def maintain(self):
+        """Создаёт секции на ближайшие дни, удаляет старые секции и агрегаты.
+        Между процессами работу делит advisory lock — остальные пропускают цикл."""
+        with self.app.app_context():
+            conn = db.engine.connect()
+            try:
+                locked = conn.execute(text("SELECT pg_try_advisory_lock(:k)"),
+                                      {"k": MAINTENANCE_LOCK_KEY}).scalar()
+                if not locked:
+                    return
+                try:
+                    today = datetime.utcnow().date()
+                    self._ensure_partitions({today + timedelta(days=d)
+                                             for d in range(self.partitions_ahead + 1)})
+                    with db.engine.begin() as tx:
+                        dropped = tx.execute(_DROP_PARTITIONS_SQL,
+                                             {"days": self.retention_days}).scalar() or 0
+                        tx.execute(_PRUNE_ROLLUPS_SQL, {
+                            "cutoff": datetime.utcnow() - timedelta(days=self.rollup_retention_days)})
+                finally:
+                    conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": MAINTENANCE_LOCK_KEY})
+            finally:
+                conn.close()
+        with self._cond:
+            self._stats["partitions_dropped"] += dropped
+            self._stats["maintenance_runs"] += 1
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "queued": len(self._queue),
+                "queue_size": self.queue_size,
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+                "payload_max": self.payload_max,
+                "payload_sample": self.payload_sample,
+                "table_present": self._table_ok,
+                "minutes_pending": len(self._minutes),
+                "retention_days": self.retention_days,
+            })
+        return stats
+
+
+_writer = None
+
+
+def init_request_log(app):
+    """Запускает фоновую запись журнала запросов (REQUEST_LOG_QUEUE = 0 — журнал выключен)."""
+    global _writer
+    # дочерние процессы пула (spawn, см. regrade) тоже создают приложение — им это не нужно
+    if multiprocessing.parent_process() is not None:
+        return _writer
+    size = int(app.config.get("REQUEST_LOG_QUEUE") or 0)
+    if size > 0 and _writer is None:
+        _writer = RequestLogWriter(
+            app,
+            queue_size=size,
+            batch_size=int(app.config.get("REQUEST_LOG_BATCH", 500)),
+            flush_interval=float(app.config.get("REQUEST_LOG_INTERVAL", 1.0)),
+            payload_max=int(app.config.get("REQUEST_LOG_PAYLOAD_MAX", 2048)),
+            payload_sample=float(app.config.get("REQUEST_LOG_PAYLOAD_SAMPLE", 1.0)),
+            retention_days=int(app.config.get("REQUEST_LOG_RETENTION_DAYS", 14)),
+            rollup_retention_days=int(app.config.get("REQUEST_LOG_ROLLUP_RETENTION_DAYS", 90)),
+            partitions_ahead=int(app.config.get("REQUEST_LOG_PARTITIONS_AHEAD", 2)),
+            maintenance_interval=float(app.config.get("REQUEST_LOG_MAINTENANCE_INTERVAL", 3600)),
+        )
+        on_shutdown(_writer.stop)
+    return _writer
+
+
+def get_request_log():
+    return _writer
+
+
+def _stats_row(row):
+    requests = int(row.requests or 0)
+    return {
+        "requests": requests,
+        "latency_avg_ms": round(int(row.latency_sum_ms or 0) / requests, 1) if requests else None,
+        "latency_max_ms": row.latency_max_ms,
+    }
+
+
+def log_stats(minutes=60, route=None, limit=100):
+    """Агрегаты журнала за последние minutes минут: по маршрутам и поминутный ряд."""
+    since = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=minutes)
+    routes = [dict(route=r.route, method=r.method, status_code=r.status_code, **_stats_row(r))
+              for r in db.session.execute(_STATS_SQL, {"since": since, "limit": limit})]
+    series = [dict(bucket=r.bucket.isoformat(), errors=int(r.errors or 0), **_stats_row(r))
+              for r in db.session.execute(_SERIES_SQL, {"since": since, "route": route})]
+    return {"since": since.isoformat(), "minutes": minutes, "routes": routes, "series": series}
@@ -0,0 +1,169 @@
+"""Кеш результатов детерминированных запросов.
+
+Учебные данные только читаются, поэтому одинаковый запрос на одной версии данных
+всегда даёт одинаковый результат. Ключ — отпечаток запроса (см. query_fingerprint)
+и версия набора данных (app.utils.dataset).
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from bson import json_util
+
+from app.utils.mongosh_pool import one_line, strip_code
+from app.utils.shell_parser import parse_shell_query, ShellParseError
+
+# результат этих запросов зависит от времени или случайности — не кешируем
+NON_DETERMINISTIC = re.compile(r"\$sample|\$rand|\$\$NOW|\$\$CLUSTER_TIME|Date\s*\(\s*\)")
+
+LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+
+
+def _dumps(value, sort_keys):
+    return json.dumps(value, sort_keys=sort_keys, separators=(",", ":"),
+                      ensure_ascii=False, default=json_util.default)
+
+
+def _top_level_sorted(doc, logical=False):
+    """Пары [ключ, значение] верхнего уровня, отсортированные по ключу.
+
+    Порядок важен только для верхнего уровня фильтра/проекции (и условий внутри
+    $and/$or/$nor); вложенные документы-значения MongoDB сравнивает целиком,
+    с учётом порядка ключей, поэтому их оставляем как есть.
+    """
+    if not isinstance(doc, dict):
+        return doc
+    items = []
+    for key in sorted(doc):
+        value = doc[key]
+        if logical and key in LOGICAL_OPERATORS and isinstance(value, list):
+            value = [_top_level_sorted(x, logical=True) for x in value]
+        items.append([key, value])
+    return items
+
+
+def _squeeze(code: str) -> str:
+    """Убирает пробелы вне строковых литералов (между словами оставляет один)."""
+    out = []
+    quote = None
+    pending_space = False
+    i = 0
+    while i < len(code):
+        ch = code[i]
+        if quote:
+            out.append(ch)
+            if ch == "\\" and i + 1 < len(code):
+                out.append(code[i + 1])
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch.isspace():
+            pending_space = True
+        else:
+            word = ch.isalnum() or ch in "_$"
+            if pending_space and out and word and (out[-1].isalnum() or out[-1] in "_$"):
+                out.append(" ")
+            pending_space = False
+            if ch in "'\"`":
+                quote = ch
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def query_fingerprint(code: str):
+    """Нормализованный отпечаток запроса или None, если запрос нельзя кешировать.
+
+    Для разбираемых запросов не важен порядок ключей верхнего уровня фильтра
+    (и условий в $and/$or/$nor) и проекции; во вложенных документах, sort и
+    pipeline он сохраняется (от него зависит результат). Остальной код
+    сравнивается после удаления комментариев, лишних пробелов и хвостовой ';'.
+    """
+    if NON_DETERMINISTIC.search(code):
+        return None
+    try:
+        spec = parse_shell_query(code)
+        canonical = "|".join([
+            spec["collection"],
+            spec["op"],
+            _dumps(_top_level_sorted(spec["filter"], logical=True), False),
+            _dumps(_top_level_sorted(spec["projection"]), False),
+            _dumps(spec["pipeline"], False),
+            _dumps(spec["sort"], False),
+            _dumps(spec["limit"], False),
+        ])
+    except (ShellParseError, TypeError, ValueError):
+        canonical = "raw|" + _squeeze(one_line(strip_code(code)))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Ограниченный LRU-кеш с TTL и счётчиками попаданий."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            expires, value = item
+            if expires <= now:
+                del self._data[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._stats["invalidations"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+        })
+        return stats
+
+
+_cache = None
+
+
+def init_result_cache(app):
+    """Создаёт кеш результатов (RESULT_CACHE_SIZE = 0 — выключен)."""
+    global _cache
+    size = int(app.config.get("RESULT_CACHE_SIZE") or 0)
+    if size > 0 and _cache is None:
+        _cache = ResultCache(size, float(app.config.get("RESULT_CACHE_TTL", 600)))
+    return _cache
+
+
+def get_result_cache():
+    return _cache
@@ -0,0 +1,193 @@
+"""HTTP-клиент для обращений к другим сервисам (auth-service).
+
+Один requests.Session на сервис: пул keep-alive соединений вместо нового TCP на
+каждый вызов, явные таймауты подключения и чтения, повтор идемпотентных
+запросов с экспоненциальной задержкой и случайным разбросом и автомат-
+предохранитель: после SERVICE_BREAKER_FAILURES сбоев подряд запросы
+SERVICE_BREAKER_RESET секунд сразу завершаются ошибкой, не занимая воркеры Flask.
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Предохранитель разомкнут: сервис недавно не отвечал, запрос не отправлялся."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # после паузы пропускаем один пробный запрос (half-open)
+            if not self._trial and time.monotonic() - self._opened_at >= self.reset_after:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._opened_at is None and self._failures >= self.threshold):
+                if self._opened_at is None:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._trial else "open"
+
+
+class ServiceClient:
+    def __init__(self, name, base_url, connect_timeout=2.0, read_timeout=5.0, retries=2,
+                 backoff=0.1, pool_size=20, breaker_failures=5, breaker_reset=10.0):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._rejected = 0
+
+    def request(self, method, path, endpoint=None, **kwargs):
+        """Запрос к сервису. endpoint — метка для метрик (шаблон пути без id).
+
+        Бросает requests.RequestException (CircuitOpenError — если предохранитель разомкнут);
+        ответы 4xx/5xx возвращаются как есть.
+        """
+        method = method.upper()
+        label = f"{method} {endpoint or path}"
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = 1 + (self.retries if method in IDEMPOTENT_METHODS else 0)
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                with self._lock:
+                    self._rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit open")
+            started = time.perf_counter()
+            try:
+                resp = self.session.request(method, self.base_url + path, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._observe(label, started, error=True)
+                self.breaker.failure()
+                if attempt + 1 >= attempts:
+                    raise
+            else:
+                failed = resp.status_code >= 500
+                self._observe(label, started, error=failed)
+                if failed:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()
+                if resp.status_code not in RETRY_STATUSES or attempt + 1 >= attempts:
+                    return resp
+                resp.close()
+            # full jitter: равномерно от 0 до backoff * 2^attempt
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def _observe(self, label, started, error):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._endpoints.get(label)
+            if stats is None:
+                stats = self._endpoints[label] = {"calls": 0, "errors": 0, "latency_sum_ms": 0.0,
+                                                  "latency_max_ms": 0.0}
+            stats["calls"] += 1
+            stats["errors"] += 1 if error else 0
+            stats["latency_sum_ms"] += elapsed_ms
+            stats["latency_max_ms"] = max(stats["latency_max_ms"], elapsed_ms)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            endpoints = {
+                label: {
+                    "calls": s["calls"],
+                    "errors": s["errors"],
+                    "latency_avg_ms": round(s["latency_sum_ms"] / s["calls"], 1) if s["calls"] else None,
+                    "latency_max_ms": round(s["latency_max_ms"], 1),
+                }
+                for label, s in self._endpoints.items()
+            }
+            rejected = self._rejected
+        return {
+            "base_url": self.base_url,
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "rejected_open": rejected,
+            "timeout": list(self.timeout),
+            "retries": self.retries,
+            "endpoints": endpoints,
+        }
+
+
+_clients = {}
+
+
+def init_service_clients(app):
+    """Создаёт клиентов сервисов из конфига (пока только auth-service)."""
+    cfg = app.config
+    if "auth" not in _clients:
+        _clients["auth"] = ServiceClient(
+            "auth-service",
+            cfg.get("AUTH_SERVICE_URL", "http://auth-service:5001"),
+            connect_timeout=float(cfg.get("SERVICE_CONNECT_TIMEOUT", 2)),
+            read_timeout=float(cfg.get("SERVICE_READ_TIMEOUT", 5)),
+            retries=int(cfg.get("SERVICE_RETRIES", 2)),
+            backoff=float(cfg.get("SERVICE_RETRY_BACKOFF", 0.1)),
+            pool_size=int(cfg.get("SERVICE_POOL_SIZE", 20)),
+            breaker_failures=int(cfg.get("SERVICE_BREAKER_FAILURES", 5)),
+            breaker_reset=float(cfg.get("SERVICE_BREAKER_RESET", 10)),
+        )
+    return _clients
+
+
+def get_auth_client() -> ServiceClient:
+    return _clients.get("auth")
+
+
+def service_metrics() -> dict:
+    return {name: client.metrics() for name, client in _clients.items()}
@@ -0,0 +1,322 @@
+"""Разбор mongo shell выражений вида db.<coll>.find(...)/aggregate(...)[.sort()][.limit()]
+в структуру, которую можно выполнить напрямую через PyMongo.
+
+Аргументы разбираются как JSON5 (ключи без кавычек, одинарные кавычки, хвостовые
+запятые). Перед этим shell-литералы ObjectId(), ISODate(), new Date(), NumberInt(),
+NumberLong(), NumberDecimal() и /regex/flags заменяются на служебные объекты, которые
+затем превращаются в BSON-типы. Всё, что разобрать не удалось, приводит к
+ShellParseError — вызывающий код в этом случае выполняет запрос через mongosh.
+"""
+import json
+import re
+from datetime import datetime, timezone
+
+import json5
+from bson import ObjectId, Regex
+from bson.decimal128 import Decimal128
+
+
+class ShellParseError(ValueError):
+    """Выражение не поддерживается нативным движком."""
+
+
+_IDENT = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+_HEAD = re.compile(r"\s*db\s*\.\s*([A-Za-z0-9_]+)\s*\.\s*(find|aggregate)\s*\(", re.IGNORECASE)
+_CHAIN = re.compile(r"\s*\.\s*(sort|limit)\s*\(", re.IGNORECASE)
+
+_OID = "__shell_oid__"
+_DATE = "__shell_date__"
+_REGEX = "__shell_regex__"
+_DECIMAL = "__shell_decimal__"
+
+
+def _skip_string(text, i):
+    """i указывает на открывающую кавычку; возвращает индекс после закрывающей."""
+    quote = text[i]
+    i += 1
+    while i < len(text):
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text[i] == quote:
+            return i + 1
+        i += 1
+    raise ShellParseError("unterminated string")
+
+
+def _skip_regex(text, i):
+    """i указывает на открывающий '/'; возвращает (pattern, flags, конец)."""
+    j = i + 1
+    in_class = False
+    while j < len(text):
+        ch = text[j]
+        if ch == "\\":
+            j += 2
+            continue
+        if ch == "\n":
+            break
+        if ch == "[":
+            in_class = True
+        elif ch == "]":
+            in_class = False
+        elif ch == "/" and not in_class:
+            pattern = text[i + 1:j]
+            k = j + 1
+            while k < len(text) and text[k].isalpha():
+                k += 1
+            return pattern, text[j + 1:k], k
+        j += 1
+    raise ShellParseError("unterminated regex")
+
+
+def _regex_allowed(last):
+    """Регулярное выражение может стоять только на месте значения
+    (last — предыдущий значимый символ)."""
+    return not last or last in ":,[("
+
+
+def _scan(text, i=0):
+    """Итерирует по text, пропуская строки и regex-литералы целиком.
+    Отдаёт (индекс, символ) для символов вне литералов и (индекс, None) для литералов."""
+    last = ""
+    while i < len(text):
+        ch = text[i]
+        if ch in "'\"`":
+            yield i, None
+            i = _skip_string(text, i)
+            last = ch
+            continue
+        if ch == "/" and _regex_allowed(last):
+            yield i, None
+            _, _, i = _skip_regex(text, i)
+            last = "/"
+            continue
+        yield i, ch
+        if not ch.isspace():
+            last = ch
+        i += 1
+
+
+def _find_close(text, i):
+    """i указывает на открывающую скобку; возвращает индекс парной закрывающей."""
+    pairs = {"(": ")", "[": "]", "{": "}"}
+    stack = []
+    for pos, ch in _scan(text, i):
+        if ch is None:
+            continue
+        if ch in pairs:
+            stack.append(pairs[ch])
+        elif ch in ")]}":
+            if not stack or stack.pop() != ch:
+                raise ShellParseError("unbalanced brackets")
+            if not stack:
+                return pos
+    raise ShellParseError("unbalanced brackets")
+
+
+def _split_args(text):
+    """Делит содержимое скобок вызова по запятым верхнего уровня."""
+    args, depth, start = [], 0, 0
+    for pos, ch in _scan(text):
+        if ch is None:
+            continue
+        if ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            args.append(text[start:pos])
+            start = pos + 1
+    args.append(text[start:])
+    args = [a.strip() for a in args]
+    if args == [""]:
+        return []
+    if any(not a for a in args):
+        raise ShellParseError("empty argument")
+    return args
+
+
+def _string_arg(inner):
+    """Аргумент конструктора: строковый литерал или пусто."""
+    inner = inner.strip()
+    if not inner:
+        return None
+    if inner[0] in "'\"" and _skip_string(inner, 0) == len(inner):
+        return json5.loads(inner)
+    raise ShellParseError("unsupported constructor argument")
+
+
+def _to_json5(text):
+    """Заменяет shell-литералы на служебные объекты, остальное оставляет как есть."""
+    out = []
+    last = ""
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch in "'\"":
+            end = _skip_string(text, i)
+            out.append(text[i:end])
+            i, last = end, ch
+            continue
+        if ch == "`":
+            raise ShellParseError("template literals are not supported")
+        if ch == "/" and _regex_allowed(last):
+            pattern, flags, i = _skip_regex(text, i)
+            out.append(json.dumps({_REGEX: [pattern, flags]}))
+            last = "}"
+            continue
+        m = _IDENT.match(text, i)
+        if m and not (last.isalnum() or last in "_$."):
+            name, j = m.group(0), m.end()
+            if name == "new":
+                m = _IDENT.match(text, _skip_ws(text, j))
+                if not m or m.group(0) not in ("Date", "ISODate"):
+                    raise ShellParseError("unsupported constructor")
+                name, j = m.group(0), m.end()
+            k = _skip_ws(text, j)
+            if k < len(text) and text[k] == "(":
+                close_at = _find_close(text, k)
+                out.append(_literal(name, text[k + 1:close_at]))
+                i, last = close_at + 1, "}"
+                continue
+            # ключи объекта без кавычек ({name: 1}) JSON5 разбирает сам
+            if name not in ("true", "false", "null", "Infinity", "NaN") and not text.startswith(":", k):
+                raise ShellParseError(f"unsupported identifier: {name}")
+            out.append(name)
+            i, last = j, name[-1]
+            continue
+        out.append(ch)
+        if not ch.isspace():
+            last = ch
+        i += 1
+    return "".join(out)
+
+
+def _skip_ws(text, i):
+    while i < len(text) and text[i].isspace():
+        i += 1
+    return i
+
+
+def _literal(name, inner):
+    if name == "ObjectId":
+        value = _string_arg(inner)
+        if value is None or not ObjectId.is_valid(value):
+            raise ShellParseError("invalid ObjectId")
+        return json.dumps({_OID: value})
+    if name in ("ISODate", "Date"):
+        return json.dumps({_DATE: _string_arg(inner)})
+    if name in ("NumberInt", "NumberLong"):
+        raw = inner.strip().strip("'\"")
+        try:
+            return str(int(raw))
+        except ValueError:
+            raise ShellParseError(f"invalid {name}")
+    if name == "NumberDecimal":
+        return json.dumps({_DECIMAL: _string_arg(inner) or "0"})
+    raise ShellParseError(f"unsupported function: {name}")
+
+
+def _parse_date(value):
+    if value is None:
+        return datetime.now(timezone.utc)
+    try:
+        if len(value) == 10:
+            return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ShellParseError(f"invalid date: {value}")
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _object_hook(obj):
+    if len(obj) == 1:
+        if _OID in obj:
+            return ObjectId(obj[_OID])
+        if _DATE in obj:
+            return _parse_date(obj[_DATE])
+        if _REGEX in obj:
+            pattern, flags = obj[_REGEX]
+            return Regex(pattern, flags)
+        if _DECIMAL in obj:
+            return Decimal128(obj[_DECIMAL])
+    return obj
+
+
+def parse_shell_value(text):
+    """Разбирает один аргумент shell-вызова в Python/BSON значение."""
+    try:
+        return json5.loads(_to_json5(text), object_hook=_object_hook)
+    except ShellParseError:
+        raise
+    except Exception as e:
+        raise ShellParseError(f"cannot parse argument: {e}")
+
+
+def parse_shell_query(code: str) -> dict:
+    """db.<coll>.find(filter, projection).sort(...).limit(n) / db.<coll>.aggregate([...])
+    -> {"collection", "op", "filter", "projection", "pipeline", "sort", "limit"}."""
+    text = code.strip()
+    if text.endswith(";"):
+        text = text[:-1].rstrip()
+
+    m = _HEAD.match(text)
+    if not m:
+        raise ShellParseError("expected db.<collection>.find/aggregate(...)")
+    coll, op = m.group(1), m.group(2).lower()
+    close_at = _find_close(text, m.end() - 1)
+    args = [parse_shell_value(a) for a in _split_args(text[m.end():close_at])]
+
+    spec = {
+        "collection": coll,
+        "op": op,
+        "filter": None,
+        "projection": None,
+        "pipeline": None,
+        "sort": None,
+        "limit": None,
+    }
+    if op == "find":
+        if len(args) > 2:
+            raise ShellParseError("find options are not supported")
+        for value in args:
+            if not isinstance(value, dict):
+                raise ShellParseError("find arguments must be objects")
+        spec["filter"] = args[0] if args else {}
+        spec["projection"] = args[1] if len(args) > 1 else None
+    else:
+        if len(args) == 1 and isinstance(args[0], list):
+            pipeline = args[0]
+        elif args and all(isinstance(a, dict) for a in args):
+            pipeline = args
+        else:
+            raise ShellParseError("aggregate expects a pipeline array")
+        if not all(isinstance(stage, dict) for stage in pipeline):
+            raise ShellParseError("pipeline stages must be objects")
+        spec["pipeline"] = pipeline
+
+    pos = close_at + 1
+    while pos < len(text):
+        cm = _CHAIN.match(text, pos)
+        if not cm:
+            raise ShellParseError("unsupported method chain")
+        if op != "find":
+            raise ShellParseError("cursor methods after aggregate are not supported")
+        method = cm.group(1).lower()
+        close_at = _find_close(text, cm.end() - 1)
+        chain_args = [parse_shell_value(a) for a in _split_args(text[cm.end():close_at])]
+        if len(chain_args) != 1:
+            raise ShellParseError(f"{method}() expects one argument")
+        value = chain_args[0]
+        if method == "sort":
+            if not isinstance(value, dict):
+                raise ShellParseError("sort() expects an object")
+            spec["sort"] = list(value.items())
+        else:
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ShellParseError("limit() expects an integer")
+            spec["limit"] = value
+        pos = close_at + 1
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+    return spec
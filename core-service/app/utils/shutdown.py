@@ -0,0 +1,53 @@
+"""Сброс буферов при остановке процесса.
+
+Docker останавливает контейнер сигналом SIGTERM, а на нём Python по умолчанию
+завершается сразу, не вызывая atexit: фоновые потоки-демоны теряют всё, что
+не успели записать. Функции, зарегистрированные через on_shutdown, выполняются
+один раз — при обычном выходе (atexit) или по SIGTERM/SIGINT, после чего
+процесс завершается.
+"""
+import atexit
+import signal
+import sys
+import threading
+
+_callbacks = []
+_lock = threading.Lock()
+_installed = False
+
+
+def _run_callbacks():
+    with _lock:
+        callbacks = list(_callbacks)
+        _callbacks.clear()
+    for fn in reversed(callbacks):
+        try:
+            fn()
+        except Exception as e:
+            print(f"[shutdown] {getattr(fn, '__qualname__', fn)} failed: {e}")
+
+
+def _on_signal(signum, frame):
+    _run_callbacks()
+    sys.exit(128 + signum)
+
+
+def _install():
+    atexit.register(_run_callbacks)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        # свой обработчик сервера (gunicorn, worker.py) не подменяем: он завершит
+        # процесс обычным выходом, и функции выполнит atexit
+        if signal.getsignal(sig) in (signal.SIG_DFL, signal.default_int_handler):
+            signal.signal(sig, _on_signal)
+
+
+def on_shutdown(fn):
+    """Выполнить fn при остановке процесса (обычный выход, SIGTERM или SIGINT)."""
+    global _installed
+    with _lock:
+        _callbacks.append(fn)
+        first, _installed = not _installed, True
+    if first:
+        _install()
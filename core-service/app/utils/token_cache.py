@@ -0,0 +1,106 @@
+"""Кеш проверенных токенов.
+
+Пользователь на странице задания шлёт десятки запросов с одним и тем же токеном;
+повторно проверять его (а в режиме AUTH_MODE=remote — ходить в auth-service) не
+нужно. Ключ — SHA-256 токена (сам токен в памяти не храним), значение — итог
+проверки: user_id, флаг админа (если известен) и claims. Запись живёт не дольше
+AUTH_CACHE_TTL и не дольше exp токена. Недействительные токены кешируются
+отдельно на короткий AUTH_NEGATIVE_TTL.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    """LRU с индивидуальным сроком жизни записей и счётчиками попаданий."""
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0,
+                       "expired": 0, "invalidations": 0}
+
+    def get(self, key):
+        """Запись {"user_id", "is_admin", "claims", "error"} или None."""
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            expires, entry = item
+            if expires <= now:
+                del self._data[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["negative_hits" if entry.get("error") else "hits"] += 1
+            return entry
+
+    def _put(self, key, entry, expires):
+        with self._lock:
+            self._data[key] = (expires, entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def put_valid(self, key, user_id, claims=None, is_admin=None, exp=None):
+        """exp — срок действия токена (unix time); запись не переживёт токен."""
+        expires = time.time() + self.ttl
+        if exp is not None:
+            expires = min(expires, float(exp))
+        self._put(key, {"user_id": user_id, "is_admin": is_admin, "claims": claims, "error": None},
+                  expires)
+
+    def put_invalid(self, key, error):
+        self._put(key, {"user_id": None, "is_admin": None, "claims": None, "error": error},
+                  time.time() + self.negative_ttl)
+
+    def invalidate_user(self, user_id):
+        """Убирает записи пользователя (например, после смены прав)."""
+        with self._lock:
+            stale = [k for k, (_, entry) in self._data.items() if entry.get("user_id") == user_id]
+            for k in stale:
+                del self._data[k]
+            self._stats["invalidations"] += len(stale)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats.update({
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "hit_rate": round((stats["hits"] + stats["negative_hits"]) / lookups, 3) if lookups else 0.0,
+        })
+        return stats
+
+
+_cache = None
+
+
+def init_token_cache(app):
+    """Создаёт кеш проверенных токенов (AUTH_CACHE_SIZE = 0 — выключен)."""
+    global _cache
+    size = int(app.config.get("AUTH_CACHE_SIZE") or 0)
+    if size > 0 and _cache is None:
+        _cache = TokenCache(size, float(app.config.get("AUTH_CACHE_TTL", 300)),
+                            float(app.config.get("AUTH_NEGATIVE_TTL", 10)))
+    return _cache
+
+
+def get_token_cache():
+    return _cache
@@ -12,5 +12,120 @@ class Config:
     # Секретный ключ для сессий и токенов
     SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 
+    # Обращения к auth-service: адрес, таймауты (секунд), повторы идемпотентных запросов,
+    # размер пула соединений; после SERVICE_BREAKER_FAILURES сбоев подряд запросы
+    # SERVICE_BREAKER_RESET секунд сразу завершаются ошибкой
+    AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:5001")
+    SERVICE_CONNECT_TIMEOUT = float(os.getenv("SERVICE_CONNECT_TIMEOUT", "2"))
+    SERVICE_READ_TIMEOUT = float(os.getenv("SERVICE_READ_TIMEOUT", "5"))
+    SERVICE_RETRIES = int(os.getenv("SERVICE_RETRIES", "2"))
+    SERVICE_RETRY_BACKOFF = float(os.getenv("SERVICE_RETRY_BACKOFF", "0.1"))
+    SERVICE_POOL_SIZE = int(os.getenv("SERVICE_POOL_SIZE", "20"))
+    SERVICE_BREAKER_FAILURES = int(os.getenv("SERVICE_BREAKER_FAILURES", "5"))
+    SERVICE_BREAKER_RESET = float(os.getenv("SERVICE_BREAKER_RESET", "10"))
+    # массовый импорт: до IMPORT_MAX_ROWS (20000) паролей bcrypt со стоимостью 12 (~250 мс)
+    # на 4 ядрах — около 21 минуты
+    USER_IMPORT_TIMEOUT = float(os.getenv("USER_IMPORT_TIMEOUT", "1800"))
+
+    # Проверка токенов: local — подпись JWT проверяется здесь же (ключ из конфига),
+    # remote — каждый запрос проверяет auth-service (/auth/me)
+    AUTH_MODE = os.getenv("AUTH_MODE", "local")
+    # HS256: общий с auth-service секрет (по умолчанию его SECRET_KEY)
+    JWT_SECRET = os.getenv("JWT_SECRET", SECRET_KEY)
+    JWT_ALGORITHMS = os.getenv("JWT_ALGORITHMS", "HS256")
+    JWT_LEEWAY = int(os.getenv("JWT_LEEWAY", "10"))                        # секунд расхождения часов
+    # асимметричные ключи: набор JWKS auth-service (кешируется на JWT_JWKS_TTL секунд),
+    # например http://auth-service:5001/auth/.well-known/jwks.json и JWT_ALGORITHMS=RS256
+    JWT_JWKS_URL = os.getenv("JWT_JWKS_URL", "")
+    JWT_JWKS_TTL = int(os.getenv("JWT_JWKS_TTL", "300"))
+    # 1 — токены, не прошедшие локальную проверку, перепроверять через auth-service
+    AUTH_REMOTE_FALLBACK = os.getenv("AUTH_REMOTE_FALLBACK", "0") == "1"
+
+    # Кеш проверенных токенов (ключ — SHA-256 токена; 0 — выключен): запись живёт
+    # не дольше AUTH_CACHE_TTL и срока действия токена, недействительные — AUTH_NEGATIVE_TTL
+    AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+    AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))              # секунд
+    AUTH_NEGATIVE_TTL = int(os.getenv("AUTH_NEGATIVE_TTL", "10"))         # секунд
+
+    # Права админа: по умолчанию берутся из роли в проверенном токене; ADMIN_LIVE_CHECK=1 —
+    # всегда спрашивать auth-service (ответ кешируется на ADMIN_CACHE_TTL секунд)
+    ADMIN_LIVE_CHECK = os.getenv("ADMIN_LIVE_CHECK", "0") == "1"
+    ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "30"))
+
     # Администраторы (переменная окружения, список админов через запятую)
     ADMIN_EMAILS = os.getenv("ADMIN_EMAILS", "admin@example.com")
+
+    # Движок выполнения попыток: native — разбор shell-кода и выполнение через PyMongo
+    # (с откатом на mongosh для неподдерживаемого синтаксиса), mongosh — всегда mongosh
+    QUERY_ENGINE = os.getenv("QUERY_ENGINE", "native")
+
+    # Пул прогретых mongosh-воркеров (0 — запускать mongosh на каждую попытку)
+    MONGOSH_POOL_SIZE = int(os.getenv("MONGOSH_POOL_SIZE", "4"))
+    MONGOSH_WORKER_MAX_JOBS = int(os.getenv("MONGOSH_WORKER_MAX_JOBS", "500"))      # переработка после N заданий
+    MONGOSH_WORKER_MAX_RSS_MB = int(os.getenv("MONGOSH_WORKER_MAX_RSS_MB", "300"))  # или при росте памяти
+
+    # Версия учебных данных (вместе с меткой из коллекции _dataset_meta) и кеш результатов
+    DATASET_VERSION = os.getenv("DATASET_VERSION", "1")
+    DATASET_VERSION_TTL = int(os.getenv("DATASET_VERSION_TTL", "5"))      # секунд
+    RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "5000"))      # 0 — кеш выключен
+    RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "600"))         # секунд
+
+    # Кеш контекстов проверки заданий (сбрасывается при изменении задания;
+    # TTL ограничивает устаревание в других процессах)
+    GRADING_CONTEXT_SIZE = int(os.getenv("GRADING_CONTEXT_SIZE", "1000"))   # 0 — без кеша
+    GRADING_CONTEXT_TTL = int(os.getenv("GRADING_CONTEXT_TTL", "60"))       # секунд
+
+    # Каталог коллекций (имена, число документов, примеры) для диагностики пустых результатов
+    CATALOG_TTL = int(os.getenv("CATALOG_TTL", "300"))              # секунд; 0 — без диагностики
+    CATALOG_SAMPLE_SIZE = int(os.getenv("CATALOG_SAMPLE_SIZE", "5"))
+
+    # Контроль допуска: сколько попыток выполняется одновременно, сколько ждёт
+    # в очереди и сколько может быть в работе у одного пользователя (0 — без лимитов)
+    ATTEMPTS_MAX_CONCURRENT = int(os.getenv("ATTEMPTS_MAX_CONCURRENT", "8"))
+    ATTEMPTS_MAX_QUEUED = int(os.getenv("ATTEMPTS_MAX_QUEUED", "32"))
+    ATTEMPTS_QUEUE_TIMEOUT = float(os.getenv("ATTEMPTS_QUEUE_TIMEOUT", "10"))  # секунд ожидания слота
+    ATTEMPTS_PER_USER = int(os.getenv("ATTEMPTS_PER_USER", "2"))
+
+    # Журнал запросов (request_logs): очередь в памяти (0 — журнал выключен; при
+    # переполнении вытесняются самые старые записи), пачки и интервал записи,
+    # обрезка тел запросов и доля запросов, у которых тело сохраняется (0..1)
+    REQUEST_LOG_QUEUE = int(os.getenv("REQUEST_LOG_QUEUE", "10000"))
+    REQUEST_LOG_BATCH = int(os.getenv("REQUEST_LOG_BATCH", "500"))
+    REQUEST_LOG_INTERVAL = float(os.getenv("REQUEST_LOG_INTERVAL", "1.0"))         # секунд
+    REQUEST_LOG_PAYLOAD_MAX = int(os.getenv("REQUEST_LOG_PAYLOAD_MAX", "2048"))    # байт
+    REQUEST_LOG_PAYLOAD_SAMPLE = float(os.getenv("REQUEST_LOG_PAYLOAD_SAMPLE", "1.0"))
+    # Postgres: request_logs секционирована по дням — секции создаются на
+    # REQUEST_LOG_PARTITIONS_AHEAD дней вперёд, старше срока хранения удаляются
+    REQUEST_LOG_RETENTION_DAYS = int(os.getenv("REQUEST_LOG_RETENTION_DAYS", "14"))
+    REQUEST_LOG_ROLLUP_RETENTION_DAYS = int(os.getenv("REQUEST_LOG_ROLLUP_RETENTION_DAYS", "90"))
+    REQUEST_LOG_PARTITIONS_AHEAD = int(os.getenv("REQUEST_LOG_PARTITIONS_AHEAD", "2"))
+    REQUEST_LOG_MAINTENANCE_INTERVAL = float(os.getenv("REQUEST_LOG_MAINTENANCE_INTERVAL", "3600"))  # секунд
+
+    # Запись попыток: 1 — через буфер, который фоновый поток сбрасывает многострочным
+    # INSERT по размеру пачки или по интервалу (и при остановке процесса)
+    ATTEMPTS_WRITE_BEHIND = os.getenv("ATTEMPTS_WRITE_BEHIND", "0") == "1"
+    ATTEMPTS_WRITE_BATCH = int(os.getenv("ATTEMPTS_WRITE_BATCH", "200"))
+    ATTEMPTS_WRITE_INTERVAL = float(os.getenv("ATTEMPTS_WRITE_INTERVAL", "0.5"))     # секунд
+    ATTEMPTS_WRITE_MAX_BUFFER = int(os.getenv("ATTEMPTS_WRITE_MAX_BUFFER", "10000"))  # дальше — сразу
+
+    # Асинхронные попытки: потоки проверки, ограничение очереди, сколько держать результат
+    ATTEMPTS_ASYNC_WORKERS = int(os.getenv("ATTEMPTS_ASYNC_WORKERS", "8"))   # 0 — только синхронно
+    ATTEMPTS_ASYNC_QUEUE = int(os.getenv("ATTEMPTS_ASYNC_QUEUE", "100"))
+    ATTEMPTS_RESULT_TTL = int(os.getenv("ATTEMPTS_RESULT_TTL", "300"))       # секунд
+
+    # Где выполняются асинхронные попытки: memory — потоки HTTP-процесса,
+    # postgres — очередь grading_jobs, которую разбирают отдельные воркеры (worker.py)
+    ATTEMPTS_QUEUE = os.getenv("ATTEMPTS_QUEUE", "memory")
+    GRADING_WORKER_CONCURRENCY = int(os.getenv("GRADING_WORKER_CONCURRENCY", "4"))
+    GRADING_VISIBILITY_TIMEOUT = int(os.getenv("GRADING_VISIBILITY_TIMEOUT", "60"))  # секунд аренды задания
+    GRADING_MAX_ATTEMPTS = int(os.getenv("GRADING_MAX_ATTEMPTS", "3"))                # потом dead-letter
+    GRADING_RETRY_BACKOFF = float(os.getenv("GRADING_RETRY_BACKOFF", "2"))            # секунд, удваивается
+    GRADING_POLL_INTERVAL = float(os.getenv("GRADING_POLL_INTERVAL", "1"))            # секунд
+
+    # Эталонные решения: как часто проверять версию данных и сколько эталонов считать параллельно
+    REFERENCE_REFRESH_INTERVAL = int(os.getenv("REFERENCE_REFRESH_INTERVAL", "60"))  # секунд; 0 — выкл.
+    REFERENCE_PARALLELISM = int(os.getenv("REFERENCE_PARALLELISM", "4"))
+
+    # Перепроверка сохранённых попыток после изменения тестов
+    REGRADE_PROCESSES = int(os.getenv("REGRADE_PROCESSES", "2"))   # процессов для сравнения
+    REGRADE_CHUNK = int(os.getenv("REGRADE_CHUNK", "1000"))        # строк queries за одно чтение
@@ -0,0 +1,20 @@
+from app.utils.result_cache import query_fingerprint
+
+
+def test_embedded_document_key_order_changes_fingerprint():
+    # вложенный документ MongoDB сравнивает с учётом порядка ключей
+    a = query_fingerprint('db.users.find({address: {city: "A", zip: "1"}})')
+    b = query_fingerprint('db.users.find({address: {zip: "1", city: "A"}})')
+    assert a != b
+
+
+def test_top_level_key_order_does_not_change_fingerprint():
+    a = query_fingerprint('db.users.find({age: 30, name: "A"}, {name: 1, _id: 0})')
+    b = query_fingerprint('db.users.find({name: "A", age: 30}, {_id: 0, name: 1})')
+    assert a == b
+
+
+def test_logical_operator_conditions_are_normalized():
+    a = query_fingerprint('db.users.find({$or: [{age: 30, name: "A"}, {city: "B"}]})')
+    b = query_fingerprint('db.users.find({$or: [{name: "A", age: 30}, {city: "B"}]})')
+    assert a == b
@@ -0,0 +1,41 @@
+"""Перепроверка эталонных решений всех заданий.
+
+    python validate_references.py [--stale] [--parallelism 8]
+
+Печатает отчёт по каждому заданию и возвращает код 1, если какой-то эталон
+не выполнился или перестал проходить тесты задания.
+"""
+import argparse
+import json
+import os
+import sys
+
+# CLI не нужны фоновые потоки HTTP-сервиса
+os.environ["ATTEMPTS_ASYNC_WORKERS"] = "0"
+os.environ["REFERENCE_REFRESH_INTERVAL"] = "0"
+
+from app import create_app
+from app.utils.reference import refresh_all
+
+
+def main():
+    app = create_app()
+    parser = argparse.ArgumentParser(description="Re-validate assignment reference solutions")
+    parser.add_argument("--stale", action="store_true",
+                        help="only references computed on an older dataset version")
+    parser.add_argument("--parallelism", type=int,
+                        default=app.config.get("REFERENCE_PARALLELISM", 4))
+    args = parser.parse_args()
+
+    reports = refresh_all(app, only_stale=args.stale, parallelism=args.parallelism)
+    failed = 0
+    for r in reports:
+        broken = r["status"] == "error" or any(not t["passed"] for t in r.get("tests", []))
+        failed += broken
+        print(json.dumps(r, ensure_ascii=False, default=str))
+    print(f"{len(reports)} reference(s) checked, {failed} problem(s)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Воркер проверки попыток: разбирает очередь grading_jobs в Postgres.
+
+Запускается отдельно от HTTP-сервиса (ATTEMPTS_QUEUE=postgres), в любом
+количестве экземпляров и на любых машинах с доступом к Postgres и MongoDB:
+
+    python worker.py --concurrency 8
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# воркеру не нужен внутрипроцессный пул асинхронных попыток HTTP-сервиса
+os.environ["ATTEMPTS_ASYNC_WORKERS"] = "0"
+
+from app import create_app, db
+from app.models.query import Query
+from app.utils import job_queue
+from app.utils.attempt_jobs import PENDING_STATUSES
+from app.utils.grading import grade_attempt, _safe_rollback
+
+
+class RetryableError(Exception):
+    """Сбой инфраструктуры (БД, mongosh) — задание стоит повторить."""
+
+
+class GradingWorker:
+    def __init__(self, app, concurrency, visibility, backoff, poll_interval):
+        self.app = app
+        self.concurrency = concurrency
+        self.visibility = visibility
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="grade")
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Event()
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        print(f"[worker {self.name}] stopping, waiting for {len(self._inflight)} job(s)")
+        self._stop.set()
+        self._slot_freed.set()
+
+    def run(self):
+        print(f"[worker {self.name}] started: concurrency={self.concurrency}, "
+              f"visibility={self.visibility}s")
+        threading.Thread(target=self._heartbeat, name="lease", daemon=True).start()
+        while not self._stop.is_set():
+            with self._lock:
+                free = self.concurrency - len(self._inflight)
+            if free <= 0:
+                self._slot_freed.wait(self.poll_interval)
+                self._slot_freed.clear()
+                continue
+
+            with self.app.app_context():
+                try:
+                    dead = job_queue.reap_expired()
+                    if dead:
+                        print(f"[worker {self.name}] dead-lettered abandoned attempts: {dead}")
+                    jobs = job_queue.claim(self.name, free, self.visibility)
+                except Exception as e:
+                    print(f"[worker {self.name}] claim failed: {e}")
+                    _safe_rollback()
+                    jobs = []
+                finally:
+                    db.session.remove()
+
+            if not jobs:
+                self._stop.wait(self.poll_interval)
+                continue
+            for job in jobs:
+                with self._lock:
+                    self._inflight.add(job[0])
+                self._executor.submit(self._process, *job)
+
+        self._executor.shutdown(wait=True)
+        print(f"[worker {self.name}] stopped")
+
+    def _heartbeat(self):
+        """Продлевает аренду выполняемых заданий, пока воркер жив."""
+        interval = max(1.0, self.visibility / 3)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                ids = list(self._inflight)
+            if not ids:
+                if self._stop.is_set():
+                    return
+                continue
+            with self.app.app_context():
+                try:
+                    job_queue.extend(self.name, ids, self.visibility)
+                except Exception as e:
+                    print(f"[worker {self.name}] lease extension failed: {e}")
+                    _safe_rollback()
+                finally:
+                    db.session.remove()
+
+    def _process(self, job_id, query_id, attempts, max_attempts):
+        with self.app.app_context():
+            try:
+                q = Query.query.get(query_id)
+                # попытка удалена или уже проверена (повтор после сбоя на записи статуса)
+                if q is None or q.status not in PENDING_STATUSES:
+                    job_queue.complete(self.name, job_id)
+                    return
+                q.status = "running"
+                db.session.commit()
+
+                payload, status = grade_attempt(q.user_id, q.assignment_id, q.query_text, q=q)
+                # 504 — лимит времени самого запроса, повтор ничего не изменит
+                if status >= 500 and status != 504:
+                    raise RetryableError(payload.get("details") or payload.get("error"))
+                job_queue.complete(self.name, job_id)
+            except Exception as e:
+                _safe_rollback()
+                try:
+                    dead = job_queue.fail(self.name, job_id, query_id, attempts, max_attempts,
+                                          str(e), self.backoff)
+                    state = "dead-lettered" if dead else "will retry"
+                    print(f"[worker {self.name}] job {job_id} (attempt {attempts}/{max_attempts}) "
+                          f"failed, {state}: {e}")
+                except Exception as e2:
+                    # аренда истечёт, и задание заберёт другой воркер
+                    print(f"[worker {self.name}] failed to record failure of job {job_id}: {e2}")
+                    _safe_rollback()
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._inflight.discard(job_id)
+                self._slot_freed.set()
+
+
+def main():
+    app = create_app()
+    parser = argparse.ArgumentParser(description="Grading worker for the Postgres job queue")
+    parser.add_argument("--concurrency", type=int,
+                        default=app.config.get("GRADING_WORKER_CONCURRENCY", 4))
+    parser.add_argument("--visibility-timeout", type=float,
+                        default=app.config.get("GRADING_VISIBILITY_TIMEOUT", 60))
+    parser.add_argument("--backoff", type=float,
+                        default=app.config.get("GRADING_RETRY_BACKOFF", 2))
+    parser.add_argument("--poll-interval", type=float,
+                        default=app.config.get("GRADING_POLL_INTERVAL", 1))
+    args = parser.parse_args()
+
+    worker = GradingWorker(app, max(1, args.concurrency), args.visibility_timeout,
+                           args.backoff, args.poll_interval)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    print(">>> Grading worker запускается...")
+    main()
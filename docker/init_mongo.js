@@ -18,3 +18,10 @@ db.products.insertMany([
   { _id: 2, product: "TV", price: 2000 },
   { _id: 3, product: "Laptop", price: 3000 }
 ]);
+
+// Метка версии данных: core-service кеширует результаты запросов по этой версии
+db._dataset_meta.updateOne(
+  { _id: "version" },
+  { $set: { version: new Date().toISOString() } },
+  { upsert: true }
+);
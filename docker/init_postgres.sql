@@ -41,6 +41,10 @@ CREATE TABLE IF NOT EXISTS assignment_tests (
     test_id SERIAL PRIMARY KEY,
     assignment_id INTEGER NOT NULL REFERENCES assignments(assignment_id) ON DELETE CASCADE,
     expected_result JSONB NOT NULL,
+    expected_hashes JSONB,           -- хеши документов (заполняет core-service при записи теста)
+    expected_digest VARCHAR(100),    -- общий дайджест результата
+    compare_mode VARCHAR(20) CHECK (compare_mode IN ('ordered','unordered','subset','tolerance')),
+    tolerance DOUBLE PRECISION,      -- допуск для чисел в режиме tolerance
     test_description TEXT NOT NULL,
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
 );
@@ -65,7 +69,7 @@ CREATE TABLE IF NOT EXISTS queries (
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     assignment_id INTEGER NOT NULL REFERENCES assignments(assignment_id) ON DELETE CASCADE,
     query_text TEXT NOT NULL,
-    status VARCHAR(50) NOT NULL CHECK (status IN ('ok','failed','error')),
+    status VARCHAR(50) NOT NULL CHECK (status IN ('pending','running','ok','failed','error')),
     result JSONB,
     error_message TEXT,
     error_json JSONB,
@@ -73,6 +77,108 @@ CREATE TABLE IF NOT EXISTS queries (
     result_count INT,
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
 );
+-- ==========================
+-- Очередь проверки попыток (worker.py забирает через FOR UPDATE SKIP LOCKED)
+-- ==========================
+CREATE TABLE IF NOT EXISTS grading_jobs (
+    job_id SERIAL PRIMARY KEY,
+    query_id INTEGER NOT NULL REFERENCES queries(query_id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued','running','done','dead')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(255),
+    locked_until TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ==========================
+-- Журнал запросов (пишет core-service пачками, см. app/utils/request_log.py):
+-- дневные секции по created_at, старые удаляются по сроку хранения
+-- ==========================
+CREATE TABLE IF NOT EXISTS request_logs (
+    id BIGSERIAL,
+    path VARCHAR(512) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    route VARCHAR(200),
+    assignment_id INTEGER,
+    status_code INTEGER,
+    user_id INTEGER,
+    latency_ms INTEGER,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'UTC'),
+    payload TEXT,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE INDEX IF NOT EXISTS idx_request_logs_created ON request_logs(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_request_logs_assignment ON request_logs(assignment_id, created_at DESC)
+    WHERE assignment_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_request_logs_route ON request_logs(route, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_request_logs_user ON request_logs(user_id, created_at DESC)
+    WHERE user_id IS NOT NULL;
+
+-- Дневная секция request_logs_pYYYYMMDD (core-service создаёт их заранее)
+CREATE OR REPLACE FUNCTION request_logs_ensure_partition(day DATE) RETURNS VOID AS $$
+DECLARE
+    part TEXT := 'request_logs_p' || to_char(day, 'YYYYMMDD');
+BEGIN
+    IF to_regclass(part) IS NULL THEN
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF request_logs FOR VALUES FROM (%L) TO (%L)',
+                       part, day, day + 1);
+    END IF;
+END $$ LANGUAGE plpgsql;
+
+-- Удаляет дневные секции старше keep_days дней; возвращает число удалённых
+CREATE OR REPLACE FUNCTION request_logs_drop_partitions(keep_days INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    r RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    FOR r IN
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'request_logs'::regclass
+          AND c.relname ~ '^request_logs_p[0-9]{8}$'
+          AND to_date(substring(c.relname FROM 15), 'YYYYMMDD') < (now() AT TIME ZONE 'UTC')::date - keep_days
+    LOOP
+        EXECUTE format('DROP TABLE IF EXISTS %I', r.relname);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END $$ LANGUAGE plpgsql;
+SELECT request_logs_ensure_partition((now() AT TIME ZONE 'UTC')::date + d) FROM generate_series(0, 2) AS d;
+
+-- Поминутные агрегаты журнала (их читает админка вместо сырых строк)
+CREATE TABLE IF NOT EXISTS request_log_minutes (
+    bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    route VARCHAR(200) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    status_code INTEGER NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    latency_sum_ms BIGINT NOT NULL DEFAULT 0,
+    latency_max_ms INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, route, method, status_code)
+);
+CREATE INDEX IF NOT EXISTS idx_request_log_minutes_route ON request_log_minutes(route, bucket);
+
+-- ==========================
+-- Refresh-токены (auth-service): хранится только SHA-256 токена,
+-- family_id — цепочка ротации (повторное использование отзывает всю цепочку)
+-- ==========================
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    token_hash VARCHAR(64) NOT NULL UNIQUE,
+    family_id VARCHAR(36) NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() AT TIME ZONE 'UTC'),
+    expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    used_at TIMESTAMP WITHOUT TIME ZONE,
+    revoked_at TIMESTAMP WITHOUT TIME ZONE
+);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family ON refresh_tokens(family_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens(user_id);
+
 ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT FALSE;
 
 
@@ -85,10 +191,28 @@ CREATE INDEX IF NOT EXISTS idx_assignment_tests_assignment_id ON assignment_test
 CREATE INDEX IF NOT EXISTS idx_completed_assignments_user_id ON completed_assignments(user_id);
 CREATE INDEX IF NOT EXISTS idx_queries_user_id ON queries(user_id);
 CREATE INDEX IF NOT EXISTS idx_queries_assignment_id ON queries(assignment_id);
+CREATE INDEX IF NOT EXISTS idx_grading_jobs_claim ON grading_jobs(status, run_after)
+    WHERE status IN ('queued','running');
+
+-- Поиск пользователей в админке (ILIKE '%...%' по email и имени) — триграммные индексы
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON users USING gin ((first_name || ' ' || last_name) gin_trgm_ops);
 
 ALTER TABLE assignments
 ADD COLUMN schema_json JSONB;
 
+-- Эталонное решение и его предвычисленный результат (пересчитывает core-service)
+ALTER TABLE assignments
+    ADD COLUMN reference_query TEXT,
+    ADD COLUMN reference_result JSONB,
+    ADD COLUMN reference_hashes JSONB,
+    ADD COLUMN reference_digest VARCHAR(100),
+    ADD COLUMN reference_count INT,
+    ADD COLUMN reference_version VARCHAR(100),
+    ADD COLUMN reference_error TEXT,
+    ADD COLUMN reference_updated_at TIMESTAMPTZ;
+
 -- ===== Темы =====
 INSERT INTO topics (title, description, difficulty) VALUES
 ('Mongo Basics', 'Базовые запросы find/projection/sort/limit', 'easy'),
@@ -13,16 +13,97 @@ BEGIN
     END IF;
 END$$;
 
--- 2) Create request_logs table if missing
+-- 2) request_logs: partitioned by day (core-service creates partitions ahead and
+--    drops ones older than REQUEST_LOG_RETENTION_DAYS). A plain table from older
+--    installs is renamed and its rows are copied into the new layout below.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'request_logs' AND relkind = 'r') THEN
+        ALTER TABLE request_logs RENAME TO request_logs_legacy;
+    END IF;
+END$$;
+
 CREATE TABLE IF NOT EXISTS request_logs (
-    id serial PRIMARY KEY,
-    path varchar(512) NOT NULL,
-    method varchar(10) NOT NULL,
-    status_code integer,
-    user_id integer,
-    created_at timestamp without time zone DEFAULT now(),
-    payload text
+    id BIGSERIAL,
+    path VARCHAR(512) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    route VARCHAR(200),
+    assignment_id INTEGER,
+    status_code INTEGER,
+    user_id INTEGER,
+    latency_ms INTEGER,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'UTC'),
+    payload TEXT,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE INDEX IF NOT EXISTS idx_request_logs_created ON request_logs(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_request_logs_assignment ON request_logs(assignment_id, created_at DESC)
+    WHERE assignment_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_request_logs_route ON request_logs(route, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_request_logs_user ON request_logs(user_id, created_at DESC)
+    WHERE user_id IS NOT NULL;
+
+-- Дневная секция request_logs_pYYYYMMDD (core-service создаёт их заранее)
+CREATE OR REPLACE FUNCTION request_logs_ensure_partition(day DATE) RETURNS VOID AS $$
+DECLARE
+    part TEXT := 'request_logs_p' || to_char(day, 'YYYYMMDD');
+BEGIN
+    IF to_regclass(part) IS NULL THEN
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF request_logs FOR VALUES FROM (%L) TO (%L)',
+                       part, day, day + 1);
+    END IF;
+END $$ LANGUAGE plpgsql;
+
+-- Удаляет дневные секции старше keep_days дней; возвращает число удалённых
+CREATE OR REPLACE FUNCTION request_logs_drop_partitions(keep_days INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    r RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    FOR r IN
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'request_logs'::regclass
+          AND c.relname ~ '^request_logs_p[0-9]{8}$'
+          AND to_date(substring(c.relname FROM 15), 'YYYYMMDD') < (now() AT TIME ZONE 'UTC')::date - keep_days
+    LOOP
+        EXECUTE format('DROP TABLE IF EXISTS %I', r.relname);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END $$ LANGUAGE plpgsql;
+SELECT request_logs_ensure_partition((now() AT TIME ZONE 'UTC')::date + d) FROM generate_series(0, 2) AS d;
+
+DO $$
+DECLARE
+    first_day DATE;
+BEGIN
+    IF to_regclass('request_logs_legacy') IS NOT NULL THEN
+        SELECT min(created_at)::date INTO first_day FROM request_logs_legacy;
+        IF first_day IS NOT NULL THEN
+            PERFORM request_logs_ensure_partition(d::date)
+            FROM generate_series(first_day, (now() AT TIME ZONE 'UTC')::date, interval '1 day') AS d;
+        END IF;
+        INSERT INTO request_logs (path, method, assignment_id, status_code, user_id, created_at, payload)
+        SELECT path, method, substring(path FROM '/assignments/([0-9]{1,9})')::integer,
+               status_code, user_id, coalesce(created_at, now() AT TIME ZONE 'UTC'), payload
+        FROM request_logs_legacy;
+        DROP TABLE request_logs_legacy;
+    END IF;
+END$$;
+
+-- Поминутные агрегаты журнала (их читает админка вместо сырых строк)
+CREATE TABLE IF NOT EXISTS request_log_minutes (
+    bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    route VARCHAR(200) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    status_code INTEGER NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    latency_sum_ms BIGINT NOT NULL DEFAULT 0,
+    latency_max_ms INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, route, method, status_code)
 );
+CREATE INDEX IF NOT EXISTS idx_request_log_minutes_route ON request_log_minutes(route, bucket);
 
 -- 3) Ensure queries table exists with FK to users(id) - only add FK if users table exists
 CREATE TABLE IF NOT EXISTS queries (
@@ -64,4 +145,67 @@ BEGIN
     END IF;
 END$$;
 
+-- Queue statuses for asynchronous attempts (pending -> running -> ok/failed/error)
+ALTER TABLE queries DROP CONSTRAINT IF EXISTS queries_status_check;
+ALTER TABLE queries ADD CONSTRAINT queries_status_check
+    CHECK (status IN ('pending','running','ok','failed','error'));
+
+-- Postgres-backed grading queue consumed by core-service/worker.py
+CREATE TABLE IF NOT EXISTS grading_jobs (
+    job_id SERIAL PRIMARY KEY,
+    query_id INTEGER NOT NULL REFERENCES queries(query_id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued','running','done','dead')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after TIMESTAMP without time zone DEFAULT now(),
+    locked_by VARCHAR(255),
+    locked_until TIMESTAMP without time zone,
+    last_error TEXT,
+    created_at TIMESTAMP without time zone DEFAULT now(),
+    updated_at TIMESTAMP without time zone DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_grading_jobs_claim ON grading_jobs(status, run_after)
+    WHERE status IN ('queued','running');
+
+-- Canonical hashes of expected results (filled by core-service when tests are written;
+-- tests without them are hashed when the grading context is built)
+ALTER TABLE assignment_tests ADD COLUMN IF NOT EXISTS expected_hashes jsonb;
+ALTER TABLE assignment_tests ADD COLUMN IF NOT EXISTS expected_digest varchar(100);
+
+-- Per-test comparison mode (NULL = assignment schema_json.compare_mode, else ordered)
+ALTER TABLE assignment_tests ADD COLUMN IF NOT EXISTS compare_mode varchar(20);
+ALTER TABLE assignment_tests ADD COLUMN IF NOT EXISTS tolerance double precision;
+ALTER TABLE assignment_tests DROP CONSTRAINT IF EXISTS assignment_tests_compare_mode_check;
+ALTER TABLE assignment_tests ADD CONSTRAINT assignment_tests_compare_mode_check
+    CHECK (compare_mode IN ('ordered','unordered','subset','tolerance'));
+
+-- Reference solutions with precomputed results (see core-service app/utils/reference.py)
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS reference_query text;
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS reference_result jsonb;
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS reference_hashes jsonb;
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS reference_digest varchar(100);
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS reference_count integer;
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS reference_version varchar(100);
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS reference_error text;
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS reference_updated_at timestamp without time zone;
+
+-- Refresh tokens (auth-service /auth/refresh): only SHA-256 hashes are stored
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    token_hash VARCHAR(64) NOT NULL UNIQUE,
+    family_id VARCHAR(36) NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() AT TIME ZONE 'UTC'),
+    expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    used_at TIMESTAMP WITHOUT TIME ZONE,
+    revoked_at TIMESTAMP WITHOUT TIME ZONE
+);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family ON refresh_tokens(family_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens(user_id);
+
+-- Поиск пользователей в админке (ILIKE '%...%' по email и имени) — триграммные индексы
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON users USING gin ((first_name || ' ' || last_name) gin_trgm_ops);
+
 -- End of migration SQL
@@ -4,10 +4,15 @@ import api from './api';
 export const adminApi = {
   listLogs: (params) => api.get('/admin/logs', { params }),
   getLog: (id) => api.get(`/admin/logs/${id}`),
-  listUsers: () => api.get('/admin/users'),
+  logStats: (params) => api.get('/admin/logs/stats', { params }),
+  listUsers: (params) => api.get('/admin/users', { params }),
   getUser: (id) => api.get(`/admin/users/${id}`),
   updateUser: (id, data) => api.put(`/admin/users/${id}`, data),
   deleteUser: (id) => api.delete(`/admin/users/${id}`),
+  // file: CSV (email,first_name,last_name,password[,is_admin]) or NDJSON
+  importUsers: (file) => api.post('/admin/users/import', file, {
+    headers: { 'Content-Type': file.name && file.name.endsWith('.csv') ? 'text/csv' : 'application/x-ndjson' },
+  }),
 };
 
 export default adminApi;
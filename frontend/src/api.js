@@ -35,11 +35,56 @@ coreApi.interceptors.response.use(
   }
 );
 
+// Access-токен живёт 30 минут: на 401 один раз обмениваем refresh-токен на новую пару
+// (без повторного входа) и повторяем запрос. Параллельные 401 ждут один общий обмен.
+let refreshing = null;
+
+function refreshTokens() {
+  const refreshToken = localStorage.getItem("refresh_token");
+  if (!refreshToken) return Promise.reject(new Error("no refresh token"));
+  if (!refreshing) {
+    refreshing = authApi
+      .post(`/refresh`, { refresh_token: refreshToken }, { _noRefresh: true })
+      .then(({ data }) => {
+        localStorage.setItem("token", data.access_token);
+        localStorage.setItem("refresh_token", data.refresh_token);
+        return data.access_token;
+      })
+      .catch((e) => {
+        localStorage.removeItem("refresh_token");
+        throw e;
+      })
+      .finally(() => { refreshing = null; });
+  }
+  return refreshing;
+}
+
+function retryWithRefresh(instance) {
+  return async (err) => {
+    const config = err?.config;
+    if (err?.response?.status !== 401 || !config || config._noRefresh || config._retried) {
+      return Promise.reject(err);
+    }
+    try {
+      const token = await refreshTokens();
+      config._retried = true;
+      config.headers.Authorization = `Bearer ${token}`;
+      return instance(config);
+    } catch (e) {
+      return Promise.reject(err);
+    }
+  };
+}
+
+authApi.interceptors.response.use((res) => res, retryWithRefresh(authApi));
+coreApi.interceptors.response.use((res) => res, retryWithRefresh(coreApi));
+
 // auth
 export const authApiMethods = {
   // authApi.baseURL уже содержит /auth (по умолчанию), поэтому эндпоинты относительные
   register: (payload) => authApi.post(`/register`, payload),
-  login: (payload) => authApi.post(`/login`, payload),
+  login: (payload) => authApi.post(`/login`, payload, { _noRefresh: true }),
+  logout: (refreshToken) => authApi.post(`/logout`, { refresh_token: refreshToken }, { _noRefresh: true }),
   me: () => authApi.get(`/me`),
   isAdmin: (userId) => authApi.get(`/is-admin/${userId}`),
 };
@@ -47,6 +47,7 @@ export default function AuthProvider({ children }) {
       }
 
       localStorage.setItem("token", t);
+      if (data.refresh_token) localStorage.setItem("refresh_token", data.refresh_token);
       setToken(t);
   console.log("[Auth] token saved", t);
 
@@ -84,6 +85,9 @@ export default function AuthProvider({ children }) {
   };
 
   const logout = () => {
+    const refreshToken = localStorage.getItem("refresh_token");
+    if (refreshToken) authApiMethods.logout(refreshToken).catch(() => {});
+    localStorage.removeItem("refresh_token");
     localStorage.removeItem("token");
     setToken(null);
     setUser(null);
@@ -10,6 +10,7 @@ export default function AdminLogs(){
   const [page, setPage] = useState(0);
   const [selected, setSelected] = useState(null);
   const [warning, setWarning] = useState(null);
+  const [stats, setStats] = useState([]);
 
   const load = ()=>{
     const params = { offset: page*50, limit:50 };
@@ -33,6 +34,11 @@ export default function AdminLogs(){
 
   useEffect(()=>{ load(); }, [page]);
 
+  // aggregates come from per-minute rollups, not from raw log rows
+  useEffect(()=>{
+    adminApi.logStats({ minutes: 60 }).then(r=>setStats((r.data && r.data.routes) || [])).catch(()=>setStats([]));
+  }, []);
+
   return (
     <div className="card" style={{padding:18}}>
       <h2 style={{marginTop:0}}>Logs</h2>
@@ -43,8 +49,29 @@ export default function AdminLogs(){
         <button className='btn' onClick={()=>{setPage(0); load();}}>Search</button>
       </div>
 
+      {stats.length > 0 && (
+        <div style={{marginBottom:16}}>
+          <h3 style={{margin:'4px 0'}}>Last hour by route</h3>
+          <table className="table" style={{width:'100%', borderCollapse:'collapse'}}>
+            <thead><tr><th>Route</th><th>Method</th><th>Status</th><th>Requests</th><th>Avg ms</th><th>Max ms</th></tr></thead>
+            <tbody>
+              {stats.slice(0, 10).map(s=> (
+                <tr key={`${s.route}|${s.method}|${s.status_code}`}>
+                  <td>{s.route}</td>
+                  <td>{s.method}</td>
+                  <td>{s.status_code}</td>
+                  <td>{s.requests}</td>
+                  <td>{s.latency_avg_ms}</td>
+                  <td>{s.latency_max_ms}</td>
+                </tr>
+              ))}
+            </tbody>
+          </table>
+        </div>
+      )}
+
   <table className="table" style={{width:'100%', borderCollapse:'collapse'}}>
-        <thead><tr><th>ID</th><th>Path</th><th>Method</th><th>Status</th><th>User</th><th>When</th><th/></tr></thead>
+        <thead><tr><th>ID</th><th>Path</th><th>Method</th><th>Status</th><th>Latency</th><th>User</th><th>When</th><th/></tr></thead>
         <tbody>
           {logs.map(l=> (
             <tr key={l.id}>
@@ -52,6 +79,7 @@ export default function AdminLogs(){
               <td style={{maxWidth:300, overflow:'hidden', textOverflow:'ellipsis'}}>{l.path}</td>
               <td>{l.method}</td>
               <td>{l.status_code}</td>
+              <td>{l.latency_ms != null ? `${l.latency_ms} ms` : ''}</td>
               <td>{l.user_id}</td>
               <td>{l.created_at}</td>
               <td><button className='btn ghost' onClick={()=>setSelected(l)}>Details</button></td>
@@ -34,14 +34,22 @@ function EditModal({user, onClose, onSave, onDelete}){
 export default function AdminUsers(){
   const [users, setUsers] = useState([]);
   const [editing, setEditing] = useState(null);
+  const [importReport, setImportReport] = useState(null);
+  const [search, setSearch] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
 
-  const load = ()=> adminApi.listUsers().then(r=>{
+  const PAGE_SIZE = 50;
+  // cursor — продолжение списка (кнопка "Load more"), без него список грузится заново
+  const load = (cursor)=> adminApi.listUsers({ limit: PAGE_SIZE, q: search || undefined, cursor: cursor || undefined }).then(r=>{
     const data = r.data;
-    if (Array.isArray(data)) setUsers(data);
-    else if (Array.isArray(data.data)) setUsers(data.data);
-    else setUsers([]);
-  }).catch(()=>{setUsers([])});
-  useEffect(()=>{ load(); },[]);
+    const page = Array.isArray(data) ? data : (Array.isArray(data.data) ? data.data : []);
+    setUsers(prev=> cursor ? prev.concat(page) : page);
+    setNextCursor(Array.isArray(data) ? null : (data.next_cursor ?? null));
+  }).catch(()=>{ if(!cursor) setUsers([]); setNextCursor(null); });
+  useEffect(()=>{
+    const t = setTimeout(()=>load(), 300);
+    return ()=>clearTimeout(t);
+  },[search]);
 
   const handleSave = (u)=>{
     adminApi.updateUser(u.id, { is_admin: u.is_admin, email: u.email, first_name: u.first_name, last_name: u.last_name }).then(()=>{ load(); setEditing(null); }).catch(()=>{});
@@ -52,9 +60,37 @@ export default function AdminUsers(){
     adminApi.deleteUser(id).then(()=>load()).catch(()=>{});
   }
 
+  const handleImport = (e)=>{
+    const file = e.target.files && e.target.files[0];
+    e.target.value = '';
+    if(!file) return;
+    adminApi.importUsers(file)
+      .then(r=>{ setImportReport(r.data); load(); })
+      .catch(err=>setImportReport({ error: err?.response?.data?.error || 'Import failed' }));
+  }
+
   return (
     <div className="card" style={{padding:18}}>
       <h2 style={{marginTop:0}}>Users</h2>
+      <div style={{marginBottom:12}}>
+        <input placeholder='Search by email or name' value={search} onChange={e=>setSearch(e.target.value)} style={{marginRight:8}} />
+        <label className='btn'>
+          Import CSV / NDJSON
+          <input type='file' accept='.csv,.ndjson,.jsonl' onChange={handleImport} style={{display:'none'}} />
+        </label>
+        {importReport && (
+          <div style={{marginTop:8}}>
+            {importReport.error
+              ? <b>{importReport.error}</b>
+              : <span>Created {importReport.created} of {importReport.total}, failed {importReport.failed}</span>}
+            {importReport.errors && importReport.errors.length > 0 && (
+              <ul style={{maxHeight:160, overflow:'auto'}}>
+                {importReport.errors.map(e=> <li key={e.row}>row {e.row}{e.email ? ` (${e.email})` : ''}: {e.error}</li>)}
+              </ul>
+            )}
+          </div>
+        )}
+      </div>
   <table className="table" style={{width:'100%', borderCollapse:'collapse'}}>
         <thead><tr><th>ID</th><th>Email</th><th>Name</th><th>Admin</th><th/></tr></thead>
         <tbody>
@@ -72,6 +108,11 @@ export default function AdminUsers(){
           ))}
         </tbody>
       </table>
+      {nextCursor !== null && (
+        <div style={{marginTop:12}}>
+          <button className='btn ghost' onClick={()=>load(nextCursor)}>Load more</button>
+        </div>
+      )}
 
   {editing && <EditModal user={editing} onClose={()=>setEditing(null)} onSave={handleSave} onDelete={(id)=>{ handleDelete(id); setEditing(null); }} />}
     </div>
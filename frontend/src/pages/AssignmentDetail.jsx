@@ -9,6 +9,9 @@ import ChatDrawer from "../components/ChatDrawer";
 import { aiApi } from "../api.ai";
 import { useAuth } from "../context/AuthContext";
 
+// сколько ждать результат асинхронной попытки, прежде чем сдаться
+const POLL_DEADLINE_MS = 120000;
+
 export default function AssignmentDetail() {
   const { id } = useParams();
   const [assignment, setAssignment] = useState(null);
@@ -46,7 +49,20 @@ export default function AssignmentDetail() {
   const handleRun = async () => {
     setRunLoading(true);
     try {
-      const res = await api.post(`/assignments/${id}/attempts`, { code });
+      let res = await api.post(`/assignments/${id}/attempts`, { code, async: true });
+      // асинхронная проверка: 202 + query_id, опрашиваем результат
+      if (res.status === 202 && res.data?.query_id) {
+        const url = `/assignments/${id}/attempts/${res.data.query_id}/result`;
+        // попытка могла потеряться (например, при перезапуске сервиса) — не ждём вечно
+        const deadline = Date.now() + POLL_DEADLINE_MS;
+        do {
+          if (Date.now() > deadline) {
+            throw new Error("Проверка не завершилась вовремя, попробуйте ещё раз");
+          }
+          await new Promise((r) => setTimeout(r, 500));
+          res = await api.get(url);
+        } while (res.status === 202);
+      }
       setResult(res.data);
       // refresh attempts after a run
       loadAttempts();
@@ -189,18 +205,20 @@ export default function AssignmentDetail() {
                       {!t.passed && (
                         <div style={{ marginTop: 8 }}>
                           {t.failure_reason && <div style={{ color: '#b91c1c' }}>Причина: {t.failure_reason}</div>}
-                          {t.expected_sample && (
+                          {t.missing?.length > 0 && (
                             <div style={{ marginTop: 6 }}>
-                              <div style={{ fontSize: 12, color: '#666' }}>Ожидается (пример):</div>
-                              <pre style={{ maxHeight: 120, overflow: 'auto' }}>{JSON.stringify(t.expected_sample, null, 2)}</pre>
+                              <div style={{ fontSize: 12, color: '#666' }}>
+                                Не хватает документов: {t.missing_count} (например):
+                              </div>
+                              <pre style={{ maxHeight: 120, overflow: 'auto' }}>{JSON.stringify(t.missing, null, 2)}</pre>
                             </div>
                           )}
-
-                          
-                          {t.actual_sample && (
+                          {t.extra?.length > 0 && (
                             <div style={{ marginTop: 6 }}>
-                              <div style={{ fontSize: 12, color: '#666' }}>Фактический (пример):</div>
-                              <pre style={{ maxHeight: 120, overflow: 'auto' }}>{JSON.stringify(t.actual_sample, null, 2)}</pre>
+                              <div style={{ fontSize: 12, color: '#666' }}>
+                                Лишние документы: {t.extra_count} (например):
+                              </div>
+                              <pre style={{ maxHeight: 120, overflow: 'auto' }}>{JSON.stringify(t.extra, null, 2)}</pre>
                             </div>
                           )}
                         </div>